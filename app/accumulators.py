@@ -0,0 +1,212 @@
+"""Trigger-maintained per (month, client, type) assignment counts in the invoice database.
+
+``install`` creates ``billing_accumulators`` next to ``assignments``,
+backfills it and adds INSERT/DELETE/UPDATE triggers on ``assignments`` in one
+write transaction, so no write falls between the backfill and the triggers.
+A row counts when its status is ``COMPLETED`` and it has a client, type and
+``completed_at``; updates that move a row into or out of that state, or to
+another client, type or month, move its count. Runs then read a few rows per
+client instead of every assignment (see ``SQLCompilerAgent.compile_accumulator_query``).
+
+``INSERT OR REPLACE`` into ``assignments`` only fires the delete trigger for
+the replaced row when the writer enables ``PRAGMA recursive_triggers``; use
+``check`` to find drift and ``rebuild`` to repair it.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Optional, Sequence
+
+ACCUMULATOR_TABLE = "billing_accumulators"
+TRIGGER_NAMES = (
+    "billing_accumulators_insert",
+    "billing_accumulators_delete",
+    "billing_accumulators_update",
+)
+COMPLETED = "COMPLETED"
+
+
+def _counted(ref: str) -> str:
+    return (
+        f"{ref}.status = '{COMPLETED}' AND {ref}.completed_at IS NOT NULL "
+        f"AND {ref}.client_id IS NOT NULL AND {ref}.assignment_type IS NOT NULL"
+    )
+
+
+def _key(ref: str) -> str:
+    return (
+        f"billing_month = substr({ref}.completed_at, 1, 7) "
+        f"AND client_id = {ref}.client_id AND assignment_type = {ref}.assignment_type"
+    )
+
+
+_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {ACCUMULATOR_TABLE} (
+    billing_month TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    assignment_type TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    PRIMARY KEY (billing_month, client_id, assignment_type)
+) WITHOUT ROWID
+"""
+
+_ADD = f"""
+    INSERT INTO {ACCUMULATOR_TABLE} (billing_month, client_id, assignment_type, quantity)
+    SELECT substr(NEW.completed_at, 1, 7), NEW.client_id, NEW.assignment_type, 1
+    WHERE {_counted("NEW")}
+    ON CONFLICT (billing_month, client_id, assignment_type) DO UPDATE SET quantity = quantity + 1;"""
+
+_REMOVE = f"""
+    UPDATE {ACCUMULATOR_TABLE} SET quantity = quantity - 1
+    WHERE {_key("OLD")} AND {_counted("OLD")};
+    DELETE FROM {ACCUMULATOR_TABLE} WHERE {_key("OLD")} AND quantity <= 0;"""
+
+_TRIGGER_SQL = (
+    f"""
+CREATE TRIGGER IF NOT EXISTS billing_accumulators_insert
+AFTER INSERT ON assignments WHEN {_counted("NEW")}
+BEGIN{_ADD}
+END""",
+    f"""
+CREATE TRIGGER IF NOT EXISTS billing_accumulators_delete
+AFTER DELETE ON assignments WHEN {_counted("OLD")}
+BEGIN{_REMOVE}
+END""",
+    f"""
+CREATE TRIGGER IF NOT EXISTS billing_accumulators_update
+AFTER UPDATE OF status, completed_at, client_id, assignment_type ON assignments
+WHEN ({_counted("OLD")}) OR ({_counted("NEW")})
+BEGIN{_REMOVE}{_ADD}
+END""",
+)
+
+# Counts recomputed from the raw table; used by ``rebuild`` and ``check``.
+_RAW_COUNTS_SQL = f"""
+SELECT substr(completed_at, 1, 7) AS billing_month, client_id, assignment_type,
+       COUNT(*) AS quantity
+FROM assignments
+WHERE {_counted("assignments")}{{months}}
+GROUP BY 1, 2, 3
+"""
+
+_CHECK_SQL = f"""
+WITH raw AS ({_RAW_COUNTS_SQL}),
+acc AS (SELECT billing_month, client_id, assignment_type, quantity
+        FROM {ACCUMULATOR_TABLE} WHERE 1 = 1{{months}})
+SELECT raw.billing_month, raw.client_id, raw.assignment_type, raw.quantity, acc.quantity
+FROM raw LEFT JOIN acc USING (billing_month, client_id, assignment_type)
+WHERE acc.quantity IS NOT raw.quantity
+UNION ALL
+SELECT acc.billing_month, acc.client_id, acc.assignment_type, NULL, acc.quantity
+FROM acc LEFT JOIN raw USING (billing_month, client_id, assignment_type)
+WHERE raw.quantity IS NULL
+ORDER BY 1, 2, 3
+"""
+
+
+@dataclass(frozen=True)
+class AccumulatorMismatch:
+    billing_month: str
+    client_id: str
+    assignment_type: str
+    expected: Optional[int]
+    stored: Optional[int]
+
+
+@dataclass
+class AccumulatorCheck:
+    groups_checked: int = 0
+    problems: list[str] = field(default_factory=list)
+    mismatches: list[AccumulatorMismatch] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not (self.problems or self.mismatches)
+
+
+def _months_filter(months: Optional[Sequence[str]], column: str) -> tuple[str, list[str]]:
+    if not months:
+        return "", []
+    return f" AND {column} IN ({', '.join('?' for _ in months)})", list(months)
+
+
+def accumulators_installed(conn: sqlite3.Connection) -> bool:
+    """True when the table and all three triggers exist, i.e. the counts are being maintained."""
+    names = {
+        row[0]
+        for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE (type = 'table' AND name = ?) "
+            f"OR (type = 'trigger' AND name IN ({', '.join('?' for _ in TRIGGER_NAMES)}))",
+            (ACCUMULATOR_TABLE, *TRIGGER_NAMES),
+        )
+    }
+    return names == {ACCUMULATOR_TABLE, *TRIGGER_NAMES}
+
+
+def _refill(conn: sqlite3.Connection) -> int:
+    conn.execute(f"DELETE FROM {ACCUMULATOR_TABLE}")
+    conn.execute(
+        f"INSERT INTO {ACCUMULATOR_TABLE} (billing_month, client_id, assignment_type, quantity) "
+        + _RAW_COUNTS_SQL.replace("{months}", "")
+    )
+    return conn.execute(f"SELECT COUNT(*) FROM {ACCUMULATOR_TABLE}").fetchone()[0]
+
+
+def _write(conn: sqlite3.Connection, *statements: str) -> int:
+    """Run ``statements`` and a refill in one ``BEGIN IMMEDIATE`` transaction; return the group count."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for statement in statements:
+            conn.execute(statement)
+        groups = _refill(conn)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return groups
+
+
+def install(conn: sqlite3.Connection) -> int:
+    """Create the table and triggers and backfill it; returns the number of count groups.
+
+    Safe to repeat: existing objects are kept and the counts are recomputed.
+    """
+    return _write(conn, _TABLE_SQL, *_TRIGGER_SQL)
+
+
+def rebuild(conn: sqlite3.Connection) -> int:
+    """Recompute every count from ``assignments`` while writers wait; returns the group count."""
+    if not accumulators_installed(conn):
+        raise ValueError("Billing accumulators are not installed; run install first")
+    return _write(conn)
+
+
+def drop(conn: sqlite3.Connection) -> None:
+    """Remove the triggers and the table; runs go back to reading ``assignments``."""
+    with conn:
+        for name in TRIGGER_NAMES:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"DROP TABLE IF EXISTS {ACCUMULATOR_TABLE}")
+
+
+def check(conn: sqlite3.Connection, months: Optional[Sequence[str]] = None) -> AccumulatorCheck:
+    """Compare the stored counts with counts recomputed from ``assignments``.
+
+    Both sides are read by one statement, so they come from the same snapshot.
+    ``months`` limits the comparison to those ``YYYY-MM`` months.
+    """
+    report = AccumulatorCheck()
+    if not accumulators_installed(conn):
+        report.problems.append("Billing accumulators are not installed (table or triggers missing)")
+        return report
+    raw_filter, raw_params = _months_filter(months, "substr(completed_at, 1, 7)")
+    acc_filter, acc_params = _months_filter(months, "billing_month")
+    sql = _CHECK_SQL.replace("{months}", raw_filter, 1).replace("{months}", acc_filter, 1)
+    report.mismatches = [
+        AccumulatorMismatch(*row) for row in conn.execute(sql, raw_params + acc_params)
+    ]
+    count_sql = f"SELECT COUNT(*) FROM {ACCUMULATOR_TABLE} WHERE 1 = 1{acc_filter}"
+    report.groups_checked = conn.execute(count_sql, acc_params).fetchone()[0]
+    return report
@@ -1,9 +1,33 @@
+"""Agents are imported on first attribute access so ``import app.agents`` stays cheap."""
+
+from importlib import import_module
+
 __all__ = [
     "SchemaReaderAgent",
+    "SQLDatabaseSchemaReader",
     "SQLWriterAgent",
+    "SQLCompilerAgent",
     "InvoiceBuilderAgent",
+    "InvoicePackage",
 ]
 
-from .schema_reader import SchemaReaderAgent
-from .sql_writer import SQLWriterAgent
-from .invoice_builder import InvoiceBuilderAgent
+_MODULES = {
+    "SchemaReaderAgent": ".schema_reader",
+    "SQLDatabaseSchemaReader": ".schema_reader",
+    "SQLWriterAgent": ".sql_writer",
+    "SQLCompilerAgent": ".sql_compiler",
+    "InvoiceBuilderAgent": ".invoice_builder",
+    "InvoicePackage": ".invoice_builder",
+}
+
+
+def __getattr__(name: str):
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_MODULES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(__all__)
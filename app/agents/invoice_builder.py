@@ -2,12 +2,26 @@
 
 from __future__ import annotations
 
+from collections import namedtuple
 from dataclasses import dataclass
 from datetime import datetime
-from decimal import Decimal, ROUND_HALF_UP
-from typing import Iterable
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Optional, Sequence, TypeVar, Union
 
-from app.models import AssignmentRow, Invoice, InvoiceLineItem
+from app.fixed_point import (
+    credits_to_float,
+    line_amount,
+    line_credits_hundredths,
+)
+from app.loader import AssignmentLike
+from app.metrics import RunMetrics
+from app.models import AssignmentAggregateRow, Invoice, InvoiceLineItem
+
+if TYPE_CHECKING:
+    from app.agents.vector_billing import LineTable
+
+RateRow = Union[AssignmentLike, AssignmentAggregateRow]
+ClientHeader = namedtuple("ClientHeader", ["client_id", "client_name", "currency"])
+RowT = TypeVar("RowT", bound=RateRow)
 
 
 @dataclass
@@ -15,80 +29,173 @@ class InvoicePackage:
     invoice: Invoice
 
 
+def group_by_client(rows: Iterable[RowT]) -> list[list[RowT]]:
+    """Group rows by ``client_id`` in order of first appearance."""
+    grouped: dict[str, list[RowT]] = {}
+    for row in rows:
+        grouped.setdefault(row.client_id, []).append(row)
+    return list(grouped.values())
+
+
+def iter_client_runs(rows: Iterable[RowT]) -> Iterator[list[RowT]]:
+    """Yield consecutive runs of rows sharing a ``client_id``.
+
+    Raises ``ValueError`` if a client's rows are split across runs.
+    """
+    finished: set[str] = set()
+    run: list[RowT] = []
+    for row in rows:
+        if run and row.client_id != run[0].client_id:
+            finished.add(run[0].client_id)
+            yield run
+            run = []
+        if row.client_id in finished:
+            raise ValueError(f"Rows for client {row.client_id} are not contiguous")
+        run.append(row)
+    if run:
+        yield run
+
+
 class InvoiceBuilderAgent:
-    def __init__(self) -> None:
-        self._quant = Decimal("0.01")
+    def __init__(self, metrics: Optional[RunMetrics] = None) -> None:
+        self._metrics = metrics or RunMetrics()
 
-    def build_invoices(
+    def build_aggregate_invoice(
         self,
-        assignments: Iterable[AssignmentRow],
+        aggregates: list[AssignmentAggregateRow],
         billing_month: str,
-    ) -> list[InvoicePackage]:
-        grouped: dict[str, list[AssignmentRow]] = {}
-        for row in assignments:
-            grouped.setdefault(row.client_id, []).append(row)
-
-        invoices: list[InvoicePackage] = []
-        for client_id, rows in grouped.items():
-            client_name = rows[0].client_name
-            currency = rows[0].currency
-            line_items = []
-
-            per_type: dict[str, list[AssignmentRow]] = {}
+    ) -> InvoicePackage:
+        with self._metrics.stage("build"):
+            per_type: dict[str, list[AssignmentAggregateRow]] = {}
+            for row in aggregates:
+                per_type.setdefault(row.assignment_type, []).append(row)
+
+            line_items = [
+                self._line_item(assignment_type, sum(item.quantity for item in items), items[0])
+                for assignment_type, items in per_type.items()
+            ]
+            return self._package(aggregates[0], line_items, billing_month)
+
+    def build_invoice(self, rows: list[AssignmentLike], billing_month: str) -> InvoicePackage:
+        with self._metrics.stage("build"):
+            per_type: dict[str, list[AssignmentLike]] = {}
             for row in rows:
                 per_type.setdefault(row.assignment_type, []).append(row)
 
-            for assignment_type, items in per_type.items():
-                quantity = len(items)
-                credits_override = items[0].credits_override
-                credit_value_override = items[0].credit_value_override_usd
+            line_items = [
+                self._line_item(assignment_type, len(items), items[0])
+                for assignment_type, items in per_type.items()
+            ]
+            return self._package(rows[0], line_items, billing_month)
 
-                credits_per_assignment = (
-                    Decimal(str(credits_override))
-                    if credits_override is not None
-                    else Decimal(str(items[0].default_credits))
-                )
-                unit_credit_value = (
-                    int(credit_value_override)
-                    if credit_value_override is not None
-                    else int(items[0].default_credit_value_usd)
-                )
-                line_credits = (credits_per_assignment * quantity).quantize(
-                    self._quant, rounding=ROUND_HALF_UP
-                )
-                line_amount = (
-                    (line_credits * Decimal(unit_credit_value))
-                    .quantize(Decimal("1"), rounding=ROUND_HALF_UP)
+    def build_vectorized(
+        self,
+        rows: Sequence[Sequence[Any]],
+        columns: Sequence[str],
+        months: Sequence[str],
+    ) -> Iterator[tuple[str, InvoicePackage]]:
+        """Return ``(billing_month, package)`` pairs for raw assignment rows using NumPy.
+
+        Gives the same invoices in the same order as grouping the rows by month
+        and client and calling ``build_invoice``, without per-row objects. The
+        groups are counted and priced before this returns, so
+        ``MissingRateError`` is raised here rather than while iterating.
+        """
+        from app.agents.vector_billing import vectorized_line_table
+
+        with self._metrics.stage("build"):
+            table = vectorized_line_table(rows, columns, months)
+        return self._iter_vectorized(table, rows, columns)
+
+    def _iter_vectorized(
+        self, table: LineTable, rows: Sequence[Sequence[Any]], columns: Sequence[str]
+    ) -> Iterator[tuple[str, InvoicePackage]]:
+        position = {name: index for index, name in enumerate(columns)}
+        bounds = table.invoice_starts + [len(table.quantity)]
+        for start, end in zip(bounds, bounds[1:]):
+            with self._metrics.stage("build"):
+                row = rows[table.header_row[start]]
+                header = ClientHeader(
+                    row[position["client_id"]],
+                    row[position["client_name"]],
+                    row[position["currency"]],
                 )
-
-                line_items.append(
-                    InvoiceLineItem(
-                        description=f"{assignment_type} ({quantity} completed)",
-                        assignment_type=assignment_type,
-                        quantity=quantity,
-                        credits_per_assignment=float(credits_per_assignment),
-                        line_credits=float(line_credits),
-                        unit_credit_value_usd=unit_credit_value,
-                        line_amount_usd=int(line_amount),
+                line_items = [
+                    self._make_line_item(
+                        table.assignment_type[index],
+                        table.quantity[index],
+                        table.credits_per_assignment[index],
+                        table.unit_credit_value[index],
+                        table.credits_hundredths[index],
+                        table.amount[index],
                     )
-                )
-
-            total_credits = sum(Decimal(str(item.line_credits)) for item in line_items).quantize(
-                self._quant, rounding=ROUND_HALF_UP
-            )
-            total_amount = sum(Decimal(item.line_amount_usd) for item in line_items)
-
-            invoice = Invoice(
-                invoice_id=f"{client_id}-{billing_month}",
-                client_id=client_id,
-                client_name=client_name,
-                billing_month=billing_month,
-                currency=currency,
-                line_items=line_items,
-                total_credits=float(total_credits),
-                total_amount_usd=int(total_amount),
-                generated_at=datetime.utcnow().isoformat(timespec="seconds") + "Z",
-            )
-            invoices.append(InvoicePackage(invoice=invoice))
-
-        return invoices
+                    for index in range(start, end)
+                ]
+                package = self._package(header, line_items, table.billing_month[start])
+            yield table.billing_month[start], package
+
+    def _line_item(self, assignment_type: str, quantity: int, rates: RateRow) -> InvoiceLineItem:
+        credits_per_assignment = float(
+            rates.credits_override
+            if rates.credits_override is not None
+            else rates.default_credits
+        )
+        unit_credit_value = (
+            int(rates.credit_value_override_usd)
+            if rates.credit_value_override_usd is not None
+            else int(rates.default_credit_value_usd)
+        )
+        credits_hundredths = line_credits_hundredths(credits_per_assignment, quantity)
+        return self._make_line_item(
+            assignment_type,
+            quantity,
+            credits_per_assignment,
+            unit_credit_value,
+            credits_hundredths,
+            line_amount(credits_hundredths, unit_credit_value),
+        )
+
+    @staticmethod
+    def _make_line_item(
+        assignment_type: str,
+        quantity: int,
+        credits_per_assignment: float,
+        unit_credit_value: int,
+        credits_hundredths: int,
+        amount: int,
+    ) -> InvoiceLineItem:
+        return InvoiceLineItem(
+            description=f"{assignment_type} ({quantity} completed)",
+            assignment_type=assignment_type,
+            quantity=quantity,
+            credits_per_assignment=credits_per_assignment,
+            line_credits=credits_to_float(credits_hundredths),
+            unit_credit_value_usd=unit_credit_value,
+            line_amount_usd=amount,
+            line_credits_hundredths=credits_hundredths,
+        )
+
+    def _package(
+        self,
+        client: Union[RateRow, ClientHeader],
+        line_items: list[InvoiceLineItem],
+        billing_month: str,
+    ) -> InvoicePackage:
+        total_credits = sum(item.credits_hundredths for item in line_items)
+        total_amount = sum(item.line_amount_usd for item in line_items)
+
+        invoice = Invoice(
+            invoice_id=f"{client.client_id}-{billing_month}",
+            client_id=client.client_id,
+            client_name=client.client_name,
+            billing_month=billing_month,
+            currency=client.currency,
+            line_items=line_items,
+            total_credits=credits_to_float(total_credits),
+            total_amount_usd=total_amount,
+            generated_at=datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            total_credits_hundredths=total_credits,
+        )
+        self._metrics.incr("invoices_built")
+        self._metrics.incr("line_items", len(line_items))
+        return InvoicePackage(invoice=invoice)
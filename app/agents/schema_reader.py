@@ -2,22 +2,213 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Optional
 
-from langchain_community.utilities import SQLDatabase
+from app.db import readonly_uri
+from app.metrics import RunMetrics
+from app.models import AssignmentAggregateRow, AssignmentRow
+
+# Tables the billing query is built from; pruning starts from these.
+CORE_TABLES = ("assignments", "clients", "assignment_types", "client_assignment_overrides")
+# Column names the output contract (AssignmentRow / AssignmentAggregateRow) needs.
+CONTRACT_COLUMNS = frozenset(AssignmentRow.model_fields) | frozenset(
+    AssignmentAggregateRow.model_fields
+)
 
 
 @dataclass
 class SchemaInfo:
     table_names: list[str]
     schema_text: str
+    columns: dict[str, list[str]] = field(default_factory=dict)
+    # Full schema text when ``schema_text`` was pruned for the prompt, else "".
+    unpruned_text: str = ""
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
 
 
 class SchemaReaderAgent:
-    def __init__(self, db_path: str) -> None:
-        self._db = SQLDatabase.from_uri(f"sqlite:///{db_path}")
+    """Describe the schema from ``sqlite_master`` and PRAGMAs on an open connection.
+
+    The text mirrors LangChain's ``SQLDatabase.get_table_info`` layout so prompts
+    stay the same, but no engine is created and no reflection is performed.
+    Sample rows are only queried when ``sample_rows`` is positive.
+    """
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        sample_rows: int = 0,
+        metrics: Optional[RunMetrics] = None,
+        prune: bool = False,
+    ) -> None:
+        self._conn = conn
+        self._sample_rows = sample_rows
+        self._metrics = metrics or RunMetrics()
+        self._prune = prune
+
+    def read_schema(self) -> SchemaInfo:
+        with self._metrics.stage("schema_read"):
+            table_names = [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT name FROM sqlite_master "
+                    "WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+                )
+            ]
+            table_columns = {
+                name: self._conn.execute(f"PRAGMA table_info({_quote(name)})").fetchall()
+                for name in table_names
+            }
+            foreign_keys = {
+                name: self._conn.execute(f"PRAGMA foreign_key_list({_quote(name)})").fetchall()
+                for name in table_names
+            }
+            schema_text = "\n\n".join(
+                self._table_info(name, table_columns[name], foreign_keys[name])
+                for name in table_names
+            )
+            unpruned_text = ""
+            if self._prune:
+                pruned_text, kept = self._pruned_text(table_names, table_columns, foreign_keys)
+                if pruned_text:
+                    unpruned_text, schema_text = schema_text, pruned_text
+                    self._metrics.incr("schema_tables_pruned", len(table_names) - kept)
+        self._metrics.incr("schema_tables", len(table_names))
+        return SchemaInfo(
+            table_names=table_names,
+            schema_text=schema_text,
+            columns={
+                name: [column[1] for column in columns]
+                for name, columns in table_columns.items()
+            },
+            unpruned_text=unpruned_text,
+        )
+
+    def _pruned_text(
+        self,
+        table_names: list[str],
+        table_columns: dict[str, list[sqlite3.Row]],
+        foreign_keys: dict[str, list[sqlite3.Row]],
+    ) -> tuple[str, int]:
+        """Schema text for the core tables and the tables they reference, without samples.
+
+        Columns are cut to the output contract plus primary and foreign keys. If
+        a contract column is then missing (e.g. it was renamed), every column of
+        the kept tables stays so the planner can still map it. Returns the text
+        and the number of kept tables, or ("", 0) when no core table exists.
+        """
+        kept = [name for name in CORE_TABLES if name in table_columns]
+        queue = list(kept)
+        while queue:
+            for fk in foreign_keys[queue.pop()]:
+                if fk[2] in table_columns and fk[2] not in kept:
+                    kept.append(fk[2])
+                    queue.append(fk[2])
+        if not kept:
+            return "", 0
+        kept.sort(key=table_names.index)
+
+        key_columns: dict[str, set[str]] = {name: set() for name in kept}
+        for name in kept:
+            key_columns[name].update(column[1] for column in table_columns[name] if column[5])
+            for fk in foreign_keys[name]:
+                key_columns[name].add(fk[3])
+                if fk[2] in key_columns and fk[4]:
+                    key_columns[fk[2]].add(fk[4])
+        columns = {
+            name: [
+                column
+                for column in table_columns[name]
+                if column[1] in CONTRACT_COLUMNS or column[1] in key_columns[name]
+            ]
+            for name in kept
+        }
+        found = {column[1] for name in kept for column in columns[name]}
+        # billing_month and quantity are computed by the query, not stored.
+        needed = CONTRACT_COLUMNS - {"billing_month", "quantity"}
+        if "client_assignment_overrides" not in kept:
+            needed -= {"credits_override", "credit_value_override_usd"}
+        if needed - found:
+            columns = {name: table_columns[name] for name in kept}
+        text = "\n\n".join(
+            self._table_info(name, columns[name], foreign_keys[name], sample=False)
+            for name in kept
+        )
+        return text, len(kept)
+
+    def _table_info(
+        self,
+        table_name: str,
+        columns: list[sqlite3.Row],
+        foreign_key_rows: list[sqlite3.Row],
+        sample: bool = True,
+    ) -> str:
+        parts = []
+        for column in columns:
+            definition = f"{column[1]} {column[2]}".rstrip()
+            if column[3]:
+                definition += " NOT NULL"
+            parts.append(definition)
+
+        primary_key = [column[1] for column in sorted(columns, key=lambda c: c[5]) if column[5]]
+        if primary_key:
+            parts.append(f"PRIMARY KEY ({', '.join(primary_key)})")
+
+        foreign_keys: dict[int, list[sqlite3.Row]] = {}
+        for fk in foreign_key_rows:
+            foreign_keys.setdefault(fk[0], []).append(fk)
+        # PRAGMA foreign_key_list numbers constraints in reverse declaration order.
+        for fk_id in sorted(foreign_keys, reverse=True):
+            fk_rows = foreign_keys[fk_id]
+            fk_rows.sort(key=lambda fk: fk[1])
+            local = ", ".join(fk[3] for fk in fk_rows)
+            remote = ", ".join(fk[4] or "" for fk in fk_rows)
+            parts.append(f"FOREIGN KEY({local}) REFERENCES {fk_rows[0][2]} ({remote})")
+
+        info = f"\nCREATE TABLE {table_name} (\n\t" + ", \n\t".join(parts) + "\n)"
+        if sample and self._sample_rows > 0:
+            info += "\n\n/*\n" + self._sample_rows_text(table_name, columns) + "*/"
+        return info
+
+    def _sample_rows_text(self, table_name: str, columns: list[sqlite3.Row]) -> str:
+        column_names = [column[1] for column in columns]
+        rows = self._conn.execute(
+            f"SELECT * FROM {_quote(table_name)} LIMIT ?",
+            (self._sample_rows,),
+        ).fetchall()
+        lines = ["\t".join(column_names)]
+        lines.extend("\t".join(str(value)[:100] for value in row) for row in rows)
+        return (
+            f"{self._sample_rows} rows from {table_name} table:\n" + "\n".join(lines) + "\n"
+        )
+
+
+class SQLDatabaseSchemaReader:
+    """Legacy reader backed by LangChain's ``SQLDatabase`` (SQLAlchemy reflection)."""
+
+    def __init__(self, db_path: str, metrics: Optional[RunMetrics] = None) -> None:
+        from langchain_community.utilities import SQLDatabase
+
+        self._metrics = metrics or RunMetrics()
+        with self._metrics.stage("schema_read"):
+            self._db = SQLDatabase.from_uri(f"sqlite:///{readonly_uri(db_path)}&uri=true")
 
     def read_schema(self) -> SchemaInfo:
-        table_names = list(self._db.get_usable_table_names())
-        schema_text = self._db.get_table_info(table_names)
-        return SchemaInfo(table_names=table_names, schema_text=schema_text)
+        with self._metrics.stage("schema_read"):
+            table_names = list(self._db.get_usable_table_names())
+            schema_text = self._db.get_table_info(table_names)
+            columns = {
+                name: [column["name"] for column in self._db._inspector.get_columns(name)]
+                for name in table_names
+            }
+        self._metrics.incr("schema_tables", len(table_names))
+        return SchemaInfo(table_names=table_names, schema_text=schema_text, columns=columns)
+
+    def close(self) -> None:
+        """Dispose of the SQLAlchemy engine and its pooled connections."""
+        self._db._engine.dispose()
@@ -0,0 +1,127 @@
+"""Compile the month query for the known billing schema without calling the LLM."""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from app.accumulators import ACCUMULATOR_TABLE
+from app.agents.schema_reader import SchemaInfo
+from app.agents.sql_writer import AGGREGATE_MODE, ROWS_MODE, SQLQueryPlan
+from app.metrics import RunMetrics
+
+# Columns the canonical query reads; a schema is recognized when every table has them.
+REQUIRED_COLUMNS = {
+    "clients": {"client_id", "client_name", "billing_email", "default_credit_value_usd", "currency"},
+    "assignment_types": {"assignment_type", "default_credits"},
+    "assignments": {"assignment_id", "client_id", "assignment_type", "completed_at", "status"},
+}
+OVERRIDE_COLUMNS = {
+    "client_assignment_overrides": {
+        "client_id",
+        "assignment_type",
+        "credits_override",
+        "credit_value_override_usd",
+    },
+}
+
+_SELECT = {
+    ROWS_MODE: """\
+SELECT a.assignment_id, a.client_id, c.client_name, c.billing_email, a.assignment_type,
+       a.completed_at, a.status, t.default_credits, c.default_credit_value_usd, c.currency,
+       {overrides}""",
+    AGGREGATE_MODE: """\
+SELECT substr(a.completed_at, 1, 7) AS billing_month, a.client_id, c.client_name, c.currency,
+       a.assignment_type, COUNT(*) AS quantity, t.default_credits, c.default_credit_value_usd,
+       {overrides}""",
+}
+
+_FROM = """
+FROM assignments a
+JOIN clients c ON c.client_id = a.client_id
+JOIN assignment_types t ON t.assignment_type = a.assignment_type"""
+
+_OVERRIDES_JOIN = """
+LEFT JOIN client_assignment_overrides o
+  ON o.client_id = a.client_id AND o.assignment_type = a.assignment_type"""
+
+_WHERE = """
+WHERE a.status = 'COMPLETED' AND a.completed_at >= :month_start AND a.completed_at < :month_end"""
+
+_GROUP_BY = """
+GROUP BY billing_month, a.client_id, a.assignment_type"""
+
+_ACCUMULATOR_SQL = f"""\
+SELECT acc.billing_month, acc.client_id, c.client_name, c.currency,
+       acc.assignment_type, acc.quantity, t.default_credits, c.default_credit_value_usd,
+       {{overrides}}
+FROM {ACCUMULATOR_TABLE} acc
+JOIN clients c ON c.client_id = acc.client_id
+JOIN assignment_types t ON t.assignment_type = acc.assignment_type{{overrides_join}}
+WHERE acc.billing_month >= substr(:month_start, 1, 7)
+  AND acc.billing_month < substr(:month_end, 1, 7)
+ORDER BY acc.billing_month, acc.client_id, acc.assignment_type"""
+
+_ACCUMULATOR_OVERRIDES_JOIN = """
+LEFT JOIN client_assignment_overrides o
+  ON o.client_id = acc.client_id AND o.assignment_type = acc.assignment_type"""
+
+
+def _has_columns(schema: SchemaInfo, required: dict[str, set[str]]) -> bool:
+    return all(columns <= set(schema.columns.get(table, ())) for table, columns in required.items())
+
+
+def _override_columns(include_overrides: bool) -> str:
+    if include_overrides:
+        return "o.credits_override, o.credit_value_override_usd"
+    return "NULL AS credits_override, NULL AS credit_value_override_usd"
+
+
+class SQLCompilerAgent:
+    """Emit the canonical parameterized SELECT when the schema has the expected shape.
+
+    Returns ``None`` for unfamiliar schemas so the caller can fall back to the
+    LLM. An override table that exists but lacks the expected columns also
+    counts as unfamiliar.
+    """
+
+    def __init__(self, metrics: Optional[RunMetrics] = None) -> None:
+        self._metrics = metrics or RunMetrics()
+
+    def compile_query(self, schema: SchemaInfo, mode: str = ROWS_MODE) -> Optional[SQLQueryPlan]:
+        if mode not in _SELECT:
+            raise ValueError(f"Unknown query mode: {mode}")
+        with self._metrics.stage("compile"):
+            if not _has_columns(schema, REQUIRED_COLUMNS):
+                return None
+            include_overrides = "client_assignment_overrides" in schema.table_names
+            if include_overrides and not _has_columns(schema, OVERRIDE_COLUMNS):
+                return None
+            overrides = _override_columns(include_overrides)
+            sql = _SELECT[mode].format(overrides=overrides) + _FROM
+            if include_overrides:
+                sql += _OVERRIDES_JOIN
+            sql += _WHERE
+            if mode == AGGREGATE_MODE:
+                sql += _GROUP_BY
+        notes = "compiled for the known schema" + (
+            " with client_assignment_overrides" if include_overrides else ""
+        )
+        return SQLQueryPlan(sql=sql, notes=notes)
+
+    def compile_accumulator_query(self, schema: SchemaInfo) -> Optional[SQLQueryPlan]:
+        """Aggregate-mode SELECT over ``billing_accumulators`` for the known schema.
+
+        Returns rows shaped like ``AssignmentAggregateRow`` in month, client and
+        type order, from the trigger-maintained counts instead of ``assignments``.
+        """
+        with self._metrics.stage("compile"):
+            if not _has_columns(schema, REQUIRED_COLUMNS):
+                return None
+            include_overrides = "client_assignment_overrides" in schema.table_names
+            if include_overrides and not _has_columns(schema, OVERRIDE_COLUMNS):
+                return None
+            sql = _ACCUMULATOR_SQL.format(
+                overrides=_override_columns(include_overrides),
+                overrides_join=_ACCUMULATOR_OVERRIDES_JOIN if include_overrides else "",
+            )
+        return SQLQueryPlan(sql=sql, notes="compiled for the billing accumulators")
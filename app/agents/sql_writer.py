@@ -2,14 +2,61 @@
 
 from __future__ import annotations
 
+import asyncio
 import os
 from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Optional
 
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, ConfigDict, Field
 
+from app.metrics import RunMetrics
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+# Bump whenever the prompt or its output contract changes so cached plans are invalidated.
+PROMPT_VERSION = "2"
+
+ROWS_MODE = "rows"
+AGGREGATE_MODE = "aggregate"
+
+_PROMPT_TEMPLATE = """
+You are a SQL analyst for SQLite. Use the schema to write a single SELECT statement.
+Return JSON that matches the provided schema instructions.
+
+Schema:
+{schema_text}
+
+Task:
+{task}
+- Join clients and assignment_types.
+- If client_assignment_overrides exists, LEFT JOIN it on client_id + assignment_type and use its columns.
+- If client_assignment_overrides does not exist, return NULL for credits_override and credit_value_override_usd.
+- Only SELECT. No semicolons.
+
+Format instructions:
+{format_instructions}
+"""
+
+_TASKS = {
+    ROWS_MODE: """\
+- Select assignments with status = 'COMPLETED' and completed_at >= :month_start and < :month_end.
+- Return one row per assignment (no aggregation).
+- Always include these columns with exact aliases:
+  assignment_id, client_id, client_name, billing_email, assignment_type,
+  completed_at, status, default_credits, default_credit_value_usd, currency,
+  credits_override, credit_value_override_usd.""",
+    AGGREGATE_MODE: """\
+- Count assignments with status = 'COMPLETED' and completed_at >= :month_start and < :month_end.
+- Return one row per billing month, client and assignment type, with
+  substr(completed_at, 1, 7) AS billing_month and COUNT(*) AS quantity;
+  GROUP BY billing_month, client_id and assignment_type.
+- Always include these columns with exact aliases:
+  billing_month, client_id, client_name, currency, assignment_type, quantity,
+  default_credits, default_credit_value_usd, credits_override, credit_value_override_usd.""",
+}
+
 
 class SQLQueryOutput(BaseModel):
     model_config = ConfigDict(extra="forbid")
@@ -24,47 +71,149 @@ class SQLQueryPlan:
     notes: str
 
 
+@dataclass(frozen=True)
+class LLMCallPolicy:
+    """Timeout, retry and hedging settings for async planning calls."""
+
+    timeout_s: float = 60.0
+    retries: int = 2
+    backoff_s: float = 1.0
+    hedge_after_s: Optional[float] = None
+
+
+@lru_cache(maxsize=8)
+def _encoding(model_name: str) -> Any:
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model_name: str = "") -> int:
+    """Tokens in ``text`` via tiktoken, or about four characters per token without it."""
+    try:
+        return len(_encoding(model_name).encode(text))
+    except Exception:
+        return len(text) // 4 + 1
+
+
 class SQLWriterAgent:
-    def __init__(self, model_name: str, api_key: str) -> None:
+    def __init__(
+        self,
+        model_name: str,
+        api_key: str,
+        llm: Optional[BaseChatModel] = None,
+        metrics: Optional[RunMetrics] = None,
+    ) -> None:
+        """``llm`` replaces the OpenAI chat model, e.g. with a fake model in benchmarks.
+
+        LangChain is imported here rather than at module load, so runs that never
+        reach the LLM (compiled or cached plans) do not pay for it.
+        """
+        from langchain_core.output_parsers import PydanticOutputParser
+
+        if llm is None:
+            if not api_key:
+                raise RuntimeError("OPENAI_API_KEY is required to plan queries for this schema")
+            from langchain_openai import ChatOpenAI
+
+            llm = ChatOpenAI(model=model_name, api_key=api_key, temperature=0)
         self._parser = PydanticOutputParser(pydantic_object=SQLQueryOutput)
-        self._llm = ChatOpenAI(model=model_name, api_key=api_key, temperature=0)
+        self._llm = llm
+        self._metrics = metrics or RunMetrics()
+        self._model_name = model_name
 
-    def generate_query(
+    async def agenerate_query(
         self,
         schema_text: str,
         month_start: str,
         month_end: str,
         include_overrides: bool,
+        mode: str = ROWS_MODE,
+        policy: Optional[LLMCallPolicy] = None,
     ) -> SQLQueryPlan:
-        template = """
-You are a SQL analyst for SQLite. Use the schema to write a single SELECT statement.
-Return JSON that matches the provided schema instructions.
+        """Ask the LLM for the month query with a timeout, bounded retries and optional hedging.
 
-Schema:
-{schema_text}
+        ``mode="aggregate"`` requests per-client/type counts instead of rows.
 
-Task:
-- Select assignments with status = 'COMPLETED' and completed_at >= :month_start and < :month_end.
-- Return one row per assignment (no aggregation).
-- Always include these columns with exact aliases:
-  assignment_id, client_id, client_name, billing_email, assignment_type,
-  completed_at, status, default_credits, default_credit_value_usd, currency,
-  credits_override, credit_value_override_usd.
-- Join clients and assignment_types.
-- If client_assignment_overrides exists, LEFT JOIN it on client_id + assignment_type and use its columns.
-- If client_assignment_overrides does not exist, return NULL for credits_override and credit_value_override_usd.
-- Only SELECT. No semicolons.
+        Each attempt (model call plus parsing and validation) is limited to
+        ``policy.timeout_s``; failed attempts are retried with exponential
+        backoff. With ``policy.hedge_after_s`` a duplicate request is sent when
+        the first has not answered in time, and the first answer wins.
+        """
+        policy = policy or LLMCallPolicy()
+        message = self._build_message(schema_text, mode)
+        for attempt in range(policy.retries + 1):
+            try:
+                with self._metrics.stage("llm"):
+                    return await asyncio.wait_for(
+                        self._hedged_attempt(message, include_overrides, mode, policy),
+                        timeout=policy.timeout_s,
+                    )
+            except Exception:
+                if attempt == policy.retries:
+                    raise
+                self._metrics.incr("llm_retries")
+                await asyncio.sleep(policy.backoff_s * (2**attempt))
+        raise AssertionError("unreachable")
 
-Format instructions:
-{format_instructions}
-"""
-        prompt = ChatPromptTemplate.from_template(template)
-        message = prompt.format(
+    async def _hedged_attempt(
+        self,
+        message: str,
+        include_overrides: bool,
+        mode: str,
+        policy: LLMCallPolicy,
+    ) -> SQLQueryPlan:
+        async def attempt() -> SQLQueryPlan:
+            response = await self._llm.ainvoke(message)
+            self._record_usage(response)
+            return self._parse_plan(response.content, include_overrides, mode)
+
+        first = asyncio.ensure_future(attempt())
+        tasks = {first}
+        # Cancelled by the caller's timeout at any await below: stop every request.
+        try:
+            if policy.hedge_after_s is None:
+                return await first
+            done, _ = await asyncio.wait(tasks, timeout=policy.hedge_after_s)
+            if done:
+                return first.result()
+
+            self._metrics.incr("llm_hedged_requests")
+            tasks.add(asyncio.ensure_future(attempt()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    if not pending:
+                        raise task.exception()  # type: ignore[misc]
+            raise AssertionError("unreachable")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def prompt_tokens(self, schema_text: str, mode: str = ROWS_MODE) -> int:
+        """Token count of the planning prompt for ``schema_text``."""
+        return count_tokens(self._build_message(schema_text, mode), self._model_name)
+
+    def _build_message(self, schema_text: str, mode: str) -> str:
+        if mode not in _TASKS:
+            raise ValueError(f"Unknown query mode: {mode}")
+        from langchain_core.prompts import ChatPromptTemplate
+
+        prompt = ChatPromptTemplate.from_template(_PROMPT_TEMPLATE)
+        return prompt.format(
             schema_text=schema_text,
+            task=_TASKS[mode],
             format_instructions=self._parser.get_format_instructions(),
         )
-        response = self._llm.invoke(message)
-        parsed = self._parser.parse(response.content)
+
+    def _parse_plan(self, content: str, include_overrides: bool, mode: str) -> SQLQueryPlan:
+        parsed = self._parser.parse(content)
         if os.getenv("SQL_DEBUG") == "1":
             print("LLM parsed.sql:\n" + parsed.sql)
         sql = self._normalize_sql(parsed.sql)
@@ -72,8 +221,17 @@ Format instructions:
             raise ValueError("SQL must use :month_start and :month_end parameters")
         if include_overrides and "client_assignment_overrides" not in sql:
             raise ValueError("SQL must reference client_assignment_overrides when available")
+        if mode == AGGREGATE_MODE and "group by" not in sql.lower():
+            raise ValueError("Aggregate SQL must GROUP BY billing month, client and assignment type")
         return SQLQueryPlan(sql=sql, notes=parsed.notes)
 
+    def _record_usage(self, response: object) -> None:
+        self._metrics.incr("llm_calls")
+        usage = getattr(response, "usage_metadata", None) or {}
+        for key in ("input_tokens", "output_tokens", "total_tokens"):
+            if key in usage:
+                self._metrics.incr(f"llm_{key}", usage[key])
+
     @staticmethod
     def _normalize_sql(sql: str) -> str:
         normalized = sql.strip()
@@ -0,0 +1,148 @@
+"""Vectorized grouping and billing arithmetic for large months (requires NumPy).
+
+Only the key columns are read from every row: ``client_id``,
+``assignment_type`` and month are factorized to integer codes, counted per (month, client, type) with ``np.unique``
+and ordered exactly as the pure-Python builder orders them (months ascending,
+clients and types by first appearance). Rates come from each group's first
+row, as in the Python builder, and line credits and amounts are computed in
+one integer batch with the same half-up rounding as ``app.fixed_point``.
+A group whose rates are NULL raises ``MissingRateError`` before anything is
+priced, so the caller can hand the rows to the per-row builder instead.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Iterable, Sequence
+
+import numpy as np
+
+from app.fixed_point import CREDIT_SCALE, line_amount, line_credits_hundredths, rate_fraction
+
+# Keep integer products well inside int64; larger inputs use Python integers.
+_INT64_SAFE = 2**62
+
+
+class MissingRateError(ValueError):
+    """A group's first row has no credits or credit value (NULL default and override)."""
+
+
+@dataclass
+class LineTable:
+    """Line items in output order; ``invoice_starts`` indexes the first line of each invoice."""
+
+    billing_month: list[str]
+    header_row: list[int]
+    assignment_type: list[str]
+    quantity: list[int]
+    credits_per_assignment: list[float]
+    unit_credit_value: list[int]
+    credits_hundredths: list[int]
+    amount: list[int]
+    invoice_starts: list[int]
+
+
+def _half_up(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    magnitude = (2 * np.abs(numerator) + denominator) // (2 * denominator)
+    return np.where(numerator < 0, -magnitude, magnitude)
+
+
+def _factorize(values: Iterable[Any], count: int) -> np.ndarray:
+    codes: dict[Any, int] = {}
+    return np.fromiter(
+        (codes.setdefault(value, len(codes)) for value in values), dtype=np.int64, count=count
+    )
+
+
+def vectorized_line_table(
+    rows: Sequence[Sequence[Any]], columns: Sequence[str], months: Sequence[str]
+) -> LineTable:
+    """Count and price every (month, client, type) group of assignment ``rows``."""
+    position = {name: index for index, name in enumerate(columns)}
+    month_index = {month: index for index, month in enumerate(months)}
+    completed_at = position["completed_at"]
+    month_codes = np.fromiter(
+        (month_index.get(row[completed_at][:7], -1) for row in rows),
+        dtype=np.int64,
+        count=len(rows),
+    )
+    keep = np.flatnonzero(month_codes >= 0)
+    if keep.size == 0:
+        return LineTable([], [], [], [], [], [], [], [], [])
+    kept_rows = [rows[index] for index in keep.tolist()]
+    client_id, assignment_type = position["client_id"], position["assignment_type"]
+    client_codes = _factorize((row[client_id] for row in kept_rows), len(kept_rows))
+    type_codes = _factorize((row[assignment_type] for row in kept_rows), len(kept_rows))
+    client_count = int(client_codes.max()) + 1
+    type_count = int(type_codes.max()) + 1
+    month_codes = month_codes[keep]
+
+    client_key = month_codes * client_count + client_codes
+    group_key = client_key * type_count + type_codes
+    _, group_first, quantity = np.unique(group_key, return_index=True, return_counts=True)
+    # A client's position within its month is the first row of any of its groups.
+    _, client_first, client_inverse = np.unique(
+        client_key, return_index=True, return_inverse=True
+    )
+    group_client_first = client_first[client_inverse[group_first]]
+    order = np.lexsort((group_first, group_client_first, month_codes[group_first]))
+    first_rows = keep[group_first[order]].tolist()
+    header_rows = keep[group_client_first[order]].tolist()
+    quantity = quantity[order].astype(np.int64)
+
+    def column(name: str) -> np.ndarray:
+        index = position[name]
+        return np.array([rows[row][index] for row in first_rows], dtype=float)
+
+    credits_override = column("credits_override")
+    default_credits = column("default_credits")
+    credits = np.where(np.isnan(credits_override), default_credits, credits_override)
+    value_override = column("credit_value_override_usd")
+    default_value = column("default_credit_value_usd")
+    unit_float = np.where(np.isnan(value_override), default_value, value_override)
+    missing = np.flatnonzero(np.isnan(credits) | np.isnan(unit_float))
+    if missing.size:
+        row = rows[first_rows[int(missing[0])]]
+        raise MissingRateError(
+            f"No credits or credit value for client {row[client_id]}, "
+            f"type {row[assignment_type]} ({missing.size} groups)"
+        )
+    unit_value = unit_float.astype(np.int64)
+
+    rates, rate_inverse = np.unique(credits, return_inverse=True)
+    fractions = [rate_fraction(float(rate)) for rate in rates.tolist()]
+    numerator = np.array([fraction[0] for fraction in fractions], dtype=object)[rate_inverse]
+    denominator = np.array([fraction[1] for fraction in fractions], dtype=object)[rate_inverse]
+
+    credits_list = credits.tolist()
+    quantity_list = quantity.tolist()
+    unit_list = unit_value.tolist()
+    max_numerator = max(abs(int(value)) for value in numerator)
+    max_quantity = int(quantity.max())
+    max_unit = int(np.abs(unit_value).max())
+    if max_numerator * max_quantity * CREDIT_SCALE * max(max_unit, 1) < _INT64_SAFE:
+        hundredths = _half_up(
+            numerator.astype(np.int64) * quantity * CREDIT_SCALE, denominator.astype(np.int64)
+        )
+        amount = _half_up(hundredths * unit_value, np.full_like(hundredths, CREDIT_SCALE))
+        hundredths_list = hundredths.tolist()
+        amount_list = amount.tolist()
+    else:
+        hundredths_list = [
+            line_credits_hundredths(rate, count) for rate, count in zip(credits_list, quantity_list)
+        ]
+        amount_list = [line_amount(value, unit) for value, unit in zip(hundredths_list, unit_list)]
+
+    ordered_client_key = client_key[group_first[order]]
+    starts = np.flatnonzero(np.r_[True, ordered_client_key[1:] != ordered_client_key[:-1]])
+    return LineTable(
+        billing_month=[months[code] for code in month_codes[group_first[order]].tolist()],
+        header_row=header_rows,
+        assignment_type=[rows[row][assignment_type] for row in first_rows],
+        quantity=quantity_list,
+        credits_per_assignment=credits_list,
+        unit_credit_value=unit_list,
+        credits_hundredths=hundredths_list,
+        amount=amount_list,
+        invoice_starts=starts.tolist(),
+    )
@@ -0,0 +1,161 @@
+"""Consolidated month archives: one JSONL file and one zip of HTML per month, plus an index.
+
+Layout under the output root::
+
+    archives/{YYYY-MM}/index.json
+    archives/{YYYY-MM}/invoices-{generation}.jsonl
+    archives/{YYYY-MM}/invoices-{generation}.html.zip
+
+``index.json`` maps each client to the byte offset and length of its JSON line
+and the name of its HTML member, so one invoice can be read without unpacking
+the rest. Data files are written under temporary names and renamed; the index
+is replaced last, so readers going through it never see a partial archive.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import uuid
+import zipfile
+from typing import IO, Iterable, Optional
+
+from app.models import Invoice
+
+ARCHIVE_DIR = "archives"
+INDEX_NAME = "index.json"
+ARCHIVE_VERSION = 1
+
+
+def archive_dir(output_root: str, billing_month: str) -> str:
+    return os.path.join(output_root, ARCHIVE_DIR, billing_month)
+
+
+def _read_index(directory: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(directory, INDEX_NAME), encoding="utf-8") as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return None
+
+
+class _MonthArchive:
+    def __init__(self, directory: str, billing_month: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.billing_month = billing_month
+        generation = uuid.uuid4().hex[:12]
+        self.jsonl_name = f"invoices-{generation}.jsonl"
+        self.zip_name = f"invoices-{generation}.html.zip"
+        self._jsonl_temp = os.path.join(directory, f".{self.jsonl_name}.tmp")
+        self._zip_temp = os.path.join(directory, f".{self.zip_name}.tmp")
+        self._index_temp = os.path.join(directory, f".index-{generation}.json.tmp")
+        self._jsonl: IO[bytes] = open(self._jsonl_temp, "wb")
+        self._zip = zipfile.ZipFile(self._zip_temp, "w", compression=zipfile.ZIP_DEFLATED)
+        self._offset = 0
+        self.entries: dict[str, dict] = {}
+
+    def add(self, client_id: str, json_text: str, html_text: str) -> int:
+        if client_id in self.entries:
+            raise ValueError(f"Duplicate invoice for {client_id} in {self.billing_month}")
+        line = json_text.encode("utf-8") + b"\n"
+        html = html_text.encode("utf-8")
+        member = f"{client_id}.html"
+        self._jsonl.write(line)
+        self._zip.writestr(member, html)
+        self.entries[client_id] = {"offset": self._offset, "length": len(line), "html": member}
+        self._offset += len(line)
+        return len(line) + len(html)
+
+    def publish(self) -> str:
+        self._jsonl.flush()
+        os.fsync(self._jsonl.fileno())
+        self._jsonl.close()
+        self._zip.close()
+        previous = _read_index(self.directory)
+        os.replace(self._jsonl_temp, os.path.join(self.directory, self.jsonl_name))
+        os.replace(self._zip_temp, os.path.join(self.directory, self.zip_name))
+
+        index = {
+            "version": ARCHIVE_VERSION,
+            "billing_month": self.billing_month,
+            "jsonl": self.jsonl_name,
+            "html_zip": self.zip_name,
+            "invoices": self.entries,
+        }
+        index_path = os.path.join(self.directory, INDEX_NAME)
+        with open(self._index_temp, "w", encoding="utf-8") as index_file:
+            json.dump(index, index_file, indent=2, sort_keys=True)
+        os.replace(self._index_temp, index_path)
+
+        if previous is not None:
+            for name in (previous.get("jsonl"), previous.get("html_zip")):
+                if name and name not in (self.jsonl_name, self.zip_name):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except FileNotFoundError:
+                        pass
+        return index_path
+
+    def discard(self) -> None:
+        self._jsonl.close()
+        self._zip.close()
+        for path in (self._jsonl_temp, self._zip_temp):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class ArchiveWriter:
+    """Collect invoices into per-month archives and publish them on ``commit``.
+
+    Every month in ``months`` gets an archive even when it has no invoices, so
+    a re-run replaces stale data. Nothing is visible until ``commit``; ``abort``
+    removes the temporary files.
+    """
+
+    def __init__(self, output_root: str, months: Iterable[str] = ()) -> None:
+        self._output_root = output_root
+        self._archives: dict[str, _MonthArchive] = {}
+        for month in months:
+            self._archive(month)
+
+    def _archive(self, billing_month: str) -> _MonthArchive:
+        archive = self._archives.get(billing_month)
+        if archive is None:
+            archive = _MonthArchive(archive_dir(self._output_root, billing_month), billing_month)
+            self._archives[billing_month] = archive
+        return archive
+
+    def add(self, invoice: Invoice, json_text: str, html_text: str) -> int:
+        """Append one rendered invoice and return the number of bytes added."""
+        return self._archive(invoice.billing_month).add(invoice.client_id, json_text, html_text)
+
+    def commit(self) -> list[str]:
+        """Publish every month archive and return the index paths."""
+        index_paths = [archive.publish() for archive in self._archives.values()]
+        self._archives.clear()
+        return index_paths
+
+    def abort(self) -> None:
+        for archive in self._archives.values():
+            archive.discard()
+        self._archives.clear()
+
+
+def read_archived_invoice(
+    output_root: str, billing_month: str, client_id: str
+) -> tuple[Invoice, str]:
+    """Return one client's invoice and HTML from a month archive without reading the rest."""
+    directory = archive_dir(output_root, billing_month)
+    index = _read_index(directory)
+    if index is None:
+        raise FileNotFoundError(f"No archive for {billing_month} in {output_root}")
+    entry = index["invoices"].get(client_id)
+    if entry is None:
+        raise KeyError(f"No invoice for {client_id} in the {billing_month} archive")
+    with open(os.path.join(directory, index["jsonl"]), "rb") as handle:
+        handle.seek(entry["offset"])
+        invoice = Invoice.model_validate_json(handle.read(entry["length"]))
+    with zipfile.ZipFile(os.path.join(directory, index["html_zip"])) as archive:
+        html = archive.read(entry["html"]).decode("utf-8")
+    return invoice, html
@@ -1,15 +1,638 @@
 from __future__ import annotations
 
 import argparse
+import json
+import os
+import sys
+from typing import TYPE_CHECKING, Optional
 
-from app.invoice import run
+from app.config import load_settings
+from app.metrics import write_prometheus_textfile
 
+if TYPE_CHECKING:
+    from app.agents.sql_writer import LLMCallPolicy
 
-def main() -> None:
-    parser = argparse.ArgumentParser(description="Generate invoices for a billing month")
-    parser.add_argument("run", nargs="?", help="run the invoice generator")
-    parser.add_argument("--month", required=True, help="Billing month in YYYY-MM")
-    args = parser.parse_args()
+COMMANDS = (
+    "run",
+    "serve",
+    "batch",
+    "plan",
+    "check-shards",
+    "query",
+    "install-accumulators",
+    "rebuild-accumulators",
+    "check-accumulators",
+    "drop-accumulators",
+)
 
-    result = run(args.month)
+
+def _llm_policy(args: argparse.Namespace) -> LLMCallPolicy:
+    from app.agents.sql_writer import LLMCallPolicy
+
+    return LLMCallPolicy(
+        timeout_s=args.llm_timeout,
+        retries=args.llm_retries,
+        hedge_after_s=args.llm_hedge_after,
+    )
+
+
+def _print_plan_cache() -> None:
+    from app.plan_cache import PlanCache
+
+    cache = PlanCache(load_settings().plan_cache_path)
+    try:
+        stats = cache.stats()
+        print(
+            f"Plan cache: {stats.hits} hits, {stats.misses} misses, "
+            f"{stats.llm_seconds_saved:.1f}s of LLM time saved"
+        )
+        for entry in cache.entries():
+            print(
+                f"  {entry.cache_key[:12]} model={entry.model} mode={entry.mode} "
+                f"prompt=v{entry.prompt_version} overrides={entry.include_overrides} "
+                f"schema={entry.schema_hash[:12]} hits={entry.hit_count} "
+                f"llm={entry.llm_seconds:.1f}s created={entry.created_at}"
+            )
+    finally:
+        cache.close()
+
+
+def _serve(args: argparse.Namespace) -> None:
+    from app.service import InvoiceService, make_http_server, serve_jsonl
+
+    service = InvoiceService(
+        workers=args.service_workers,
+        queue_size=args.queue_size,
+        planner=args.planner,
+        use_plan_cache=not args.no_plan_cache,
+        llm_policy=_llm_policy(args),
+    )
+    try:
+        if args.command == "batch":
+            if args.jobs == "-":
+                failures = serve_jsonl(service, sys.stdin, sys.stdout)
+            else:
+                with open(args.jobs, encoding="utf-8") as source:
+                    failures = serve_jsonl(service, source, sys.stdout)
+            if failures:
+                sys.exit(1)
+            return
+        server = make_http_server(service, args.host, args.port)
+        print(f"Serving invoice jobs on http://{args.host}:{args.port}/jobs", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    finally:
+        service.close()
+
+
+def _print_prompt_tokens(counters: dict) -> None:
+    if "prompt_tokens_unpruned" in counters:
+        print(
+            f"Planning prompt: {counters['prompt_tokens_unpruned']:.0f} tokens before schema "
+            f"pruning, {counters['prompt_tokens']:.0f} after"
+        )
+
+
+def _save_plan(args: argparse.Namespace) -> None:
+    from app.invoice import make_plan
+    from app.metrics import RunMetrics
+
+    metrics = RunMetrics()
+    _, plan_source = make_plan(
+        mode=args.mode,
+        use_plan_cache=not args.no_plan_cache,
+        refresh_plan=args.refresh_plan,
+        planner=args.planner,
+        schema_reader=args.schema_reader,
+        plan_file=args.plan_file,
+        llm_policy=_llm_policy(args),
+        prune_schema=not args.no_schema_pruning,
+        metrics=metrics,
+    )
+    print(f"Plan ({plan_source}) saved to {args.plan_file}")
+    _print_prompt_tokens(metrics.to_dict()["counters"])
+
+
+def _check_shards(month_spec: str, shard_count: int) -> None:
+    from app.db import readonly_connection
+    from app.months import month_window, parse_months
+    from app.sharding import check_shards
+
+    settings = load_settings()
+    months = parse_months(month_spec)
+    month_start, month_end = month_window(months)
+    with readonly_connection(settings.db_path) as conn:
+        report = check_shards(
+            settings.output_dir,
+            months,
+            shard_count,
+            conn=conn,
+            params={"month_start": month_start, "month_end": month_end},
+        )
+    print(f"Shards found: {report.shards_found}/{shard_count}")
+    for problem in report.problems:
+        print(f"  problem: {problem}")
+    for label, invoice_ids in (
+        ("missing", report.missing),
+        ("duplicated", report.duplicated),
+        ("unexpected", report.unexpected),
+    ):
+        for invoice_id in invoice_ids:
+            print(f"  {label}: {invoice_id}")
+    if not report.ok:
+        sys.exit(1)
+    print("Shards cover every client exactly once")
+
+
+def _accumulators(command: str, month_spec: Optional[str]) -> None:
+    from app import accumulators
+    from app.db import connect, readonly_connection
+
+    db_path = load_settings().db_path
+    if command == "check-accumulators":
+        from app.months import parse_months
+
+        months = parse_months(month_spec) if month_spec else None
+        with readonly_connection(db_path) as conn:
+            report = accumulators.check(conn, months)
+        for problem in report.problems:
+            print(f"  problem: {problem}")
+        for mismatch in report.mismatches:
+            print(
+                f"  mismatch: {mismatch.billing_month} {mismatch.client_id} "
+                f"{mismatch.assignment_type}: stored {mismatch.stored}, "
+                f"assignments {mismatch.expected}"
+            )
+        if not report.ok:
+            sys.exit(1)
+        print(f"Billing accumulators match the assignments ({report.groups_checked} groups)")
+        return
+    conn = connect(db_path)
+    try:
+        if command == "install-accumulators":
+            groups = accumulators.install(conn)
+            print(f"Billing accumulators installed in {db_path} ({groups} groups)")
+        elif command == "rebuild-accumulators":
+            groups = accumulators.rebuild(conn)
+            print(f"Billing accumulators rebuilt ({groups} groups)")
+        else:
+            accumulators.drop(conn)
+            print(f"Billing accumulators removed from {db_path}")
+    except ValueError as exc:
+        sys.exit(str(exc))
+    finally:
+        conn.close()
+
+
+def _query_index(args: argparse.Namespace) -> None:
+    from dataclasses import asdict
+
+    from app.invoice_index import INDEX_FILENAME, InvoiceIndex
+
+    month_spec = _month_spec(args)
+    if month_spec:
+        from app.months import parse_months
+
+        try:
+            month_spec = ",".join(parse_months(month_spec))
+        except ValueError as exc:
+            sys.exit(f"Invalid month {month_spec!r}: {exc}")
+    output_dir = load_settings().output_dir
+    if not os.path.exists(os.path.join(output_dir, INDEX_FILENAME)):
+        sys.exit(f"No invoice index in {output_dir}; run the invoices first")
+    index = InvoiceIndex(output_dir)
+    try:
+        if args.totals:
+            results: list = index.month_totals(month_spec)
+        else:
+            results = index.find(client_id=args.client, month_spec=month_spec)
+    finally:
+        index.close()
+    for result in results:
+        if args.json:
+            print(json.dumps(asdict(result)))
+        elif args.totals:
+            print(
+                f"{result.billing_month}  {result.currency}  {result.invoices} invoices  "
+                f"{result.total_credits:.2f} credits  {result.total_amount_usd} total"
+            )
+        else:
+            print(
+                f"{result.billing_month}  {result.client_id}  {result.invoice_id}  "
+                f"{result.currency} {result.total_amount_usd}  {result.html_path}"
+            )
+    if not results and not args.json:
+        print("No matching invoices in the index", file=sys.stderr)
+
+
+def _run_tenants(args: argparse.Namespace, month_spec: str) -> None:
+    from app.tenants import run_tenants
+
+    report = run_tenants(
+        month_spec,
+        args.db,
+        tenant_workers=args.tenant_workers,
+        mode=args.mode,
+        planner=args.planner,
+        use_plan_cache=not args.no_plan_cache,
+        refresh_plan=args.refresh_plan,
+        schema_reader=args.schema_reader,
+        schema_sample_rows=args.schema_sample_rows,
+        prune_schema=not args.no_schema_pruning,
+        llm_policy=_llm_policy(args),
+        stream=args.stream,
+        batch_size=args.batch_size,
+        strict_rows=args.strict_rows,
+        validation_sample_rate=args.validation_sample_rate,
+        workers=args.workers,
+        incremental=args.incremental,
+        details=args.details,
+        plan_guard=args.plan_guard,
+        create_indexes=args.create_indexes,
+        output_format=args.output_format,
+        billing_backend=args.billing_backend,
+        vector_threshold=args.vector_threshold,
+        use_accumulators=not args.no_accumulators,
+    )
+    print(
+        f"Tenants: {len(report.tenants)} ({len(report.failed)} failed), "
+        f"schema groups: {len(report.plans)}, invoices written: {report.invoices_written}"
+    )
+    for group, plan in report.plans.items():
+        source = plan.get("plan_source", "failed")
+        print(f"  schema {group}: {len(plan['tenants'])} tenants, plan from {source}")
+    for result in report.failed:
+        print(f"Failed: {result.tenant}: {result.error}", file=sys.stderr)
+    print(f"Report: {report.report_path}")
+    if report.failed:
+        sys.exit(1)
+
+
+def _month_spec(args: argparse.Namespace) -> Optional[str]:
+    return args.months or args.month
+
+
+def _run(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    if args.plan_cache_info:
+        _print_plan_cache()
+        return
+    month_spec = _month_spec(args)
+    if not month_spec:
+        parser.error("--month or --months is required")
+    if args.db:
+        if args.shard or args.plan_file:
+            parser.error("--db plans once per schema; it cannot be combined with --shard/--plan-file")
+        if args.metrics_json or args.prometheus_file:
+            parser.error(
+                "--db writes one report for all tenants (fanout-report.json); "
+                "--metrics-json/--prometheus-file are per run"
+            )
+        _run_tenants(args, month_spec)
+        return
+
+    # Imported after argument parsing so --help and usage errors stay instant.
+    from app.invoice import run
+
+    result = run(
+        month_spec,
+        use_plan_cache=not args.no_plan_cache,
+        refresh_plan=args.refresh_plan,
+        schema_reader=args.schema_reader,
+        schema_sample_rows=args.schema_sample_rows,
+        prune_schema=not args.no_schema_pruning,
+        use_accumulators=not args.no_accumulators,
+        stream=args.stream,
+        batch_size=args.batch_size,
+        mode=args.mode,
+        strict_rows=args.strict_rows,
+        validation_sample_rate=args.validation_sample_rate,
+        workers=args.workers,
+        incremental=args.incremental,
+        details=args.details,
+        plan_guard=args.plan_guard,
+        create_indexes=args.create_indexes,
+        planner=args.planner,
+        output_format=args.output_format,
+        billing_backend=args.billing_backend,
+        vector_threshold=args.vector_threshold,
+        shard=args.shard,
+        shard_strategy=args.shard_strategy,
+        plan_file=args.plan_file,
+        llm_policy=_llm_policy(args),
+    )
     print(f"Invoices written: {result.invoices_written}")
+    print(f"Query plan: {result.plan_source}")
+    _print_prompt_tokens(result.metrics.to_dict()["counters"])
+    if result.manifest_path:
+        print(f"Shard manifest: {result.manifest_path}")
+    for warning in result.plan_warnings:
+        print(f"Warning: {warning}", file=sys.stderr)
+    if args.metrics_json:
+        report = {
+            "month": month_spec,
+            "invoices_written": result.invoices_written,
+            "plan_source": result.plan_source,
+            **result.metrics.to_dict(),
+        }
+        with open(args.metrics_json, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+    if args.prometheus_file:
+        write_prometheus_textfile(result.metrics, args.prometheus_file)
+    if result.incremental is not None:
+        report = result.incremental
+        print(
+            f"Incremental: {len(report.regenerated)} regenerated, "
+            f"{len(report.skipped)} skipped, {len(report.removed)} removed"
+        )
+        for label, invoice_ids in (
+            ("regenerated", report.regenerated),
+            ("removed", report.removed),
+        ):
+            for invoice_id in invoice_ids:
+                print(f"  {label}: {invoice_id}")
+
+
+def _add_month_options(parser: argparse.ArgumentParser, required: bool = False) -> None:
+    months = parser.add_mutually_exclusive_group(required=required)
+    months.add_argument("--month", help="Billing month in YYYY-MM")
+    months.add_argument(
+        "--months",
+        help="Several billing months: a range YYYY-MM..YYYY-MM or a comma-separated list",
+    )
+
+
+def _add_llm_options(parser: argparse.ArgumentParser) -> None:
+    planning = parser.add_argument_group("planning options")
+    planning.add_argument(
+        "--planner",
+        choices=["auto", "compiler", "llm"],
+        default="auto",
+        help="auto: compile SQL offline for the known schema, else ask the LLM (default)",
+    )
+    planning.add_argument(
+        "--no-plan-cache",
+        action="store_true",
+        help="Bypass the SQL plan cache (neither read nor write it)",
+    )
+    planning.add_argument(
+        "--llm-timeout",
+        type=float,
+        default=60.0,
+        help="Seconds to wait for one LLM planning call before retrying (default: 60)",
+    )
+    planning.add_argument(
+        "--llm-retries",
+        type=int,
+        default=2,
+        help="Retries after a failed or timed-out LLM planning call (default: 2)",
+    )
+    planning.add_argument(
+        "--llm-hedge-after",
+        type=float,
+        metavar="SECONDS",
+        help="Send a second, duplicate LLM request if the first is slower than this",
+    )
+
+
+def _add_plan_options(parser: argparse.ArgumentParser) -> None:
+    _add_llm_options(parser)
+    schema = parser.add_argument_group("schema and query options")
+    schema.add_argument(
+        "--refresh-plan",
+        action="store_true",
+        help="Ask the LLM for a new SQL plan and replace the cached one",
+    )
+    schema.add_argument(
+        "--schema-reader",
+        choices=["native", "legacy"],
+        default="native",
+        help="Read the schema via SQLite PRAGMAs (native) or SQLAlchemy reflection (legacy)",
+    )
+    schema.add_argument(
+        "--no-schema-pruning",
+        action="store_true",
+        help="Send every table and column (and sample rows) to the LLM planner",
+    )
+    schema.add_argument(
+        "--schema-sample-rows",
+        type=int,
+        default=0,
+        help="Sample rows per table for the schema prompt (native reader, --no-schema-pruning)",
+    )
+    schema.add_argument(
+        "--mode",
+        choices=["rows", "aggregate"],
+        default="rows",
+        help="Fetch one row per assignment (rows, for audits) or per-client/type counts (aggregate)",
+    )
+
+
+def _add_service_options(parser: argparse.ArgumentParser) -> None:
+    _add_llm_options(parser)
+    service = parser.add_argument_group("service options")
+    service.add_argument(
+        "--service-workers", type=int, default=2, help="Jobs processed concurrently"
+    )
+    service.add_argument(
+        "--queue-size", type=int, default=16, help="Jobs queued or running before submit blocks"
+    )
+
+
+def _add_run_options(parser: argparse.ArgumentParser) -> None:
+    _add_month_options(parser)
+    _add_plan_options(parser)
+    parser.add_argument(
+        "--plan-cache-info",
+        action="store_true",
+        help="Show cached SQL plans and hit/miss counts, then exit",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read rows in batches ordered by client and write each invoice as it completes",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Rows fetched per batch in --stream mode (default: 1000)",
+    )
+    parser.add_argument(
+        "--strict-rows",
+        action="store_true",
+        help="Validate every assignment row with Pydantic instead of the fast loader",
+    )
+    parser.add_argument(
+        "--validation-sample-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of rows (0-1) to spot-check with Pydantic in the fast loader",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes used to render and write invoices (default: 1, serial)",
+    )
+    parser.add_argument(
+        "--billing-backend",
+        choices=["auto", "python", "numpy"],
+        default="auto",
+        help="auto: price large row sets with NumPy when installed, else per row (default)",
+    )
+    parser.add_argument(
+        "--vector-threshold",
+        type=int,
+        default=200_000,
+        help="Rows from which --billing-backend auto switches to NumPy (default: 200000)",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=["dirs", "archive"],
+        default="dirs",
+        help="dirs: invoice.json/html per client (default); archive: one JSONL + HTML zip per month",
+    )
+    parser.add_argument(
+        "--details",
+        action="store_true",
+        help="Append every completed assignment (ID, type, completed_at) to the invoice HTML",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only rebuild invoices whose input rows, overrides or template changed",
+    )
+    parser.add_argument(
+        "--plan-guard",
+        choices=["warn", "reject", "off"],
+        default="warn",
+        help="What to do when EXPLAIN QUERY PLAN shows a full scan of a large table",
+    )
+    parser.add_argument(
+        "--create-indexes",
+        action="store_true",
+        help="Create the recommended indexes (e.g. assignments(status, completed_at, client_id))",
+    )
+    parser.add_argument(
+        "--no-accumulators",
+        action="store_true",
+        help="Read the assignments even when billing accumulators are installed",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        metavar="PATH",
+        help="Write a JSON run report with per-stage timings and counters",
+    )
+    parser.add_argument(
+        "--prometheus-file",
+        metavar="PATH",
+        help="Write run metrics as a Prometheus textfile-collector file",
+    )
+    shard_options = parser.add_argument_group("sharding options")
+    shard_options.add_argument(
+        "--shard",
+        metavar="I/N",
+        help="Only handle shard I of N (0-based) of the clients and write a shard manifest",
+    )
+    shard_options.add_argument(
+        "--shard-strategy",
+        choices=["hash", "range"],
+        default="hash",
+        help="Partition clients by client_id hash (default) or by client_id range",
+    )
+    shard_options.add_argument(
+        "--plan-file",
+        metavar="PATH",
+        help="Execute this saved plan (see the plan command) instead of planning",
+    )
+    tenant_options = parser.add_argument_group("multi-database runs")
+    tenant_options.add_argument(
+        "--db",
+        action="append",
+        metavar="PATH_OR_GLOB",
+        help="Invoice each tenant database (repeatable, globs allowed) into "
+        "INVOICE_OUTPUT_DIR/<tenant>/",
+    )
+    tenant_options.add_argument(
+        "--tenant-workers", type=int, default=4, help="Tenant databases processed at once"
+    )
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # `run` is the default command: `python -m app --month 2025-11` still works.
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        argv = ["run", *argv]
+
+    parser = argparse.ArgumentParser(
+        description="Generate invoices for a billing month",
+        epilog="Run `python -m app <command> --help` for the options of one command.",
+    )
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    run_parser = commands.add_parser("run", help="run once (default)")
+    _add_run_options(run_parser)
+
+    serve_parser = commands.add_parser("serve", help="serve invoice jobs over HTTP")
+    _add_service_options(serve_parser)
+    serve_parser.add_argument("--host", default="127.0.0.1", help="HTTP bind address")
+    serve_parser.add_argument("--port", type=int, default=8765, help="HTTP port")
+
+    batch_parser = commands.add_parser("batch", help="run a JSON-lines batch of jobs")
+    _add_service_options(batch_parser)
+    batch_parser.add_argument(
+        "--jobs",
+        default="-",
+        metavar="PATH",
+        help='JSON-lines jobs, e.g. {"month": "2025-11", "client_id": "C001"} (default: stdin)',
+    )
+
+    plan_parser = commands.add_parser("plan", help="save a plan file for sharded runs")
+    _add_plan_options(plan_parser)
+    plan_parser.add_argument(
+        "--plan-file", required=True, metavar="PATH", help="Where to save the plan"
+    )
+
+    shards_parser = commands.add_parser("check-shards", help="check shard manifests")
+    _add_month_options(shards_parser, required=True)
+    shards_parser.add_argument(
+        "--shard-count", type=int, required=True, metavar="N", help="Number of shards expected"
+    )
+
+    query_parser = commands.add_parser("query", help="query the invoice index")
+    _add_month_options(query_parser)
+    query_parser.add_argument("--client", help="Only invoices for this client_id")
+    query_parser.add_argument(
+        "--totals", action="store_true", help="Invoice count and totals per month"
+    )
+    query_parser.add_argument("--json", action="store_true", help="Print JSON lines")
+
+    commands.add_parser(
+        "install-accumulators",
+        help="create, backfill and add the triggers of the billing accumulators",
+    )
+    commands.add_parser("rebuild-accumulators", help="recompute every accumulator count")
+    check_parser = commands.add_parser(
+        "check-accumulators", help="compare the accumulators with the assignments"
+    )
+    _add_month_options(check_parser)
+    commands.add_parser("drop-accumulators", help="remove the accumulator table and triggers")
+    args = parser.parse_args(argv)
+
+    if args.command in ("serve", "batch"):
+        _serve(args)
+    elif args.command == "plan":
+        _save_plan(args)
+    elif args.command == "query":
+        _query_index(args)
+    elif args.command == "check-shards":
+        _check_shards(_month_spec(args), args.shard_count)
+    elif args.command == "check-accumulators":
+        _accumulators(args.command, _month_spec(args))
+    elif args.command.endswith("-accumulators"):
+        _accumulators(args.command, None)
+    else:
+        _run(args, run_parser)
@@ -10,16 +10,19 @@ class Settings:
     openai_model: str
     db_path: str
     output_dir: str
+    plan_cache_path: str
+    sqlite_mmap_mb: int = 256
+    sqlite_cache_mb: int = 64
 
 
 def load_settings() -> Settings:
     load_dotenv()
-    api_key = os.getenv("OPENAI_API_KEY", "").strip()
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is required")
     return Settings(
-        openai_api_key=api_key,
+        openai_api_key=os.getenv("OPENAI_API_KEY", "").strip(),
         openai_model=os.getenv("OPENAI_MODEL", "gpt-5.1").strip() or "gpt-5.1",
         db_path=os.getenv("INVOICE_DB_PATH", "data/invoices.db"),
         output_dir=os.getenv("INVOICE_OUTPUT_DIR", "invoices"),
+        plan_cache_path=os.getenv("INVOICE_PLAN_CACHE_PATH", "data/plan_cache.db"),
+        sqlite_mmap_mb=int(os.getenv("INVOICE_SQLITE_MMAP_MB", "256")),
+        sqlite_cache_mb=int(os.getenv("INVOICE_SQLITE_CACHE_MB", "64")),
     )
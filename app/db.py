@@ -1,12 +1,60 @@
 import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
 
+DEFAULT_MMAP_MB = 256
+DEFAULT_CACHE_MB = 64
 
-def connect(db_path: str) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
+
+def connect(db_path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def readonly_uri(db_path: str) -> str:
+    return f"{Path(db_path).resolve().as_uri()}?mode=ro"
+
+
+def connect_readonly(
+    db_path: str,
+    check_same_thread: bool = True,
+    mmap_mb: int = DEFAULT_MMAP_MB,
+    cache_mb: int = DEFAULT_CACHE_MB,
+    temp_store: str = "MEMORY",
+) -> sqlite3.Connection:
+    """Open ``db_path`` read-only for billing queries, with read-tuned pragmas.
+
+    ``mode=ro`` (rather than ``immutable=1``) still takes WAL read locks, so each
+    query sees a consistent snapshot while the application writes to the
+    database. ``query_only`` rejects writes; ``mmap_size`` and ``cache_size``
+    keep hot pages in memory and ``temp_store`` keeps sort/GROUP BY spills off
+    disk. Pass ``temp_store="FILE"`` when a query sorts a result that must not
+    be held in RAM (streamed runs); SQLite then spills past its cache to
+    temporary files. Index creation and other writes use ``connect``.
+    """
+    if temp_store not in ("MEMORY", "FILE", "DEFAULT"):
+        raise ValueError(f"Unknown temp_store: {temp_store}")
+    conn = sqlite3.connect(readonly_uri(db_path), uri=True, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA mmap_size = {int(mmap_mb) * 1024 * 1024}")
+    conn.execute(f"PRAGMA cache_size = {-int(cache_mb) * 1024}")
+    conn.execute(f"PRAGMA temp_store = {temp_store}")
+    conn.execute("PRAGMA query_only = ON")
     return conn
 
 
+@contextmanager
+def readonly_connection(db_path: str, **kwargs: int) -> Iterator[sqlite3.Connection]:
+    """``connect_readonly`` that closes the connection when the block exits."""
+    conn = connect_readonly(db_path, **kwargs)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
 def table_exists(conn: sqlite3.Connection, table_name: str) -> bool:
     cursor = conn.execute(
         "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
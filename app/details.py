@@ -0,0 +1,80 @@
+"""Per-assignment detail rows for the invoice HTML appendix, read lazily per invoice.
+
+The appendix lists every completed assignment behind an invoice. Rows come
+from the run's planned per-row SQL narrowed to one client and month, and are
+fetched in batches while the template streams, so a client with hundreds of
+thousands of assignments never sits in memory as one list or one string.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from collections import namedtuple
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional
+
+from app.db import connect_readonly
+from app.months import month_bounds
+
+AssignmentDetail = namedtuple(
+    "AssignmentDetail", ["assignment_id", "assignment_type", "completed_at"]
+)
+
+DETAIL_SQL = """
+SELECT assignment_id, assignment_type, completed_at
+FROM ({sql})
+WHERE client_id = :detail_client_id
+  AND completed_at >= :detail_start
+  AND completed_at < :detail_end
+ORDER BY completed_at, assignment_id
+"""
+
+
+@dataclass
+class DetailSource:
+    """Reads one invoice's assignments from the planned rows query.
+
+    ``conn`` is reused when given (serial runs share the run's connection);
+    otherwise a read-only connection is opened on first use, which is what
+    process-pool workers do after unpickling.
+    """
+
+    db_path: str
+    sql: str
+    params: dict[str, Any]
+    batch_size: int = 1000
+    conn: Optional[sqlite3.Connection] = field(default=None, repr=False, compare=False)
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = dict(self.__dict__)
+        state["conn"] = None
+        return state
+
+    def close(self) -> None:
+        """Close the connection this source opened or was given."""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def rows(self, client_id: str, billing_month: str) -> Iterator[AssignmentDetail]:
+        if self.conn is None:
+            self.conn = connect_readonly(self.db_path)
+        month_start, month_end = month_bounds(billing_month)
+        cursor = self.conn.execute(
+            DETAIL_SQL.format(sql=self.sql),
+            {
+                **self.params,
+                "detail_client_id": client_id,
+                "detail_start": month_start,
+                "detail_end": month_end,
+            },
+        )
+        try:
+            while True:
+                batch = cursor.fetchmany(self.batch_size)
+                if not batch:
+                    return
+                for row in batch:
+                    yield AssignmentDetail._make(row)
+        finally:
+            cursor.close()
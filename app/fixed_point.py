@@ -0,0 +1,49 @@
+"""Integer fixed-point arithmetic for credits (hundredths) and whole-dollar amounts.
+
+Results match ``Decimal(str(value))`` arithmetic quantized with ``ROUND_HALF_UP``:
+a rate is converted to an exact fraction once (per distinct value) and every
+line is then computed with integer multiplication and one rounding division.
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+from functools import lru_cache
+
+CREDIT_SCALE = 100
+
+
+@lru_cache(maxsize=4096)
+def rate_fraction(value: float) -> tuple[int, int]:
+    """Return ``value``'s shortest decimal representation as an exact ``(numerator, denominator)``."""
+    return Decimal(str(value)).as_integer_ratio()
+
+
+def div_round_half_up(numerator: int, denominator: int) -> int:
+    """Divide and round halves away from zero, like ``Decimal`` ``ROUND_HALF_UP``."""
+    if denominator < 0:
+        numerator, denominator = -numerator, -denominator
+    if numerator < 0:
+        return -((-2 * numerator + denominator) // (2 * denominator))
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+def line_credits_hundredths(credits_per_assignment: float, quantity: int) -> int:
+    """Credits for ``quantity`` assignments, rounded half-up to hundredths."""
+    numerator, denominator = rate_fraction(credits_per_assignment)
+    return div_round_half_up(numerator * quantity * CREDIT_SCALE, denominator)
+
+
+def line_amount(credits_hundredths: int, unit_credit_value: int) -> int:
+    """Whole-currency amount for ``credits_hundredths`` at ``unit_credit_value``, rounded half-up."""
+    return div_round_half_up(credits_hundredths * unit_credit_value, CREDIT_SCALE)
+
+
+def credits_to_float(credits_hundredths: int) -> float:
+    """Float for JSON output; equal to ``float(Decimal(credits_hundredths) / 100)``."""
+    return credits_hundredths / CREDIT_SCALE
+
+
+def credits_from_float(credits: float) -> int:
+    """Hundredths for a credits value that was produced by ``credits_to_float``."""
+    return round(credits * CREDIT_SCALE)
@@ -0,0 +1,124 @@
+"""Track per client-month input hashes so unchanged invoices are not rebuilt."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Sequence, TypeVar
+
+from pydantic import BaseModel
+
+from app.writer import remove_invoice
+
+STATE_FILENAME = ".invoice_state.db"
+
+GroupT = TypeVar("GroupT", bound=Sequence)
+
+
+@dataclass
+class IncrementalReport:
+    regenerated: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+
+
+def _row_values(row: object) -> tuple:
+    if isinstance(row, BaseModel):
+        return tuple(row.model_dump().values())
+    return tuple(row)  # type: ignore[arg-type]
+
+
+def input_hash(rows: Iterable[object], mode: str, template_version: str) -> str:
+    """Hash a client-month's input rows (rates and overrides included) independent of row order."""
+    digest = hashlib.sha256(f"{mode}|{template_version}".encode("utf-8"))
+    for value in sorted(repr(_row_values(row)) for row in rows):
+        digest.update(b"\n")
+        digest.update(value.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class InvoiceState:
+    """Input hashes of written invoices, stored next to them in the output directory."""
+
+    def __init__(self, output_root: str, mode: str, template_version: str) -> None:
+        os.makedirs(output_root, exist_ok=True)
+        self._output_root = output_root
+        self._mode = mode
+        self._template_version = template_version
+        self._conn = sqlite3.connect(os.path.join(output_root, STATE_FILENAME))
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS invoice_inputs (
+                client_id TEXT NOT NULL,
+                billing_month TEXT NOT NULL,
+                input_hash TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (client_id, billing_month)
+            )
+            """
+        )
+        self._conn.commit()
+        self._pending: list[tuple[str, str, str]] = []
+        self._seen: set[tuple[str, str]] = set()
+        self.report = IncrementalReport()
+        # (client_id, billing_month) of invoices removed by ``commit``.
+        self.removed_keys: list[tuple[str, str]] = []
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def changed_groups(
+        self,
+        groups: Iterable[tuple[str, GroupT]],
+    ) -> Iterator[tuple[str, GroupT]]:
+        """Yield only the (billing_month, client rows) groups whose input hash changed."""
+        for billing_month, rows in groups:
+            client_id = rows[0].client_id
+            self._seen.add((client_id, billing_month))
+            new_hash = input_hash(rows, self._mode, self._template_version)
+            stored = self._conn.execute(
+                "SELECT input_hash FROM invoice_inputs WHERE client_id = ? AND billing_month = ?",
+                (client_id, billing_month),
+            ).fetchone()
+            invoice_id = f"{client_id}-{billing_month}"
+            if stored is not None and stored[0] == new_hash:
+                self.report.skipped.append(invoice_id)
+                continue
+            self._pending.append((client_id, billing_month, new_hash))
+            self.report.regenerated.append(invoice_id)
+            yield billing_month, rows
+
+    def commit(self, months: Iterable[str]) -> None:
+        """Record hashes of the written invoices and remove invoices whose inputs disappeared.
+
+        Call only after every regenerated invoice has been written, so an
+        interrupted run is rebuilt on the next attempt.
+        """
+        updated_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        with self._conn:
+            self._conn.executemany(
+                """
+                INSERT OR REPLACE INTO invoice_inputs (client_id, billing_month, input_hash, updated_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                [(client, month, value, updated_at) for client, month, value in self._pending],
+            )
+            for month in months:
+                stale = self._conn.execute(
+                    "SELECT client_id FROM invoice_inputs WHERE billing_month = ?",
+                    (month,),
+                ).fetchall()
+                for (client_id,) in stale:
+                    if (client_id, month) in self._seen:
+                        continue
+                    remove_invoice(self._output_root, client_id, month)
+                    self._conn.execute(
+                        "DELETE FROM invoice_inputs WHERE client_id = ? AND billing_month = ?",
+                        (client_id, month),
+                    )
+                    self.report.removed.append(f"{client_id}-{month}")
+                    self.removed_keys.append((client_id, month))
+        self._pending = []
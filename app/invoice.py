@@ -1,95 +1,759 @@
 from __future__ import annotations
 
-import os
-from dataclasses import dataclass
-from datetime import datetime
+import asyncio
+import importlib.util
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from itertools import groupby
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    TypeVar,
+)
 
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from app.accumulators import accumulators_installed
+from app.config import Settings, load_settings
+from app.db import connect, connect_readonly
+from app.details import DetailSource
+from app.invoice_index import InvoiceIndex
+from app.incremental import IncrementalReport, InvoiceState
+from app.loader import AssignmentLike, PrefetchedCursor, load_assignments
+from app.months import month_window, parse_months
+from app.models import AssignmentAggregateRow, AssignmentRow, Invoice
+from app.agents import (
+    InvoiceBuilderAgent,
+    InvoicePackage,
+    SchemaReaderAgent,
+    SQLCompilerAgent,
+    SQLDatabaseSchemaReader,
+    SQLWriterAgent,
+)
+from app.agents.schema_reader import SchemaInfo
+from app.agents.invoice_builder import group_by_client, iter_client_runs
+from app.agents.sql_writer import (
+    AGGREGATE_MODE,
+    PROMPT_VERSION,
+    ROWS_MODE,
+    LLMCallPolicy,
+    SQLQueryPlan,
+)
+from app.metrics import RunHook, RunMetrics
+from app.query_guard import check_query_plan, create_recommended_indexes
+from app.plan_cache import PlanCache, PlanKey, read_plan_file, schema_fingerprint, write_plan_file
+from app.sharding import HASH_STRATEGY, ShardSpec, shard_query, write_manifest
+from app.writer import DIRS_FORMAT, load_template, template_fingerprint, write_invoices
 
-from app.config import load_settings
-from app.db import connect
-from app.models import AssignmentRow
-from app.agents import InvoiceBuilderAgent, SchemaReaderAgent, SQLWriterAgent
+if TYPE_CHECKING:
+    from jinja2 import Template
+    from langchain_core.language_models import BaseChatModel
+
+T = TypeVar("T")
+
+AUTO_BACKEND = "auto"
+PYTHON_BACKEND = "python"
+NUMPY_BACKEND = "numpy"
+DEFAULT_VECTOR_THRESHOLD = 200_000
 
 
 @dataclass
 class RunResult:
     invoices_written: int
+    plan_source: str = "llm"
+    incremental: Optional[IncrementalReport] = None
+    plan_warnings: list[str] = field(default_factory=list)
+    metrics: RunMetrics = field(default_factory=RunMetrics)
+    manifest_path: Optional[str] = None
 
 
-def _month_bounds(month: str) -> tuple[str, str]:
-    """Return YYYY-MM-01 (inclusive) and next-month YYYY-MM-01 (exclusive)."""
-    try:
-        start = datetime.strptime(month, "%Y-%m")
-    except ValueError as exc:
-        raise ValueError("Month must be in YYYY-MM format") from exc
-    year = start.year
-    next_month = start.month + 1
-    if next_month == 13:
-        year += 1
-        next_month = 1
-    end = datetime(year, next_month, 1)
-    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
-
-
-def _load_template() -> Environment:
-    """Load the Jinja2 environment for invoice HTML rendering."""
-    return Environment(
-        loader=FileSystemLoader("app/templates"),
-        autoescape=select_autoescape(["html"]),
+def _billing_month(row: AssignmentLike) -> str:
+    return row.completed_at[:7]
+
+
+def _ordered_for_streaming(sql: str) -> str:
+    """Wrap ``sql`` so rows arrive grouped by month and client, keeping the plan's order within a group.
+
+    SQLite sorts the whole result for this, so streamed runs open their
+    connection with ``temp_store="FILE"`` to let the sort spill to disk.
+    """
+    columns = ", ".join(AssignmentRow.model_fields)
+    return (
+        f"SELECT {columns} FROM ("
+        f"SELECT *, row_number() OVER () AS _plan_seq FROM ({sql})"
+        ") ORDER BY substr(completed_at, 1, 7), client_id, _plan_seq"
     )
 
 
-def run(month: str) -> RunResult:
-    """Generate invoices for a billing month and write JSON/HTML outputs."""
-    settings = load_settings()
-    month_start, month_end = _month_bounds(month)
+def query_groups(
+    conn: sqlite3.Connection,
+    sql: str,
+    params: dict[str, str],
+    months: Sequence[str],
+    mode: str = ROWS_MODE,
+    metrics: Optional[RunMetrics] = None,
+    stream: bool = False,
+    batch_size: int = 1000,
+    strict_rows: bool = False,
+    validation_sample_rate: float = 0.0,
+) -> Iterable[tuple[str, Sequence]]:
+    """Run the planned query and yield ``(billing_month, client_rows)`` groups for ``months``."""
+    metrics = metrics or RunMetrics()
+    if mode == AGGREGATE_MODE:
+        with metrics.stage("query"):
+            cursor = conn.execute(sql, params)
+        aggregates_by_month: dict[str, list[AssignmentAggregateRow]] = {}
+        with metrics.stage("load"):
+            for row in cursor.fetchall():
+                aggregate = AssignmentAggregateRow(**dict(row))
+                aggregates_by_month.setdefault(aggregate.billing_month, []).append(aggregate)
+                metrics.incr("rows_loaded")
+        return (
+            (billing_month, client_rows)
+            for billing_month in months
+            for client_rows in group_by_client(aggregates_by_month.get(billing_month, []))
+        )
+
+    with metrics.stage("query"):
+        cursor = conn.execute(sql, params)
+    assignments = load_assignments(
+        cursor,
+        batch_size=batch_size,
+        strict=strict_rows,
+        sample_rate=validation_sample_rate,
+        metrics=metrics,
+    )
+    return _group_assignments(assignments, months, stream=stream)
+
+
+def _group_assignments(
+    assignments: Iterable[AssignmentLike], months: Sequence[str], stream: bool = False
+) -> Iterable[tuple[str, Sequence]]:
+    if stream:
+        wanted = set(months)
+        return (
+            (billing_month, client_rows)
+            for billing_month, month_rows in groupby(assignments, key=_billing_month)
+            if billing_month in wanted
+            for client_rows in iter_client_runs(month_rows)
+        )
+    rows_by_month: dict[str, list[AssignmentLike]] = {}
+    for assignment in assignments:
+        rows_by_month.setdefault(_billing_month(assignment), []).append(assignment)
+    return (
+        (billing_month, client_rows)
+        for billing_month in months
+        for client_rows in group_by_client(rows_by_month.get(billing_month, []))
+    )
 
-    conn = connect(settings.db_path)
-    schema_agent = SchemaReaderAgent(settings.db_path)
-    schema_info = schema_agent.read_schema()
 
-    include_overrides = "client_assignment_overrides" in schema_info.table_names
+def _numpy_available() -> bool:
+    return importlib.util.find_spec("numpy") is not None
 
-    sql_agent = SQLWriterAgent(settings.openai_model, settings.openai_api_key)
-    query_plan = sql_agent.generate_query(
-        schema_text=schema_info.schema_text,
-        month_start=month_start,
-        month_end=month_end,
+
+def _batch_invoices(
+    conn: sqlite3.Connection,
+    sql: str,
+    params: dict[str, Any],
+    months: Sequence[str],
+    builder: InvoiceBuilderAgent,
+    metrics: RunMetrics,
+    billing_backend: str = AUTO_BACKEND,
+    vector_threshold: int = DEFAULT_VECTOR_THRESHOLD,
+    batch_size: int = 1000,
+) -> Iterator[Invoice]:
+    """Build invoices from the month's rows with the chosen backend.
+
+    "auto" uses NumPy when it is installed, the query returns at least
+    ``vector_threshold`` rows and the first row has the expected types; only
+    then is the whole result fetched at once. Up to ``vector_threshold`` rows
+    are read ahead in ``batch_size`` batches to decide; otherwise those batches
+    and the rest of the cursor go through ``load_assignments`` as they come.
+    """
+    with metrics.stage("query"):
+        cursor = PrefetchedCursor(conn.execute(sql, params))
+    use_numpy = billing_backend == NUMPY_BACKEND
+    if not use_numpy and _numpy_available():
+        threshold = max(vector_threshold, 1)
+        with metrics.stage("load"):
+            buffered = cursor.read_ahead(threshold, batch_size)
+        use_numpy = buffered >= threshold and cursor.first_row_matches()
+    if use_numpy:
+        from app.agents.vector_billing import MissingRateError
+
+        with metrics.stage("load"):
+            rows = cursor.fetchall()
+        try:
+            packages = builder.build_vectorized(rows, cursor.columns, months)
+        except MissingRateError:
+            # Let the per-row builder handle (and report) the missing rates.
+            metrics.incr("vectorized_fallbacks")
+            cursor.unread(rows)
+        else:
+            metrics.incr("rows_loaded", len(rows))
+            metrics.incr("vectorized_rows", len(rows))
+            for _, package in packages:
+                yield package.invoice
+            return
+        del rows
+    assignments = load_assignments(cursor, batch_size=batch_size, metrics=metrics)
+    for billing_month, client_rows in _group_assignments(assignments, months):
+        yield builder.build_invoice(client_rows, billing_month).invoice
+
+
+async def aplan_query(
+    settings: Settings,
+    schema_info: SchemaInfo,
+    month_start: str,
+    month_end: str,
+    include_overrides: bool,
+    use_plan_cache: bool,
+    refresh_plan: bool,
+    mode: str = ROWS_MODE,
+    metrics: Optional[RunMetrics] = None,
+    llm: Optional[BaseChatModel] = None,
+    llm_policy: Optional[LLMCallPolicy] = None,
+    planner: str = "auto",
+    plan_file: Optional[str] = None,
+) -> tuple[SQLQueryPlan, str]:
+    """Return the query plan and where it came from ("file", "compiler", "cache" or "llm")."""
+    metrics = metrics or RunMetrics()
+    if plan_file is not None:
+        return read_plan_file(plan_file, schema_fingerprint(schema_info.schema_text), mode), "file"
+    if planner not in ("auto", "compiler", "llm"):
+        raise ValueError(f"Unknown planner: {planner}")
+    if planner != "llm":
+        compiled = SQLCompilerAgent(metrics=metrics).compile_query(schema_info, mode)
+        if compiled is not None:
+            metrics.incr("plan_compiled")
+            return compiled, "compiler"
+        if planner == "compiler":
+            raise ValueError("Schema does not match the known billing schema; use the LLM planner")
+
+    schema_text = schema_info.schema_text
+    cache = PlanCache(settings.plan_cache_path) if use_plan_cache else None
+    key = PlanKey(
+        schema_hash=schema_fingerprint(schema_text),
         include_overrides=include_overrides,
+        prompt_version=PROMPT_VERSION,
+        model=settings.openai_model,
+        mode=mode,
+    )
+    try:
+        if cache is not None and not refresh_plan:
+            cached = cache.get(key)
+            if cached is not None:
+                metrics.incr("plan_cache_hits")
+                return cached, "cache"
+            metrics.incr("plan_cache_misses")
+
+        sql_agent = SQLWriterAgent(
+            settings.openai_model, settings.openai_api_key, llm=llm, metrics=metrics
+        )
+        if schema_info.unpruned_text:
+            unpruned_tokens = sql_agent.prompt_tokens(schema_info.unpruned_text, mode)
+            metrics.incr("prompt_tokens_unpruned", unpruned_tokens)
+            metrics.incr("prompt_tokens", sql_agent.prompt_tokens(schema_text, mode))
+        started = time.perf_counter()
+        query_plan = await sql_agent.agenerate_query(
+            schema_text=schema_text,
+            month_start=month_start,
+            month_end=month_end,
+            include_overrides=include_overrides,
+            mode=mode,
+            policy=llm_policy,
+        )
+        if cache is not None:
+            cache.put(key, query_plan, llm_seconds=time.perf_counter() - started)
+        return query_plan, "llm"
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def _record_clients(
+    invoices: Iterable[Invoice], clients: dict[str, list[str]]
+) -> Iterator[Invoice]:
+    for invoice in invoices:
+        clients.setdefault(invoice.billing_month, []).append(invoice.client_id)
+        yield invoice
+
+
+def make_plan(
+    mode: str = ROWS_MODE,
+    use_plan_cache: bool = True,
+    refresh_plan: bool = False,
+    planner: str = "auto",
+    schema_reader: str = "native",
+    plan_file: Optional[str] = None,
+    llm: Optional[BaseChatModel] = None,
+    llm_policy: Optional[LLMCallPolicy] = None,
+    prune_schema: bool = True,
+    metrics: Optional[RunMetrics] = None,
+) -> tuple[SQLQueryPlan, str]:
+    """Plan the query once and optionally save it to ``plan_file`` for ``run(plan_file=...)``.
+
+    ``prune_schema`` must match the runs that use the plan file, since the file
+    is tied to the schema text the plan was made for.
+    """
+    settings = load_settings()
+    metrics = metrics or RunMetrics()
+    if schema_reader == "legacy":
+        schema_info = SQLDatabaseSchemaReader(settings.db_path, metrics=metrics).read_schema()
+    else:
+        conn = connect_readonly(settings.db_path)
+        try:
+            schema_info = SchemaReaderAgent(
+                conn, metrics=metrics, prune=prune_schema
+            ).read_schema()
+        finally:
+            conn.close()
+    query_plan, plan_source = asyncio.run(
+        aplan_query(
+            settings,
+            schema_info=schema_info,
+            month_start="",
+            month_end="",
+            include_overrides="client_assignment_overrides" in schema_info.table_names,
+            use_plan_cache=use_plan_cache,
+            refresh_plan=refresh_plan,
+            mode=mode,
+            metrics=metrics,
+            llm=llm,
+            llm_policy=llm_policy,
+            planner=planner,
+        )
     )
+    if plan_file is not None:
+        write_plan_file(
+            plan_file, query_plan, schema_fingerprint(schema_info.schema_text), mode, plan_source
+        )
+    return query_plan, plan_source
+
+
+def plan_accumulator_query(
+    conn: sqlite3.Connection,
+    schema_info: SchemaInfo,
+    metrics: Optional[RunMetrics] = None,
+    use_accumulators: bool = True,
+    details: bool = False,
+    strict_rows: bool = False,
+    validation_sample_rate: float = 0.0,
+    billing_backend: str = AUTO_BACKEND,
+    planner: str = "auto",
+    **run_options: Any,
+) -> Optional[SQLQueryPlan]:
+    """Return the query over ``billing_accumulators`` when a run with these options reads it.
+
+    This is the one place that decides accumulator reads. Other ``run()``
+    keyword options are accepted and ignored, so callers can pass a run's
+    options as they are.
+    """
+    if (
+        not use_accumulators
+        or details
+        or strict_rows
+        or validation_sample_rate
+        or billing_backend == NUMPY_BACKEND
+        or planner == "llm"
+        or not accumulators_installed(conn)
+    ):
+        return None
+    return SQLCompilerAgent(metrics=metrics).compile_accumulator_query(schema_info)
+
+
+def _create_indexes(db_path: str) -> list[str]:
+    """Create recommended indexes on a separate connection so it can run off the main thread."""
+    conn = connect(db_path)
+    try:
+        return create_recommended_indexes(conn)
+    finally:
+        conn.close()
+
+
+async def _prepare_run(
+    settings: Settings,
+    schema_info: SchemaInfo,
+    month_start: str,
+    month_end: str,
+    include_overrides: bool,
+    use_plan_cache: bool,
+    refresh_plan: bool,
+    mode: str,
+    metrics: RunMetrics,
+    llm: Optional[BaseChatModel],
+    llm_policy: Optional[LLMCallPolicy],
+    planner: str,
+    plan_file: Optional[str],
+    load_writer_template: bool,
+    create_indexes: bool,
+    accumulator_plan: Optional[SQLQueryPlan] = None,
+) -> tuple[SQLQueryPlan, str, Optional[Template], list[str]]:
+    """Plan the query while compiling the template and creating indexes in threads.
 
-    rows = conn.execute(
-        query_plan.sql,
-        {"month_start": month_start, "month_end": month_end},
-    ).fetchall()
+    An ``accumulator_plan`` is used as is, with plan source "accumulator".
+    Returns the plan, its source, the template and the index statements that ran.
+    The threaded tasks are timed as concurrent stages; the caller's "plan"
+    stage covers the wall time until all of them are done.
+    """
+
+    def timed(name: str, func: Callable[..., T], *args: Any) -> T:
+        with metrics.stage(name, concurrent=True):
+            return func(*args)
+
+    template_task = (
+        asyncio.create_task(asyncio.to_thread(timed, "template", load_template))
+        if load_writer_template
+        else None
+    )
+    index_task = (
+        asyncio.create_task(
+            asyncio.to_thread(timed, "create_indexes", _create_indexes, settings.db_path)
+        )
+        if create_indexes
+        else None
+    )
+    if accumulator_plan is not None:
+        query_plan, plan_source = accumulator_plan, "accumulator"
+    else:
+        query_plan, plan_source = await aplan_query(
+            settings,
+            schema_info=schema_info,
+            month_start=month_start,
+            month_end=month_end,
+            include_overrides=include_overrides,
+            use_plan_cache=use_plan_cache,
+            refresh_plan=refresh_plan,
+            mode=mode,
+            metrics=metrics,
+            llm=llm,
+            llm_policy=llm_policy,
+            planner=planner,
+            plan_file=plan_file,
+        )
+    created_indexes = await index_task if index_task is not None else []
+    template = await template_task if template_task is not None else None
+    return query_plan, plan_source, template, created_indexes
+
+
+def run(
+    month: str,
+    use_plan_cache: bool = True,
+    refresh_plan: bool = False,
+    schema_reader: str = "native",
+    schema_sample_rows: int = 0,
+    stream: bool = False,
+    batch_size: int = 1000,
+    mode: str = ROWS_MODE,
+    strict_rows: bool = False,
+    validation_sample_rate: float = 0.0,
+    workers: int = 1,
+    incremental: bool = False,
+    plan_guard: str = "warn",
+    create_indexes: bool = False,
+    hooks: Sequence[RunHook] = (),
+    llm: Optional[BaseChatModel] = None,
+    llm_policy: Optional[LLMCallPolicy] = None,
+    planner: str = "auto",
+    output_format: str = DIRS_FORMAT,
+    shard: Optional[str] = None,
+    shard_strategy: str = HASH_STRATEGY,
+    plan_file: Optional[str] = None,
+    billing_backend: str = AUTO_BACKEND,
+    vector_threshold: int = DEFAULT_VECTOR_THRESHOLD,
+    details: bool = False,
+    settings: Optional[Settings] = None,
+    schema_info: Optional[SchemaInfo] = None,
+    prune_schema: bool = True,
+    use_accumulators: bool = True,
+) -> RunResult:
+    """Generate invoices for a billing month and write JSON/HTML outputs.
+
+    ``month`` may be ``YYYY-MM``, a range ``YYYY-MM..YYYY-MM`` or a comma-separated
+    list; several months are planned once, fetched with one query over the whole
+    window and split by ``completed_at`` month in a single pass.
+
+    Options:
+    - ``use_plan_cache``/``refresh_plan``: reuse the cached SQL plan, or force a
+      fresh LLM call that overwrites it.
+    - ``schema_reader="legacy"``: reflect the schema through SQLAlchemy instead of
+      reading PRAGMAs on the run's own connection.
+    - ``prune_schema``: give the LLM only the billing tables, the tables they
+      reference and the contract and key columns, without sample rows; the
+      prompt token counts before and after are recorded as metrics.
+    - ``stream``/``batch_size``: read rows in batches ordered by month and client
+      and write each invoice as soon as its client's rows are complete.
+    - ``mode="aggregate"``: have SQLite count assignments per client and type;
+      keep the default per-row mode for audit runs.
+    - ``strict_rows``/``validation_sample_rate``: validate every row, or that
+      fraction of rows, with Pydantic instead of only the first one.
+    - ``workers``: render and write invoices in a process pool.
+    - ``incremental``: skip client-months whose inputs and template are unchanged
+      and remove invoices whose rows disappeared.
+    - ``plan_guard``: "warn" about or "reject" full scans of large tables found by
+      ``EXPLAIN QUERY PLAN`` ("off" skips it); ``create_indexes`` adds the
+      recommended indexes first.
+    - ``hooks``: receive stage start/end spans; timings and counters are also
+      returned on ``RunResult.metrics``.
+    - ``llm``/``llm_policy``: replace the OpenAI chat model (e.g. with a fake one)
+      and set the timeout, retry and hedging policy of the async planning call.
+      Template compilation and index creation overlap with that call.
+    - ``planner``: "auto" compiles the canonical SQL offline when the schema has
+      the known tables and columns and only asks the LLM otherwise; "compiler"
+      fails on unfamiliar schemas and "llm" always uses the cache/LLM path.
+    - ``output_format="archive"``: write one JSONL + HTML zip archive per month
+      with an offset index instead of a directory per client. Per-directory
+      runs record every written invoice in ``app.invoice_index`` instead.
+    - ``shard``/``shard_strategy``: only handle the clients of shard ``i/N``
+      (by ``client_id`` hash or range) and write a shard manifest; check the
+      shards with ``app.sharding.check_shards``.
+    - ``plan_file``: run a plan saved by ``make_plan`` instead of planning, so
+      every shard executes the same SQL.
+    - ``billing_backend``: "numpy" groups and prices per-row runs in column
+      arrays; "auto" does so from ``vector_threshold`` fetched rows when NumPy is
+      installed, and "python" always uses the per-row builder. The array backend
+      skips streaming, incremental runs and row validation options.
+    - ``details``: append every completed assignment (ID, type, completed_at)
+      to the HTML; rows are read per invoice while the HTML streams to disk.
+      Needs rows mode and the per-directory output format.
+    - ``settings``/``schema_info``: run against explicit settings instead of the
+      environment, and reuse a schema already read from an identical database
+      (``app.tenants`` fans one plan out to many databases this way).
+    - ``use_accumulators``: when ``app.accumulators`` is installed in the database
+      and the schema is the known one, read the trigger-maintained counts per
+      client, type and month instead of the assignments (plan source
+      "accumulator"; line items in type order as in aggregate mode). Runs with
+      ``details``, row validation, the numpy backend, ``plan_file`` or
+      ``planner="llm"`` keep reading the assignments.
+    """
+    if billing_backend not in (AUTO_BACKEND, PYTHON_BACKEND, NUMPY_BACKEND):
+        raise ValueError(f"Unknown billing backend: {billing_backend}")
+    batch_backend = billing_backend != PYTHON_BACKEND and not (
+        mode == AGGREGATE_MODE or stream or incremental or strict_rows or validation_sample_rate
+    )
+    if billing_backend == NUMPY_BACKEND:
+        if not batch_backend:
+            raise ValueError(
+                "The numpy billing backend needs rows mode without streaming, "
+                "incremental runs or row validation"
+            )
+        if not _numpy_available():
+            raise RuntimeError("The numpy billing backend requires NumPy (pip install numpy)")
+    if details and (mode == AGGREGATE_MODE or output_format != DIRS_FORMAT):
+        raise ValueError("Assignment details need rows mode and the per-directory output format")
+    if incremental and output_format != DIRS_FORMAT:
+        raise ValueError("Incremental runs need the per-directory output format")
+    shard_spec = ShardSpec.parse(shard, shard_strategy) if shard else None
+    if shard_spec is not None and (incremental or output_format != DIRS_FORMAT):
+        raise ValueError("Sharded runs need the per-directory output format and no --incremental")
+    metrics = RunMetrics(hooks)
+    settings = settings or load_settings()
+    months = parse_months(month)
+    month_start, month_end = month_window(months)
+
+    # The streaming sort must not be held in RAM (see ``_ordered_for_streaming``).
+    temp_store = "FILE" if stream and mode != AGGREGATE_MODE else "MEMORY"
+    with metrics.stage("connect"):
+        conn = connect_readonly(
+            settings.db_path,
+            mmap_mb=settings.sqlite_mmap_mb,
+            cache_mb=settings.sqlite_cache_mb,
+            temp_store=temp_store,
+        )
+    try:
+        if schema_info is None and schema_reader == "legacy":
+            legacy_reader = SQLDatabaseSchemaReader(settings.db_path, metrics=metrics)
+            try:
+                schema_info = legacy_reader.read_schema()
+            finally:
+                legacy_reader.close()
+        elif schema_info is None:
+            schema_info = SchemaReaderAgent(
+                conn, sample_rows=schema_sample_rows, metrics=metrics, prune=prune_schema
+            ).read_schema()
 
-    assignments = [AssignmentRow(**dict(row)) for row in rows]
+        include_overrides = "client_assignment_overrides" in schema_info.table_names
 
-    if not assignments:
-        return RunResult(invoices_written=0)
+        accumulator_plan = (
+            plan_accumulator_query(
+                conn,
+                schema_info,
+                metrics,
+                use_accumulators=use_accumulators,
+                details=details,
+                strict_rows=strict_rows,
+                validation_sample_rate=validation_sample_rate,
+                billing_backend=billing_backend,
+                planner=planner,
+            )
+            if plan_file is None
+            else None
+        )
+        query_mode = AGGREGATE_MODE if accumulator_plan is not None else mode
+        batch_backend = batch_backend and accumulator_plan is None
 
-    builder = InvoiceBuilderAgent()
-    packages = builder.build_invoices(assignments, month)
+        with metrics.stage("plan"):
+            query_plan, plan_source, template, created_indexes = asyncio.run(
+                _prepare_run(
+                    settings,
+                    schema_info=schema_info,
+                    month_start=month_start,
+                    month_end=month_end,
+                    include_overrides=include_overrides,
+                    use_plan_cache=use_plan_cache,
+                    refresh_plan=refresh_plan,
+                    mode=mode,
+                    metrics=metrics,
+                    llm=llm,
+                    llm_policy=llm_policy,
+                    planner=planner,
+                    plan_file=plan_file,
+                    load_writer_template=workers <= 1,
+                    create_indexes=create_indexes,
+                    accumulator_plan=accumulator_plan,
+                )
+            )
+        if created_indexes:
+            # The indexes were created on another connection; reopen so the plan
+            # guard and the query see them.
+            conn.close()
+            with metrics.stage("connect"):
+                conn = connect_readonly(
+                    settings.db_path,
+                    mmap_mb=settings.sqlite_mmap_mb,
+                    cache_mb=settings.sqlite_cache_mb,
+                    temp_store=temp_store,
+                )
 
-    env = _load_template()
-    template = env.get_template("invoice.html")
+        params: dict[str, Any] = {"month_start": month_start, "month_end": month_end}
+        sql = query_plan.sql
+        shard_params: dict[str, object] = {}
+        if shard_spec is not None:
+            sql, shard_params = shard_query(conn, sql, shard_spec)
+            params.update(shard_params)
+        if query_mode != AGGREGATE_MODE and stream:
+            sql = _ordered_for_streaming(sql)
 
-    invoices_written = 0
-    for package in packages:
-        invoice = package.invoice
+        plan_warnings: list[str] = []
+        if plan_guard != "off":
+            with metrics.stage("plan_guard"):
+                guard = check_query_plan(conn, sql, params)
+            plan_warnings = guard.findings + [
+                f"Suggested index: {statement}" for statement in guard.suggested_indexes
+            ]
+            if plan_guard == "reject" and not guard.ok:
+                raise ValueError("Query plan rejected: " + "; ".join(plan_warnings))
 
-        output_dir = os.path.join(settings.output_dir, invoice.client_id, month)
-        os.makedirs(output_dir, exist_ok=True)
+        builder = InvoiceBuilderAgent(metrics=metrics)
+        state = (
+            InvoiceState(
+                settings.output_dir,
+                query_mode,
+                template_fingerprint() + ("+details" if details else ""),
+            )
+            if incremental
+            else None
+        )
+        invoices: Iterable[Invoice]
+        if batch_backend:
+            invoices = _batch_invoices(
+                conn,
+                sql,
+                params,
+                months,
+                builder,
+                metrics,
+                billing_backend=billing_backend,
+                vector_threshold=vector_threshold,
+                batch_size=batch_size,
+            )
+        else:
+            build: Callable[[Any, str], InvoicePackage] = (
+                builder.build_aggregate_invoice
+                if query_mode == AGGREGATE_MODE
+                else builder.build_invoice
+            )
+            groups = query_groups(
+                conn,
+                sql,
+                params,
+                months,
+                mode=query_mode,
+                metrics=metrics,
+                stream=stream,
+                batch_size=batch_size,
+                strict_rows=strict_rows,
+                validation_sample_rate=validation_sample_rate,
+            )
+            if state is not None:
+                groups = state.changed_groups(groups)
+            invoices = (
+                build(client_rows, billing_month).invoice for billing_month, client_rows in groups
+            )
+        shard_clients: dict[str, list[str]] = {}
+        if shard_spec is not None:
+            invoices = _record_clients(invoices, shard_clients)
 
-        json_path = os.path.join(output_dir, "invoice.json")
-        with open(json_path, "w", encoding="utf-8") as handle:
-            handle.write(invoice.model_dump_json(indent=2))
+        detail_source = (
+            DetailSource(
+                settings.db_path,
+                query_plan.sql,
+                {"month_start": month_start, "month_end": month_end},
+                batch_size=batch_size,
+                conn=conn if workers <= 1 else None,
+            )
+            if details
+            else None
+        )
+        index = InvoiceIndex(settings.output_dir) if output_format == DIRS_FORMAT else None
+        try:
+            invoices_written = write_invoices(
+                invoices,
+                settings.output_dir,
+                workers=workers,
+                template=template,
+                metrics=metrics,
+                output_format=output_format,
+                months=months,
+                details=detail_source,
+                index=index,
+            )
 
-        html_path = os.path.join(output_dir, "invoice.html")
-        with open(html_path, "w", encoding="utf-8") as handle:
-            handle.write(template.render(invoice=invoice))
+            report = None
+            if state is not None:
+                state.commit(months)
+                state.close()
+                report = state.report
+            if index is not None and state is not None:
+                with metrics.stage("index"):
+                    index.remove(state.removed_keys)
+        finally:
+            if index is not None:
+                index.close()
 
-        invoices_written += 1
+        manifest_path = None
+        if shard_spec is not None:
+            manifest_path = write_manifest(
+                settings.output_dir,
+                shard_spec,
+                months,
+                query_mode,
+                query_plan.sql,
+                shard_clients,
+                shard_params,
+            )
 
-    return RunResult(invoices_written=invoices_written)
+        return RunResult(
+            invoices_written=invoices_written,
+            manifest_path=manifest_path,
+            plan_source=plan_source,
+            incremental=report,
+            plan_warnings=plan_warnings,
+            metrics=metrics,
+        )
+    finally:
+        conn.close()
@@ -0,0 +1,148 @@
+"""SQLite index of written invoices, for lookups and monthly totals without reading the files.
+
+The index lives next to the per-directory output as ``.invoice_index.db``.
+Each invoice's entry (totals, relative paths, SHA-256 of both files,
+generation time) is upserted and committed as soon as its files are written,
+so the index never lists an invoice whose files were not finished and an
+interrupted run leaves every finished file indexed. The index uses WAL with
+``synchronous=NORMAL`` so the per-invoice commits stay cheap; sharded runs
+writing to the same root serialize on those short transactions.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+from dataclasses import astuple, dataclass, fields
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+INDEX_FILENAME = ".invoice_index.db"
+
+
+@dataclass(frozen=True)
+class IndexEntry:
+    invoice_id: str
+    client_id: str
+    client_name: str
+    billing_month: str
+    currency: str
+    total_credits: float
+    total_amount_usd: int
+    line_items: int
+    json_path: str
+    html_path: str
+    json_sha256: str
+    html_sha256: str
+    size_bytes: int
+    generated_at: str
+
+
+@dataclass(frozen=True)
+class MonthTotals:
+    billing_month: str
+    currency: str
+    invoices: int
+    total_credits: float
+    total_amount_usd: int
+
+
+_COLUMNS = [column.name for column in fields(IndexEntry)]
+
+
+def _month_filter(month_spec: str) -> tuple[str, list[str]]:
+    """SQL condition for ``YYYY-MM``, ``YYYY-MM..YYYY-MM`` or a comma-separated list."""
+    if ".." in month_spec:
+        first, _, last = month_spec.partition("..")
+        return "billing_month BETWEEN ? AND ?", [first.strip(), last.strip()]
+    months = [month.strip() for month in month_spec.split(",") if month.strip()]
+    return f"billing_month IN ({', '.join('?' for _ in months)})", months
+
+
+class InvoiceIndex:
+    """Read and update the invoice index under ``output_root``."""
+
+    def __init__(self, output_root: str, timeout: float = 30.0) -> None:
+        os.makedirs(output_root, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(output_root, INDEX_FILENAME), timeout=timeout)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS invoices (
+                invoice_id TEXT NOT NULL,
+                client_id TEXT NOT NULL,
+                client_name TEXT NOT NULL,
+                billing_month TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                total_credits REAL NOT NULL,
+                total_amount_usd INTEGER NOT NULL,
+                line_items INTEGER NOT NULL,
+                json_path TEXT NOT NULL,
+                html_path TEXT NOT NULL,
+                json_sha256 TEXT NOT NULL,
+                html_sha256 TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                generated_at TEXT NOT NULL,
+                indexed_at TEXT NOT NULL,
+                PRIMARY KEY (client_id, billing_month)
+            );
+            CREATE INDEX IF NOT EXISTS idx_invoices_month ON invoices(billing_month);
+            """
+        )
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def record(self, entry: IndexEntry) -> None:
+        """Upsert and commit the entry of an invoice whose files are written."""
+        indexed_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        with self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO invoices ({', '.join(_COLUMNS)}, indexed_at) "
+                f"VALUES ({', '.join('?' for _ in _COLUMNS)}, ?)",
+                astuple(entry) + (indexed_at,),
+            )
+
+    def remove(self, keys: Iterable[tuple[str, str]]) -> None:
+        """Delete the entries of ``(client_id, billing_month)`` invoices in one transaction."""
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM invoices WHERE client_id = ? AND billing_month = ?", list(keys)
+            )
+
+    def find(
+        self, client_id: Optional[str] = None, month_spec: Optional[str] = None
+    ) -> list[IndexEntry]:
+        """Invoices for a client and/or months, ordered by month and client."""
+        conditions: list[str] = []
+        params: list[str] = []
+        if client_id:
+            conditions.append("client_id = ?")
+            params.append(client_id)
+        if month_spec:
+            condition, months = _month_filter(month_spec)
+            conditions.append(condition)
+            params.extend(months)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM invoices {where} "
+            "ORDER BY billing_month, client_id",
+            params,
+        )
+        return [IndexEntry(*row) for row in rows]
+
+    def month_totals(self, month_spec: Optional[str] = None) -> list[MonthTotals]:
+        """Invoice count and summed totals per month and currency."""
+        where, params = "", []
+        if month_spec:
+            condition, params = _month_filter(month_spec)
+            where = f"WHERE {condition}"
+        rows = self._conn.execute(
+            "SELECT billing_month, currency, COUNT(*), ROUND(SUM(total_credits), 2), "
+            f"SUM(total_amount_usd) FROM invoices {where} "
+            "GROUP BY billing_month, currency ORDER BY billing_month, currency",
+            params,
+        )
+        return [MonthTotals(*row) for row in rows]
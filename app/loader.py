@@ -0,0 +1,157 @@
+"""Load assignment rows from a cursor without per-row Pydantic validation."""
+
+from __future__ import annotations
+
+import sqlite3
+from collections import deque, namedtuple
+from itertools import chain
+from operator import itemgetter
+from typing import Iterator, Optional, Sequence, Union, get_args, get_origin
+
+from app.metrics import RunMetrics
+from app.models import AssignmentRow
+
+AssignmentRecord = namedtuple("AssignmentRecord", list(AssignmentRow.model_fields))
+
+AssignmentLike = Union[AssignmentRow, AssignmentRecord]
+
+_FAST_TYPES = {str: (str,), float: (float, int), int: (int,)}
+
+
+def _accepted_types(annotation: object) -> tuple[type, ...]:
+    if get_origin(annotation) is Union:
+        accepted: tuple[type, ...] = ()
+        for arg in get_args(annotation):
+            accepted += (type(None),) if arg is type(None) else _FAST_TYPES[arg]
+        return accepted
+    return _FAST_TYPES[annotation]
+
+
+_FIELD_TYPES = {
+    name: _accepted_types(field.annotation) for name, field in AssignmentRow.model_fields.items()
+}
+
+
+def _check_columns(description: Optional[tuple]) -> list[str]:
+    if description is None:
+        raise ValueError("Query did not return a result set")
+    columns = [column[0] for column in description]
+    expected = set(AssignmentRow.model_fields)
+    missing = expected - set(columns)
+    unexpected = set(columns) - expected
+    if missing or unexpected:
+        raise ValueError(
+            f"Query columns do not match AssignmentRow: missing={sorted(missing)}, "
+            f"unexpected={sorted(unexpected)}"
+        )
+    return columns
+
+
+def _matches_types(record: AssignmentRecord) -> bool:
+    return all(
+        isinstance(value, _FIELD_TYPES[name]) for name, value in zip(record._fields, record)
+    )
+
+
+def load_assignments(
+    cursor: sqlite3.Cursor,
+    batch_size: int = 1000,
+    strict: bool = False,
+    sample_rate: float = 0.0,
+    metrics: Optional[RunMetrics] = None,
+) -> Iterator[AssignmentLike]:
+    """Yield assignment rows from ``cursor`` in ``batch_size`` batches.
+
+    The column set is checked once against ``cursor.description`` and the first
+    row's value types against ``AssignmentRow``; rows then load as lightweight
+    ``AssignmentRecord`` tuples. ``strict`` validates every row with Pydantic
+    instead, and ``sample_rate`` (0-1) validates that fraction of rows as a spot
+    check. If the first row does not have the expected types, every row is
+    validated so Pydantic's coercion still applies. Fetching and conversion
+    are timed per batch as the "load" stage.
+    """
+    metrics = metrics or RunMetrics()
+    columns = _check_columns(cursor.description)
+    if columns == list(AssignmentRecord._fields):
+        make = AssignmentRecord._make
+    else:
+        getter = itemgetter(*(columns.index(name) for name in AssignmentRecord._fields))
+
+        def make(row: sqlite3.Row) -> AssignmentRecord:
+            return AssignmentRecord._make(getter(row))
+
+    validate_every = round(1 / sample_rate) if sample_rate > 0 else 0
+    checked_types = False
+    seen = 0
+    while True:
+        with metrics.stage("load"):
+            batch = cursor.fetchmany(batch_size)
+            records: list[AssignmentLike] = []
+            for row in batch:
+                record = make(row)
+                if not checked_types:
+                    checked_types = True
+                    strict = strict or not _matches_types(record)
+                if strict:
+                    records.append(AssignmentRow(**record._asdict()))
+                    continue
+                if validate_every and seen % validate_every == 0:
+                    AssignmentRow(**record._asdict())
+                seen += 1
+                records.append(record)
+        if not records:
+            return
+        metrics.incr("rows_loaded", len(records))
+        yield from records
+
+
+class PrefetchedCursor:
+    """Cursor view that can read rows ahead and return them before the rest of ``cursor``.
+
+    The result columns are checked against ``AssignmentRow`` once, on creation.
+    Rows read ahead (e.g. to choose a billing backend) are buffered in batches,
+    and each batch is released as soon as ``fetchmany`` hands it out, so they
+    are not held for the whole run.
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor) -> None:
+        self.description = cursor.description
+        self.columns = _check_columns(cursor.description)
+        self.buffered = 0
+        self._cursor = cursor
+        self._batches: deque[Sequence[sqlite3.Row]] = deque()
+
+    def read_ahead(self, limit: int, batch_size: int = 1000) -> int:
+        """Buffer rows in ``batch_size`` batches until ``limit`` are held; return how many are."""
+        while self.buffered < limit:
+            batch = self._cursor.fetchmany(min(max(batch_size, 1), limit - self.buffered))
+            if not batch:
+                break
+            self._batches.append(batch)
+            self.buffered += len(batch)
+        return self.buffered
+
+    def first_row_matches(self) -> bool:
+        """Whether the first buffered row has the value types of ``AssignmentRow``."""
+        if not self._batches:
+            return False
+        return _matches_types(AssignmentRecord(**dict(zip(self.columns, self._batches[0][0]))))
+
+    def unread(self, rows: Sequence[sqlite3.Row]) -> None:
+        """Put ``rows`` back in front of the buffered rows."""
+        self._batches.appendleft(rows)
+        self.buffered += len(rows)
+
+    def fetchall(self) -> list[sqlite3.Row]:
+        rows = list(chain.from_iterable(self._batches))
+        self._batches.clear()
+        self.buffered = 0
+        rows.extend(self._cursor.fetchall())
+        return rows
+
+    def fetchmany(self, size: int) -> Sequence[sqlite3.Row]:
+        if self._batches:
+            batch = self._batches.popleft()
+            self.buffered -= len(batch)
+            return batch
+        return self._cursor.fetchmany(size)
@@ -0,0 +1,131 @@
+"""Per-stage timings and counters for invoice runs, with pluggable span hooks."""
+
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Protocol, Sequence
+
+
+@dataclass
+class StageTiming:
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    calls: int = 0
+
+
+class RunHook(Protocol):
+    """Receives stage spans, e.g. to forward them to a tracer."""
+
+    def on_stage_start(self, name: str) -> None: ...
+
+    def on_stage_end(self, name: str, wall_s: float, cpu_s: float) -> None: ...
+
+
+class RunMetrics:
+    """Collect stage timings and counters for one run.
+
+    Stages may nest; each stage's time excludes the time of stages nested in
+    it, so the stage totals add up to the instrumented part of the run.
+    Repeated stages (one per batch, client or invoice) accumulate. Stages may
+    be recorded from several threads; nesting is tracked per thread. Work that
+    overlaps another stage on a helper thread is recorded with
+    ``concurrent=True`` in ``concurrent_stages`` instead, so it is reported
+    without being counted twice in the run's wall time.
+    """
+
+    def __init__(self, hooks: Sequence[RunHook] = ()) -> None:
+        self.stages: dict[str, StageTiming] = {}
+        self.concurrent_stages: dict[str, StageTiming] = {}
+        self.counters: dict[str, float] = {}
+        self._hooks = list(hooks)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def _stack(self) -> list[list[float]]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def stage(self, name: str, concurrent: bool = False) -> Iterator[None]:
+        for hook in self._hooks:
+            hook.on_stage_start(name)
+        children = [0.0, 0.0]
+        self._stack.append(children)
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][0] += wall
+                self._stack[-1][1] += cpu
+            with self._lock:
+                stages = self.concurrent_stages if concurrent else self.stages
+                timing = stages.setdefault(name, StageTiming())
+                timing.wall_s += wall - children[0]
+                timing.cpu_s += cpu - children[1]
+                timing.calls += 1
+            for hook in self._hooks:
+                hook.on_stage_end(name, wall, cpu)
+
+    def incr(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_dict(self) -> dict:
+        return {
+            "stages": _timings_dict(self.stages),
+            "concurrent_stages": _timings_dict(self.concurrent_stages),
+            "counters": dict(self.counters),
+        }
+
+    def to_prometheus(self, prefix: str = "invoice_run") -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        lines: list[str] = []
+        for kind, stages in (("stage", self.stages), ("concurrent_stage", self.concurrent_stages)):
+            lines.append(f"# TYPE {prefix}_{kind}_wall_seconds gauge")
+            lines.extend(
+                f'{prefix}_{kind}_wall_seconds{{stage="{name}"}} {timing.wall_s:.6f}'
+                for name, timing in stages.items()
+            )
+            lines.append(f"# TYPE {prefix}_{kind}_cpu_seconds gauge")
+            lines.extend(
+                f'{prefix}_{kind}_cpu_seconds{{stage="{name}"}} {timing.cpu_s:.6f}'
+                for name, timing in stages.items()
+            )
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            rendered = str(int(value)) if float(value).is_integer() else repr(float(value))
+            lines.append(f"{prefix}_{name} {rendered}")
+        return "\n".join(lines) + "\n"
+
+
+def _timings_dict(stages: dict[str, StageTiming]) -> dict[str, dict]:
+    return {
+        name: {
+            "wall_s": round(timing.wall_s, 6),
+            "cpu_s": round(timing.cpu_s, 6),
+            "calls": timing.calls,
+        }
+        for name, timing in stages.items()
+    }
+
+
+def write_prometheus_textfile(metrics: RunMetrics, path: str) -> None:
+    """Write a textfile-collector file atomically so the exporter never reads a partial file."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(handle, "w", encoding="utf-8") as temp_file:
+        temp_file.write(metrics.to_prometheus())
+    os.replace(temp_path, path)
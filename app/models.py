@@ -1,9 +1,10 @@
 from __future__ import annotations
 
-from decimal import Decimal
 from typing import List, Optional
 
-from pydantic import BaseModel, ConfigDict, model_validator
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+from app.fixed_point import credits_from_float
 
 
 class AssignmentRow(BaseModel):
@@ -23,6 +24,21 @@ class AssignmentRow(BaseModel):
     credit_value_override_usd: Optional[int] = None
 
 
+class AssignmentAggregateRow(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    billing_month: str
+    client_id: str
+    client_name: str
+    currency: str
+    assignment_type: str
+    quantity: int
+    default_credits: float
+    default_credit_value_usd: int
+    credits_override: Optional[float] = None
+    credit_value_override_usd: Optional[int] = None
+
+
 class InvoiceLineItem(BaseModel):
     model_config = ConfigDict(extra="forbid")
 
@@ -33,6 +49,14 @@ class InvoiceLineItem(BaseModel):
     line_credits: float
     unit_credit_value_usd: int
     line_amount_usd: int
+    # Exact fixed-point credits set by the builder; not serialized.
+    line_credits_hundredths: Optional[int] = Field(default=None, exclude=True, repr=False)
+
+    @property
+    def credits_hundredths(self) -> int:
+        if self.line_credits_hundredths is not None:
+            return self.line_credits_hundredths
+        return credits_from_float(self.line_credits)
 
 
 class Invoice(BaseModel):
@@ -47,13 +71,19 @@ class Invoice(BaseModel):
     total_credits: float
     total_amount_usd: int
     generated_at: str
+    total_credits_hundredths: Optional[int] = Field(default=None, exclude=True, repr=False)
 
     @model_validator(mode="after")
     def check_totals(self) -> "Invoice":
-        credits_sum = sum(Decimal(str(item.line_credits)) for item in self.line_items)
-        amount_sum = sum(Decimal(item.line_amount_usd) for item in self.line_items)
-        if credits_sum and abs(credits_sum - Decimal(str(self.total_credits))) > Decimal("0.0001"):
+        credits_sum = sum(item.credits_hundredths for item in self.line_items)
+        amount_sum = sum(item.line_amount_usd for item in self.line_items)
+        total_credits = (
+            self.total_credits_hundredths
+            if self.total_credits_hundredths is not None
+            else credits_from_float(self.total_credits)
+        )
+        if credits_sum and credits_sum != total_credits:
             raise ValueError("total_credits does not match line items")
-        if amount_sum and int(amount_sum) != int(self.total_amount_usd):
+        if amount_sum and amount_sum != self.total_amount_usd:
             raise ValueError("total_amount_usd does not match line items")
         return self
@@ -0,0 +1,56 @@
+"""Billing month specs: ``YYYY-MM``, ``YYYY-MM..YYYY-MM`` ranges and comma-separated lists."""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Sequence
+
+
+def _parse_month(month: str) -> datetime:
+    try:
+        return datetime.strptime(month, "%Y-%m")
+    except ValueError as exc:
+        raise ValueError("Month must be in YYYY-MM format") from exc
+
+
+def _next_month(start: datetime) -> datetime:
+    if start.month == 12:
+        return datetime(start.year + 1, 1, 1)
+    return datetime(start.year, start.month + 1, 1)
+
+
+def month_bounds(month: str) -> tuple[str, str]:
+    """Return YYYY-MM-01 (inclusive) and next-month YYYY-MM-01 (exclusive).
+
+    ``month`` may also be a range ``YYYY-MM..YYYY-MM``; the bounds then cover
+    the first month through the end of the last one.
+    """
+    first, _, last = month.partition("..")
+    start = _parse_month(first.strip())
+    end = _parse_month(last.strip()) if last else start
+    if end < start:
+        raise ValueError("Month range must not end before it starts")
+    return start.strftime("%Y-%m-%d"), _next_month(end).strftime("%Y-%m-%d")
+
+
+def parse_months(spec: str) -> list[str]:
+    """Expand ``YYYY-MM``, ``YYYY-MM..YYYY-MM`` or comma-separated lists into sorted months."""
+    months: set[str] = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_text, end_text = month_bounds(part)
+        current = datetime.strptime(start_text, "%Y-%m-%d")
+        end = datetime.strptime(end_text, "%Y-%m-%d")
+        while current < end:
+            months.add(current.strftime("%Y-%m"))
+            current = _next_month(current)
+    if not months:
+        raise ValueError("Month must be in YYYY-MM format")
+    return sorted(months)
+
+
+def month_window(months: Sequence[str]) -> tuple[str, str]:
+    """Return the bounds covering sorted ``months``, first month through the end of the last."""
+    return month_bounds(months[0])[0], month_bounds(months[-1])[1]
@@ -0,0 +1,271 @@
+"""Persist generated SQL plans so unchanged schemas skip the LLM round-trip."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from app.agents.sql_writer import SQLQueryPlan
+
+# Bump when the cache tables change; older cache files are dropped and rebuilt.
+_CACHE_SCHEMA_VERSION = 3
+# Plans kept across all schemas; the least recently used ones are evicted first.
+DEFAULT_MAX_ENTRIES = 256
+
+_SAMPLE_ROWS_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_schema_text(schema_text: str) -> str:
+    """Drop sample-row comments and collapse whitespace so only structure is hashed."""
+    without_samples = _SAMPLE_ROWS_RE.sub(" ", schema_text)
+    return _WHITESPACE_RE.sub(" ", without_samples).strip()
+
+
+def schema_fingerprint(schema_text: str) -> str:
+    normalized = normalize_schema_text(schema_text)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class PlanKey:
+    schema_hash: str
+    include_overrides: bool
+    prompt_version: str
+    model: str
+    mode: str = "rows"
+
+    @property
+    def cache_key(self) -> str:
+        raw = "|".join(
+            [
+                self.schema_hash,
+                str(int(self.include_overrides)),
+                self.prompt_version,
+                self.model,
+                self.mode,
+            ]
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class PlanCacheEntry:
+    cache_key: str
+    schema_hash: str
+    include_overrides: bool
+    prompt_version: str
+    model: str
+    mode: str
+    created_at: str
+    llm_seconds: float
+    hit_count: int
+    last_used_at: str = ""
+
+
+@dataclass
+class PlanCacheStats:
+    hits: int
+    misses: int
+    llm_seconds_saved: float
+
+
+class PlanCache:
+    """SQLite-backed store of SQL plans keyed by schema fingerprint and prompt inputs.
+
+    Plans for different schemas live side by side (tenant groups share one
+    cache); at most ``max_entries`` are kept, least recently used first out.
+    """
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self._max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.row_factory = sqlite3.Row
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != _CACHE_SCHEMA_VERSION:
+            self._conn.executescript(
+                f"""
+                DROP TABLE IF EXISTS plans;
+                DROP TABLE IF EXISTS stats;
+                PRAGMA user_version = {_CACHE_SCHEMA_VERSION};
+                """
+            )
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS plans (
+                cache_key TEXT PRIMARY KEY,
+                schema_hash TEXT NOT NULL,
+                include_overrides INTEGER NOT NULL,
+                prompt_version TEXT NOT NULL,
+                model TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                notes TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                llm_seconds REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0,
+                last_used_at TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def get(self, key: PlanKey) -> SQLQueryPlan | None:
+        """Return the cached plan for ``key`` and record the hit or miss."""
+        row = self._conn.execute(
+            "SELECT sql, notes, llm_seconds FROM plans WHERE cache_key = ?",
+            (key.cache_key,),
+        ).fetchone()
+        with self._conn:
+            if row is None:
+                self._bump("misses", 1)
+                return None
+            self._conn.execute(
+                "UPDATE plans SET hit_count = hit_count + 1, last_used_at = ? WHERE cache_key = ?",
+                (_now(), key.cache_key),
+            )
+            self._bump("hits", 1)
+            self._bump("llm_seconds_saved", row["llm_seconds"])
+        return SQLQueryPlan(sql=row["sql"], notes=row["notes"])
+
+    def put(self, key: PlanKey, plan: SQLQueryPlan, llm_seconds: float) -> None:
+        """Store ``plan``, replacing older plans for its schema, and trim the cache to size.
+
+        Plans of the same schema, model, mode and flags made with another prompt
+        version are replaced; plans of other schemas are kept.
+        """
+        created_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        with self._conn:
+            self._conn.execute(
+                """
+                DELETE FROM plans
+                WHERE schema_hash = ? AND model = ? AND mode = ? AND include_overrides = ?
+                  AND cache_key != ?
+                """,
+                (key.schema_hash, key.model, key.mode, int(key.include_overrides), key.cache_key),
+            )
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO plans (
+                    cache_key, schema_hash, include_overrides, prompt_version, model, mode,
+                    sql, notes, created_at, llm_seconds, hit_count, last_used_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
+                """,
+                (
+                    key.cache_key,
+                    key.schema_hash,
+                    int(key.include_overrides),
+                    key.prompt_version,
+                    key.model,
+                    key.mode,
+                    plan.sql,
+                    plan.notes,
+                    created_at,
+                    llm_seconds,
+                    _now(),
+                ),
+            )
+            self._conn.execute(
+                """
+                DELETE FROM plans WHERE cache_key IN (
+                    SELECT cache_key FROM plans ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (max(self._max_entries, 1),),
+            )
+
+    def entries(self) -> list[PlanCacheEntry]:
+        rows = self._conn.execute(
+            """
+            SELECT cache_key, schema_hash, include_overrides, prompt_version, model, mode,
+                   created_at, llm_seconds, hit_count, last_used_at
+            FROM plans
+            ORDER BY created_at DESC
+            """
+        ).fetchall()
+        return [
+            PlanCacheEntry(
+                cache_key=row["cache_key"],
+                schema_hash=row["schema_hash"],
+                include_overrides=bool(row["include_overrides"]),
+                prompt_version=row["prompt_version"],
+                model=row["model"],
+                mode=row["mode"],
+                created_at=row["created_at"],
+                llm_seconds=row["llm_seconds"],
+                hit_count=row["hit_count"],
+                last_used_at=row["last_used_at"],
+            )
+            for row in rows
+        ]
+
+    def stats(self) -> PlanCacheStats:
+        values = {
+            row["name"]: row["value"]
+            for row in self._conn.execute("SELECT name, value FROM stats")
+        }
+        return PlanCacheStats(
+            hits=int(values.get("hits", 0)),
+            misses=int(values.get("misses", 0)),
+            llm_seconds_saved=float(values.get("llm_seconds_saved", 0.0)),
+        )
+
+    def _bump(self, name: str, amount: float) -> None:
+        self._conn.execute(
+            """
+            INSERT INTO stats (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+            """,
+            (name, amount),
+        )
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+
+def write_plan_file(
+    path: str, plan: SQLQueryPlan, schema_hash: str, mode: str, plan_source: str
+) -> None:
+    """Save a plan as JSON so shards or other nodes can run it without planning again."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    payload = {
+        "sql": plan.sql,
+        "notes": plan.notes,
+        "mode": mode,
+        "schema_hash": schema_hash,
+        "plan_source": plan_source,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as handle:
+        json.dump(payload, handle, indent=2)
+    os.replace(temp_path, path)
+
+
+def read_plan_file(path: str, schema_hash: str, mode: str) -> SQLQueryPlan:
+    """Load a plan saved by ``write_plan_file``, refusing one made for another schema or mode."""
+    with open(path, encoding="utf-8") as handle:
+        payload = json.load(handle)
+    if payload.get("mode") != mode:
+        raise ValueError(f"Plan file {path} is for {payload.get('mode')} mode, not {mode}")
+    if payload.get("schema_hash") != schema_hash:
+        raise ValueError(f"Plan file {path} was made for a different schema; plan again")
+    return SQLQueryPlan(sql=payload["sql"], notes=payload.get("notes", ""))
@@ -0,0 +1,118 @@
+"""Check LLM-generated SQL with EXPLAIN QUERY PLAN before it runs, and advise on indexes."""
+
+from __future__ import annotations
+
+import re
+import sqlite3
+from dataclasses import dataclass, field
+
+# Indexes the month query needs; keyed by table so advice only covers tables that exist.
+RECOMMENDED_INDEXES = {
+    "assignments": (
+        "CREATE INDEX IF NOT EXISTS idx_assignments_status_completed_client "
+        "ON assignments(status, completed_at, client_id)"
+    ),
+}
+
+_TABLE_REF_RE = re.compile(
+    r"\b(?:from|join)\s+([A-Za-z_][\w]*)(?:\s+(?:as\s+)?([A-Za-z_][\w]*))?",
+    re.IGNORECASE,
+)
+_NOT_ALIASES = {
+    "where", "join", "left", "right", "inner", "outer", "cross", "on", "using",
+    "group", "order", "limit", "natural", "full",
+}
+_WHERE_RE = re.compile(r"\bwhere\b(.*?)(?:\bgroup\s+by\b|\border\s+by\b|\blimit\b|$)", re.I | re.S)
+_WRAPPED_COLUMN_RE = re.compile(r"\b\w+\s*\(\s*(?:\w+\.)?completed_at\b", re.IGNORECASE)
+
+
+@dataclass
+class QueryPlanReport:
+    plan: list[str]
+    findings: list[str] = field(default_factory=list)
+    suggested_indexes: list[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.findings
+
+
+def _alias_map(sql: str) -> dict[str, str]:
+    aliases: dict[str, str] = {}
+    for table, alias in _TABLE_REF_RE.findall(sql):
+        aliases[table.lower()] = table.lower()
+        if alias and alias.lower() not in _NOT_ALIASES:
+            aliases[alias.lower()] = table.lower()
+    return aliases
+
+
+def _estimated_rows(conn: sqlite3.Connection, table: str) -> int:
+    """Cheap row estimate: ``max(rowid)`` rather than a full ``COUNT(*)``."""
+    try:
+        row = conn.execute(f'SELECT max(rowid) FROM "{table}"').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return int(row[0] or 0)
+
+
+def _existing_indexes(conn: sqlite3.Connection) -> set[str]:
+    return {
+        row[0]
+        for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    }
+
+
+def missing_indexes(conn: sqlite3.Connection) -> list[str]:
+    """Return CREATE INDEX statements for recommended indexes not yet in the database."""
+    tables = {
+        row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+    existing = _existing_indexes(conn)
+    statements = []
+    for table, statement in RECOMMENDED_INDEXES.items():
+        name = statement.split("EXISTS ", 1)[1].split(" ", 1)[0]
+        if table in tables and name not in existing:
+            statements.append(statement)
+    return statements
+
+
+def create_recommended_indexes(conn: sqlite3.Connection) -> list[str]:
+    """Create any missing recommended indexes and return the statements that ran."""
+    statements = missing_indexes(conn)
+    with conn:
+        for statement in statements:
+            conn.execute(statement)
+    return statements
+
+
+def check_query_plan(
+    conn: sqlite3.Connection,
+    sql: str,
+    params: dict[str, str],
+    large_table_rows: int = 10_000,
+) -> QueryPlanReport:
+    """Run ``EXPLAIN QUERY PLAN`` on ``sql`` and flag full scans of large tables.
+
+    Also flags functions applied to ``completed_at`` in the WHERE clause, which
+    stop SQLite from using an index on that column.
+    """
+    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    report = QueryPlanReport(plan=plan)
+    aliases = _alias_map(sql)
+
+    for detail in plan:
+        if not detail.startswith("SCAN "):
+            continue
+        name = detail.split()[1].lower()
+        table = aliases.get(name, name)
+        rows = _estimated_rows(conn, table)
+        if rows >= large_table_rows:
+            report.findings.append(f"Full scan of {table} (~{rows} rows): {detail}")
+
+    where = _WHERE_RE.search(sql)
+    if where and _WRAPPED_COLUMN_RE.search(where.group(1)):
+        report.findings.append("A function is applied to completed_at in WHERE; indexes cannot be used")
+
+    if report.findings:
+        report.suggested_indexes = missing_indexes(conn)
+    return report
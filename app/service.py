@@ -0,0 +1,302 @@
+"""Resident invoice service that keeps connections, schema, plans and template warm.
+
+Jobs ask for a month (``{"month": "2025-11"}``) or one client's invoice for a
+month (``{"month": "2025-11", "client_id": "C001"}``). They are served over a
+local HTTP endpoint or read as JSON lines from a file or stdin.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import IO, TYPE_CHECKING, Any, Optional
+
+from app.agents.schema_reader import SchemaInfo, SchemaReaderAgent
+from app.agents.invoice_builder import InvoiceBuilderAgent
+from app.agents.sql_writer import AGGREGATE_MODE, ROWS_MODE, LLMCallPolicy, SQLQueryPlan
+from app.config import Settings, load_settings
+from app.db import connect_readonly
+from app.invoice_index import InvoiceIndex
+from app.invoice import aplan_query, query_groups
+from app.metrics import RunMetrics
+from app.months import month_window, parse_months
+from app.writer import load_template, write_invoices
+
+if TYPE_CHECKING:
+    from jinja2 import Template
+    from langchain_core.language_models import BaseChatModel
+
+
+@dataclass
+class InvoiceJob:
+    month: str
+    client_id: Optional[str] = None
+    mode: str = ROWS_MODE
+    request_id: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, payload: dict[str, Any]) -> "InvoiceJob":
+        if not isinstance(payload, dict) or not payload.get("month"):
+            raise ValueError('Job must be a JSON object with a "month"')
+        return cls(
+            month=str(payload["month"]),
+            client_id=payload.get("client_id"),
+            mode=payload.get("mode", ROWS_MODE),
+            request_id=payload.get("request_id"),
+        )
+
+
+@dataclass
+class JobResult:
+    job: InvoiceJob
+    invoices_written: int = 0
+    plan_source: str = ""
+    elapsed_s: float = 0.0
+    error: Optional[str] = None
+    metrics: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            **{key: value for key, value in asdict(self.job).items() if value is not None},
+            "ok": self.ok,
+            "invoices_written": self.invoices_written,
+            "plan_source": self.plan_source,
+            "elapsed_s": round(self.elapsed_s, 6),
+            "error": self.error,
+            "metrics": self.metrics,
+        }
+
+
+def _for_client(sql: str) -> str:
+    """Wrap ``sql`` so only one client's rows are returned."""
+    return f"SELECT * FROM ({sql}) WHERE client_id = :client_id"
+
+
+class InvoiceService:
+    """Serve invoice jobs from warm state with a bounded worker queue.
+
+    Each worker thread keeps one SQLite connection open. The schema is read
+    once and the plan for each mode is made once; both are refreshed when
+    ``PRAGMA schema_version`` changes. The HTML template is compiled once.
+    ``submit`` blocks while ``queue_size`` jobs are already waiting or running.
+    """
+
+    def __init__(
+        self,
+        settings: Optional[Settings] = None,
+        workers: int = 2,
+        queue_size: int = 16,
+        planner: str = "auto",
+        use_plan_cache: bool = True,
+        llm: Optional[BaseChatModel] = None,
+        llm_policy: Optional[LLMCallPolicy] = None,
+    ) -> None:
+        self.settings = settings or load_settings()
+        self._planner = planner
+        self._use_plan_cache = use_plan_cache
+        self._llm = llm
+        self._llm_policy = llm_policy
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="invoice-job")
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._schema: Optional[SchemaInfo] = None
+        self._schema_version: Optional[int] = None
+        self._plans: dict[str, tuple[SQLQueryPlan, str]] = {}
+        self._plan_locks = {mode: threading.Lock() for mode in (ROWS_MODE, AGGREGATE_MODE)}
+        self._template: Template = load_template()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Only this worker uses the connection; close() may run on another thread.
+            conn = self._local.conn = connect_readonly(
+                self.settings.db_path,
+                check_same_thread=False,
+                mmap_mb=self.settings.sqlite_mmap_mb,
+                cache_mb=self.settings.sqlite_cache_mb,
+            )
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _schema_for(
+        self, conn: sqlite3.Connection, metrics: RunMetrics
+    ) -> tuple[SchemaInfo, int]:
+        schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        with self._lock:
+            if schema_version != self._schema_version:
+                self._schema = SchemaReaderAgent(conn, metrics=metrics, prune=True).read_schema()
+                self._schema_version = schema_version
+                self._plans.clear()
+            assert self._schema is not None
+            return self._schema, schema_version
+
+    def _plan(
+        self, conn: sqlite3.Connection, mode: str, metrics: RunMetrics
+    ) -> tuple[SQLQueryPlan, str]:
+        schema, schema_version = self._schema_for(conn, metrics)
+        # Planning may wait on the LLM: hold only this mode's lock so other
+        # workers keep opening connections and serving already planned modes.
+        with self._plan_locks[mode]:
+            with self._lock:
+                if schema_version == self._schema_version and mode in self._plans:
+                    return self._plans[mode]
+            plan = asyncio.run(
+                aplan_query(
+                    self.settings,
+                    schema_info=schema,
+                    month_start="",
+                    month_end="",
+                    include_overrides="client_assignment_overrides" in schema.table_names,
+                    use_plan_cache=self._use_plan_cache,
+                    refresh_plan=False,
+                    mode=mode,
+                    metrics=metrics,
+                    llm=self._llm,
+                    llm_policy=self._llm_policy,
+                    planner=self._planner,
+                )
+            )
+            with self._lock:
+                if schema_version == self._schema_version:
+                    self._plans[mode] = plan
+            return plan
+
+    def process(self, job: InvoiceJob) -> JobResult:
+        """Run one job on the calling thread and report the outcome instead of raising."""
+        started = time.perf_counter()
+        metrics = RunMetrics()
+        result = JobResult(job=job)
+        try:
+            if job.mode not in (ROWS_MODE, AGGREGATE_MODE):
+                raise ValueError(f"Unknown query mode: {job.mode}")
+            months = parse_months(job.month)
+            month_start, month_end = month_window(months)
+            conn = self._connection()
+            query_plan, result.plan_source = self._plan(conn, job.mode, metrics)
+
+            sql = query_plan.sql
+            params = {"month_start": month_start, "month_end": month_end}
+            if job.client_id is not None:
+                sql = _for_client(sql)
+                params["client_id"] = job.client_id
+            builder = InvoiceBuilderAgent(metrics=metrics)
+            build = (
+                builder.build_aggregate_invoice
+                if job.mode == AGGREGATE_MODE
+                else builder.build_invoice
+            )
+            groups = query_groups(conn, sql, params, months, mode=job.mode, metrics=metrics)
+            index = InvoiceIndex(self.settings.output_dir)
+            try:
+                result.invoices_written = write_invoices(
+                    (build(rows, billing_month).invoice for billing_month, rows in groups),
+                    self.settings.output_dir,
+                    template=self._template,
+                    metrics=metrics,
+                    index=index,
+                )
+            finally:
+                index.close()
+        except Exception as exc:
+            result.error = f"{type(exc).__name__}: {exc}"
+        result.elapsed_s = time.perf_counter() - started
+        result.metrics = metrics.to_dict()
+        return result
+
+    def submit(self, job: InvoiceJob) -> "Future[JobResult]":
+        """Queue ``job`` for a worker, blocking while the queue is full."""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self.process, job)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+def serve_jsonl(service: InvoiceService, source: IO[str], sink: IO[str]) -> int:
+    """Run one job per JSON line of ``source`` and write results to ``sink`` in input order.
+
+    Returns the number of failed jobs.
+    """
+    pending: list[Future[JobResult] | JobResult] = []
+    for line in source:
+        if not line.strip():
+            continue
+        try:
+            job = InvoiceJob.from_dict(json.loads(line))
+        except (ValueError, TypeError) as exc:
+            pending.append(JobResult(job=InvoiceJob(month=""), error=f"Invalid job: {exc}"))
+            continue
+        pending.append(service.submit(job))
+
+    failures = 0
+    for item in pending:
+        result = item if isinstance(item, JobResult) else item.result()
+        failures += not result.ok
+        sink.write(json.dumps(result.to_dict()) + "\n")
+        sink.flush()
+    return failures
+
+
+class _JobHandler(BaseHTTPRequestHandler):
+    service: InvoiceService
+
+    def do_GET(self) -> None:
+        if self.path != "/health":
+            self._reply(404, {"error": "Not found"})
+            return
+        self._reply(200, {"ok": True})
+
+    def do_POST(self) -> None:
+        if self.path != "/jobs":
+            self._reply(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = InvoiceJob.from_dict(json.loads(self.rfile.read(length) or b"{}"))
+        except (ValueError, TypeError) as exc:
+            self._reply(400, {"ok": False, "error": f"Invalid job: {exc}"})
+            return
+        result = self.service.submit(job).result()
+        self._reply(200 if result.ok else 500, result.to_dict())
+
+    def _reply(self, status: int, payload: dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def make_http_server(
+    service: InvoiceService, host: str = "127.0.0.1", port: int = 8765
+) -> ThreadingHTTPServer:
+    """Create an HTTP server: ``POST /jobs`` with a job object, ``GET /health``."""
+    handler = type("JobHandler", (_JobHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
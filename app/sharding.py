@@ -0,0 +1,214 @@
+"""Split a run into client shards and check that the shards cover every client once.
+
+A shard ``i/N`` (0-based) keeps the clients whose ``client_id`` hashes to ``i``
+(``crc32 % N``), or that fall in the ``i``-th of ``N`` contiguous ``client_id``
+ranges taken from the ``clients`` table. The predicate wraps the planned SQL,
+so SQLite filters rows before they are loaded. Each shard writes a manifest
+that ``check_shards`` merges.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional, Sequence
+
+from app.agents.sql_writer import AGGREGATE_MODE
+
+HASH_STRATEGY = "hash"
+RANGE_STRATEGY = "range"
+MANIFEST_DIR = "manifests"
+
+
+@dataclass(frozen=True)
+class ShardSpec:
+    index: int
+    count: int
+    strategy: str = HASH_STRATEGY
+
+    @classmethod
+    def parse(cls, text: str, strategy: str = HASH_STRATEGY) -> "ShardSpec":
+        """Parse ``i/N`` with ``0 <= i < N``."""
+        try:
+            index_text, count_text = text.split("/")
+            index, count = int(index_text), int(count_text)
+        except ValueError as exc:
+            raise ValueError("Shard must look like i/N, e.g. 0/4") from exc
+        if count < 1 or not 0 <= index < count:
+            raise ValueError("Shard index must be between 0 and N-1")
+        if strategy not in (HASH_STRATEGY, RANGE_STRATEGY):
+            raise ValueError(f"Unknown shard strategy: {strategy}")
+        return cls(index=index, count=count, strategy=strategy)
+
+    @property
+    def label(self) -> str:
+        return f"{self.index}/{self.count}"
+
+
+def client_shard(client_id: str, count: int) -> int:
+    """Stable hash partition of ``client_id``; the same on every host and Python run."""
+    return zlib.crc32(str(client_id).encode("utf-8")) % count
+
+
+def range_bounds(conn: sqlite3.Connection, count: int) -> list[Optional[str]]:
+    """Split the sorted ``clients.client_id`` values into ``count`` ranges.
+
+    Returns ``count + 1`` bounds; ``None`` marks the open first and last ends.
+    Without clients every bound is ``None``: there are no rows to split.
+    """
+    client_ids = [
+        row[0] for row in conn.execute("SELECT client_id FROM clients ORDER BY client_id")
+    ]
+    if not client_ids:
+        return [None] * (count + 1)
+    bounds: list[Optional[str]] = [None]
+    for shard in range(1, count):
+        position = shard * len(client_ids) // count
+        bounds.append(client_ids[position] if position < len(client_ids) else client_ids[-1])
+    bounds.append(None)
+    return bounds
+
+
+def shard_query(
+    conn: sqlite3.Connection, sql: str, shard: ShardSpec
+) -> tuple[str, dict[str, object]]:
+    """Wrap ``sql`` with the shard predicate and return it with its extra parameters.
+
+    Registers the ``invoice_shard`` SQL function on ``conn`` for hash sharding.
+    """
+    if shard.strategy == HASH_STRATEGY:
+        conn.create_function("invoice_shard", 2, client_shard, deterministic=True)
+        return (
+            f"SELECT * FROM ({sql}) WHERE invoice_shard(client_id, :shard_count) = :shard_index",
+            {"shard_count": shard.count, "shard_index": shard.index},
+        )
+    bounds = range_bounds(conn, shard.count)
+    return (
+        f"SELECT * FROM ({sql}) WHERE (:shard_low IS NULL OR client_id >= :shard_low) "
+        "AND (:shard_high IS NULL OR client_id < :shard_high)",
+        {"shard_low": bounds[shard.index], "shard_high": bounds[shard.index + 1]},
+    )
+
+
+def manifest_dir(output_root: str, months: Sequence[str]) -> str:
+    return os.path.join(output_root, MANIFEST_DIR, "_".join(months))
+
+
+def write_manifest(
+    output_root: str,
+    shard: ShardSpec,
+    months: Sequence[str],
+    mode: str,
+    plan_sql: str,
+    clients: dict[str, list[str]],
+    shard_params: dict[str, object],
+) -> str:
+    """Record which client-months this shard wrote; written atomically."""
+    directory = manifest_dir(output_root, months)
+    os.makedirs(directory, exist_ok=True)
+    payload = {
+        "shard": shard.label,
+        "index": shard.index,
+        "count": shard.count,
+        "strategy": shard.strategy,
+        "shard_params": shard_params,
+        "months": list(months),
+        "mode": mode,
+        "plan_sql": plan_sql,
+        "plan_sha256": hashlib.sha256(plan_sql.encode("utf-8")).hexdigest(),
+        "invoices": {month: sorted(clients.get(month, [])) for month in months},
+        "invoices_written": sum(len(ids) for ids in clients.values()),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    path = os.path.join(directory, f"shard-{shard.index:03d}-of-{shard.count:03d}.json")
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as handle:
+        json.dump(payload, handle, indent=2)
+    os.replace(temp_path, path)
+    return path
+
+
+@dataclass
+class ShardCheckReport:
+    shards_found: int
+    problems: list[str] = field(default_factory=list)
+    missing: list[str] = field(default_factory=list)
+    duplicated: list[str] = field(default_factory=list)
+    unexpected: list[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not (self.problems or self.missing or self.duplicated or self.unexpected)
+
+
+def check_shards(
+    output_root: str,
+    months: Sequence[str],
+    count: int,
+    conn: Optional[sqlite3.Connection] = None,
+    params: Optional[dict[str, str]] = None,
+) -> ShardCheckReport:
+    """Merge the shard manifests for ``months`` and check the shards against each other.
+
+    Every shard ``0..count-1`` must be present, with the same plan, and no
+    client-month may be written twice. With ``conn`` and the month ``params``,
+    the shared plan is also run unsharded to check every expected client-month
+    was written by some shard (IDs are reported as ``CLIENT@YYYY-MM``).
+    """
+    directory = manifest_dir(output_root, months)
+    manifests = {}
+    for index in range(count):
+        path = os.path.join(directory, f"shard-{index:03d}-of-{count:03d}.json")
+        try:
+            with open(path, encoding="utf-8") as handle:
+                manifests[index] = json.load(handle)
+        except FileNotFoundError:
+            pass
+    report = ShardCheckReport(shards_found=len(manifests))
+    report.problems.extend(
+        f"Missing manifest for shard {index}/{count}"
+        for index in range(count)
+        if index not in manifests
+    )
+    if not manifests:
+        return report
+
+    plans = {manifest["plan_sha256"] for manifest in manifests.values()}
+    if len(plans) > 1:
+        report.problems.append("Shards ran different query plans")
+    strategies = {manifest["strategy"] for manifest in manifests.values()}
+    if len(strategies) > 1:
+        report.problems.append("Shards used different strategies: " + ", ".join(sorted(strategies)))
+
+    owners: dict[str, int] = {}
+    for index, manifest in sorted(manifests.items()):
+        for month, client_ids in manifest["invoices"].items():
+            for client_id in client_ids:
+                invoice_id = f"{client_id}@{month}"
+                if invoice_id in owners:
+                    report.duplicated.append(
+                        f"{invoice_id} (shards {owners[invoice_id]} and {index})"
+                    )
+                else:
+                    owners[invoice_id] = index
+
+    if conn is not None and params is not None:
+        first = next(iter(manifests.values()))
+        month_column = (
+            "billing_month" if first["mode"] == AGGREGATE_MODE else "substr(completed_at, 1, 7)"
+        )
+        expected = {
+            f"{row[1]}@{row[0]}"
+            for row in conn.execute(
+                f"SELECT DISTINCT {month_column}, client_id FROM ({first['plan_sql']})", params
+            )
+            if row[0] in months
+        }
+        report.missing = sorted(expected - owners.keys())
+        report.unexpected = sorted(owners.keys() - expected)
+    return report
@@ -0,0 +1,343 @@
+"""Run billing months across many tenant databases on a bounded process pool.
+
+Tenants are grouped by the DDL of their tables in ``sqlite_master``. Each
+group's schema is read once, from its first database, and planned once
+(compiler, plan cache or a single LLM call; groups are planned concurrently).
+The plan is saved as a plan file under ``.plans/`` and every tenant of the
+group runs it with the shared schema, so 50 tenants on a few schema versions
+cost a few planning calls. Each tenant writes to ``{output_root}/{tenant}/``
+and one report covering every tenant is written to ``fanout-report.json``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
+from typing import TYPE_CHECKING, Any, Optional, Sequence
+
+from app.agents.schema_reader import SchemaInfo, SchemaReaderAgent
+from app.agents.sql_writer import ROWS_MODE, LLMCallPolicy
+from app.config import Settings, load_settings
+from app.db import connect_readonly
+from app.invoice import aplan_query, plan_accumulator_query, run
+from app.metrics import RunMetrics
+from app.months import month_window, parse_months
+from app.plan_cache import schema_fingerprint, write_plan_file
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+REPORT_NAME = "fanout-report.json"
+PLAN_DIR = ".plans"
+
+
+@dataclass
+class TenantResult:
+    tenant: str
+    db_path: str
+    output_dir: str
+    schema_group: str = ""
+    invoices_written: int = 0
+    plan_source: str = ""
+    elapsed_s: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class FanOutReport:
+    month: str
+    tenants: list[TenantResult] = field(default_factory=list)
+    # Schema group -> tenants, plan source and plan file (or planning error).
+    plans: dict[str, dict[str, Any]] = field(default_factory=dict)
+    elapsed_s: float = 0.0
+    report_path: str = ""
+
+    @property
+    def failed(self) -> list[TenantResult]:
+        return [result for result in self.tenants if not result.ok]
+
+    @property
+    def invoices_written(self) -> int:
+        return sum(result.invoices_written for result in self.tenants)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "month": self.month,
+            "tenants_total": len(self.tenants),
+            "tenants_failed": len(self.failed),
+            "invoices_written": self.invoices_written,
+            "schema_groups": len(self.plans),
+            "elapsed_s": round(self.elapsed_s, 3),
+            "plans": self.plans,
+            "tenants": [asdict(result) for result in self.tenants],
+            "errors": {result.tenant: result.error for result in self.failed},
+        }
+
+
+def resolve_databases(patterns: Sequence[str]) -> list[str]:
+    """Expand paths and glob patterns into a de-duplicated list of database paths."""
+    paths: list[str] = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            raise ValueError(f"No databases match {pattern}")
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+
+def tenant_name(db_path: str) -> str:
+    return os.path.splitext(os.path.basename(db_path))[0]
+
+
+def _ddl_fingerprint(db_path: str) -> str:
+    conn = connect_readonly(db_path)
+    try:
+        digest = hashlib.sha256()
+        for name, sql in conn.execute(
+            "SELECT name, sql FROM sqlite_master "
+            "WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        ):
+            digest.update(f"{name}\n{sql}\n".encode("utf-8"))
+        return digest.hexdigest()[:16]
+    finally:
+        conn.close()
+
+
+def _read_schema(
+    db_path: str, schema_reader: str = "native", sample_rows: int = 0, prune: bool = True
+) -> SchemaInfo:
+    if schema_reader == "legacy":
+        from app.agents.schema_reader import SQLDatabaseSchemaReader
+
+        reader = SQLDatabaseSchemaReader(db_path)
+        try:
+            return reader.read_schema()
+        finally:
+            reader.close()
+    conn = connect_readonly(db_path)
+    try:
+        return SchemaReaderAgent(conn, sample_rows=sample_rows, prune=prune).read_schema()
+    finally:
+        conn.close()
+
+
+async def _plan_groups(
+    settings: Settings,
+    schemas: dict[str, SchemaInfo],
+    month: str,
+    mode: str,
+    planner: str,
+    use_plan_cache: bool,
+    llm: Optional[BaseChatModel],
+    llm_policy: Optional[LLMCallPolicy],
+    refresh_plan: bool = False,
+) -> dict[str, Any]:
+    months = parse_months(month)
+    month_start, month_end = month_window(months)
+    groups = list(schemas)
+    plans = await asyncio.gather(
+        *(
+            aplan_query(
+                settings,
+                schema_info=schemas[group],
+                month_start=month_start,
+                month_end=month_end,
+                include_overrides="client_assignment_overrides" in schemas[group].table_names,
+                use_plan_cache=use_plan_cache,
+                refresh_plan=refresh_plan,
+                mode=mode,
+                metrics=RunMetrics(),
+                llm=llm,
+                llm_policy=llm_policy,
+                planner=planner,
+            )
+            for group in groups
+        ),
+        return_exceptions=True,
+    )
+    return dict(zip(groups, plans))
+
+
+def _reads_accumulators(
+    db_path: str, schema_info: SchemaInfo, planner: str, run_options: dict[str, Any]
+) -> bool:
+    conn = connect_readonly(db_path)
+    try:
+        return plan_accumulator_query(conn, schema_info, planner=planner, **run_options) is not None
+    finally:
+        conn.close()
+
+
+def _run_tenant(
+    month: str,
+    result: TenantResult,
+    settings: Settings,
+    schema_info: SchemaInfo,
+    plan_file: str,
+    mode: str,
+    planner: str,
+    run_options: dict[str, Any],
+) -> TenantResult:
+    started = time.perf_counter()
+    try:
+        # A tenant with billing accumulators reads them instead of the group's plan.
+        if _reads_accumulators(result.db_path, schema_info, planner, run_options):
+            tenant_plan_file = None
+        else:
+            tenant_plan_file = plan_file
+        run_result = run(
+            month,
+            mode=mode,
+            settings=settings,
+            schema_info=schema_info,
+            plan_file=tenant_plan_file,
+            planner=planner,
+            **run_options,
+        )
+        result.invoices_written = run_result.invoices_written
+        result.plan_source = run_result.plan_source
+    except Exception as exc:
+        result.error = f"{type(exc).__name__}: {exc}"
+    result.elapsed_s = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run_tenants(
+    month: str,
+    databases: Sequence[str],
+    tenant_workers: int = 4,
+    mode: str = ROWS_MODE,
+    planner: str = "auto",
+    use_plan_cache: bool = True,
+    refresh_plan: bool = False,
+    schema_reader: str = "native",
+    schema_sample_rows: int = 0,
+    prune_schema: bool = True,
+    llm: Optional[BaseChatModel] = None,
+    llm_policy: Optional[LLMCallPolicy] = None,
+    settings: Optional[Settings] = None,
+    **run_options: Any,
+) -> FanOutReport:
+    """Invoice ``month`` for every database in ``databases`` (paths or globs).
+
+    At most ``tenant_workers`` tenants run at once, each in its own process.
+    ``run_options`` are passed to ``app.invoice.run`` for every tenant. A
+    tenant that fails (or whose schema group could not be planned) is recorded
+    in the report and does not stop the others. Tenants with billing
+    accumulators installed read them (plan source "accumulator") unless
+    ``use_accumulators=False`` or another option rules them out, as in ``run``.
+    ``schema_reader``, ``schema_sample_rows`` and ``prune_schema`` apply when
+    each group's schema is read, and ``refresh_plan`` when it is planned.
+    """
+    started = time.perf_counter()
+    settings = settings or load_settings()
+    output_root = settings.output_dir
+    report = FanOutReport(month=month)
+    paths = resolve_databases(databases)
+    names = [tenant_name(path) for path in paths]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError("Tenant databases must have distinct file names: " + ", ".join(duplicates))
+
+    members: dict[str, list[TenantResult]] = {}
+    for name, path in zip(names, paths):
+        result = TenantResult(tenant=name, db_path=path, output_dir=os.path.join(output_root, name))
+        report.tenants.append(result)
+        try:
+            result.schema_group = _ddl_fingerprint(path)
+        except Exception as exc:
+            result.error = f"{type(exc).__name__}: {exc}"
+            continue
+        members.setdefault(result.schema_group, []).append(result)
+
+    schemas: dict[str, SchemaInfo] = {}
+    for group, results in members.items():
+        try:
+            schemas[group] = _read_schema(
+                results[0].db_path, schema_reader, schema_sample_rows, prune_schema
+            )
+        except Exception as exc:
+            report.plans[group] = {
+                "tenants": [result.tenant for result in results],
+                "error": f"{type(exc).__name__}: {exc}",
+            }
+    planned = asyncio.run(
+        _plan_groups(
+            settings,
+            schemas,
+            month,
+            mode,
+            planner,
+            use_plan_cache,
+            llm,
+            llm_policy,
+            refresh_plan=refresh_plan,
+        )
+    )
+
+    plan_dir = os.path.join(output_root, PLAN_DIR)
+    os.makedirs(plan_dir, exist_ok=True)
+    jobs: list[tuple[TenantResult, SchemaInfo, str]] = []
+    for group, outcome in planned.items():
+        tenants = [result.tenant for result in members[group]]
+        if isinstance(outcome, BaseException):
+            error = f"{type(outcome).__name__}: {outcome}"
+            report.plans[group] = {"tenants": tenants, "error": error}
+            for result in members[group]:
+                result.error = f"Planning failed: {error}"
+            continue
+        plan, plan_source = outcome
+        plan_file = os.path.join(plan_dir, f"{group}-{mode}.json")
+        write_plan_file(
+            plan_file, plan, schema_fingerprint(schemas[group].schema_text), mode, plan_source
+        )
+        report.plans[group] = {
+            "tenants": tenants,
+            "plan_source": plan_source,
+            "plan_file": plan_file,
+        }
+        jobs.extend((result, schemas[group], plan_file) for result in members[group])
+    for group, results in members.items():
+        if group not in schemas:
+            for result in results:
+                result.error = f"Schema read failed: {report.plans[group]['error']}"
+
+    finished: dict[str, TenantResult] = {}
+    if jobs:
+        with ProcessPoolExecutor(max_workers=max(1, min(tenant_workers, len(jobs)))) as pool:
+            futures = [
+                pool.submit(
+                    _run_tenant,
+                    month,
+                    result,
+                    replace(settings, db_path=result.db_path, output_dir=result.output_dir),
+                    schema_info,
+                    plan_file,
+                    mode,
+                    planner,
+                    run_options,
+                )
+                for result, schema_info, plan_file in jobs
+            ]
+            for future in futures:
+                done = future.result()
+                finished[done.tenant] = done
+    report.tenants = [finished.get(result.tenant, result) for result in report.tenants]
+    report.elapsed_s = time.perf_counter() - started
+
+    report.report_path = os.path.join(output_root, REPORT_NAME)
+    temp_path = f"{report.report_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as handle:
+        json.dump(report.to_dict(), handle, indent=2)
+    os.replace(temp_path, report.report_path)
+    return report
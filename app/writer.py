@@ -0,0 +1,260 @@
+"""Render and write invoice JSON/HTML files, serially or across a process pool."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.util import Finalize
+from typing import TYPE_CHECKING, Any, Iterable, Optional, TextIO
+
+from app.archive import ArchiveWriter
+from app.invoice_index import IndexEntry, InvoiceIndex
+from app.metrics import RunMetrics
+from app.models import Invoice
+
+if TYPE_CHECKING:
+    from jinja2 import Template
+
+    from app.details import DetailSource
+
+TEMPLATE_DIR = "app/templates"
+TEMPLATE_NAME = "invoice.html"
+
+DIRS_FORMAT = "dirs"
+ARCHIVE_FORMAT = "archive"
+
+_worker_template: Optional[Template] = None
+_worker_details: Optional[DetailSource] = None
+
+
+def load_template() -> Template:
+    """Load and compile the invoice HTML template."""
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=select_autoescape(["html"]),
+    )
+    return env.get_template(TEMPLATE_NAME)
+
+
+def template_fingerprint() -> str:
+    """Hash the template source so template edits invalidate incremental state."""
+    with open(os.path.join(TEMPLATE_DIR, TEMPLATE_NAME), "rb") as handle:
+        return hashlib.sha256(handle.read()).hexdigest()
+
+
+def invoice_dir(output_root: str, client_id: str, billing_month: str) -> str:
+    return os.path.join(output_root, client_id, billing_month)
+
+
+def remove_invoice(output_root: str, client_id: str, billing_month: str) -> None:
+    """Delete a previously written invoice and its month directory if it is left empty."""
+    output_dir = invoice_dir(output_root, client_id, billing_month)
+    for name in ("invoice.json", "invoice.html"):
+        path = os.path.join(output_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+    if os.path.isdir(output_dir) and not os.listdir(output_dir):
+        os.rmdir(output_dir)
+
+
+class _HashingWriter:
+    """Text file wrapper that hashes the UTF-8 bytes passing through it."""
+
+    def __init__(self, handle: TextIO) -> None:
+        self._handle = handle
+        self._digest = hashlib.sha256()
+
+    def write(self, text: str) -> int:
+        self._digest.update(text.encode("utf-8"))
+        return self._handle.write(text)
+
+    def writelines(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.write(line)
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+
+def write_invoice(
+    invoice: Invoice,
+    template: Template,
+    output_root: str,
+    details: Optional[DetailSource] = None,
+) -> IndexEntry:
+    """Write the invoice's JSON and HTML files and return their index entry.
+
+    The HTML is streamed to the file; with ``details`` the assignment appendix
+    rows are read from the database while it is written. Both files are
+    hashed as they are written.
+    """
+    output_dir = invoice_dir(output_root, invoice.client_id, invoice.billing_month)
+    os.makedirs(output_dir, exist_ok=True)
+
+    json_path = os.path.join(output_dir, "invoice.json")
+    with open(json_path, "w", encoding="utf-8") as handle:
+        json_out = _HashingWriter(handle)
+        json_out.write(invoice.model_dump_json(indent=2))
+
+    html_path = os.path.join(output_dir, "invoice.html")
+    with open(html_path, "w", encoding="utf-8") as handle:
+        html_out = _HashingWriter(handle)
+        context: dict[str, Any] = {"invoice": invoice}
+        if details is not None:
+            context["details"] = details.rows(invoice.client_id, invoice.billing_month)
+        template.stream(**context).dump(html_out)
+
+    return IndexEntry(
+        invoice_id=invoice.invoice_id,
+        client_id=invoice.client_id,
+        client_name=invoice.client_name,
+        billing_month=invoice.billing_month,
+        currency=invoice.currency,
+        total_credits=invoice.total_credits,
+        total_amount_usd=invoice.total_amount_usd,
+        line_items=len(invoice.line_items),
+        json_path=os.path.relpath(json_path, output_root),
+        html_path=os.path.relpath(html_path, output_root),
+        json_sha256=json_out.hexdigest(),
+        html_sha256=html_out.hexdigest(),
+        size_bytes=os.path.getsize(json_path) + os.path.getsize(html_path),
+        generated_at=invoice.generated_at,
+    )
+
+
+def render_invoice(invoice: Invoice, template: Template) -> tuple[str, str]:
+    """Return the compact JSON line and the HTML for one invoice."""
+    return invoice.model_dump_json(), template.render(invoice=invoice)
+
+
+def _init_worker(details: Optional[DetailSource] = None) -> None:
+    global _worker_template, _worker_details
+    _worker_template = load_template()
+    _worker_details = details
+    if details is not None:
+        # Pool workers exit through multiprocessing, which skips atexit hooks.
+        Finalize(details, details.close, exitpriority=0)
+
+
+def _write_in_worker(invoice: Invoice, output_root: str) -> IndexEntry:
+    assert _worker_template is not None
+    return write_invoice(invoice, _worker_template, output_root, _worker_details)
+
+
+def _render_in_worker(invoice: Invoice) -> tuple[str, str]:
+    assert _worker_template is not None
+    return render_invoice(invoice, _worker_template)
+
+
+def write_invoices(
+    invoices: Iterable[Invoice],
+    output_root: str,
+    workers: int = 1,
+    template: Optional[Template] = None,
+    metrics: Optional[RunMetrics] = None,
+    output_format: str = DIRS_FORMAT,
+    months: Iterable[str] = (),
+    details: Optional[DetailSource] = None,
+    index: Optional[InvoiceIndex] = None,
+) -> int:
+    """Write every invoice and return how many were written.
+
+    With ``workers > 1`` serialization, rendering and file I/O run in a process
+    pool whose workers compile the template once. At most ``workers * 4``
+    invoices are in flight so streamed input stays bounded. Time spent writing
+    (or waiting on workers) is recorded as the "write" stage.
+
+    ``output_format="archive"`` writes one archive per month (see
+    ``app.archive``) instead of a directory per client; ``months`` lists the
+    months whose archives are replaced even if they end up empty.
+
+    ``details`` adds the per-assignment appendix to each HTML file (per-directory
+    format only); pool workers open their own read-only connection for it.
+    ``index`` records and commits an entry as soon as each file pair is
+    written (per-directory format).
+    """
+    metrics = metrics or RunMetrics()
+    if details is not None and output_format != DIRS_FORMAT:
+        raise ValueError("Assignment detail appendices need the per-directory output format")
+    if output_format == ARCHIVE_FORMAT:
+        return _write_archives(invoices, output_root, workers, template, metrics, months)
+    if output_format != DIRS_FORMAT:
+        raise ValueError(f"Unknown output format: {output_format}")
+    written = 0
+
+    def finished(entry: IndexEntry) -> None:
+        nonlocal written
+        written += 1
+        metrics.incr("bytes_written", entry.size_bytes)
+        if index is not None:
+            index.record(entry)
+
+    if workers <= 1:
+        with metrics.stage("write"):
+            template = template or load_template()
+        for invoice in invoices:
+            with metrics.stage("write"):
+                finished(write_invoice(invoice, template, output_root, details))
+        return written
+
+    pending: deque[Future[IndexEntry]] = deque()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(details,)
+    ) as pool:
+        for invoice in invoices:
+            with metrics.stage("write"):
+                if len(pending) >= workers * 4:
+                    finished(pending.popleft().result())
+                pending.append(pool.submit(_write_in_worker, invoice, output_root))
+        with metrics.stage("write"):
+            while pending:
+                finished(pending.popleft().result())
+    return written
+
+
+def _write_archives(
+    invoices: Iterable[Invoice],
+    output_root: str,
+    workers: int,
+    template: Optional[Template],
+    metrics: RunMetrics,
+    months: Iterable[str],
+) -> int:
+    written = 0
+    archive = ArchiveWriter(output_root, months)
+
+    def finished(invoice: Invoice, rendered: tuple[str, str]) -> None:
+        nonlocal written
+        written += 1
+        metrics.incr("bytes_written", archive.add(invoice, *rendered))
+
+    try:
+        if workers <= 1:
+            with metrics.stage("write"):
+                template = template or load_template()
+            for invoice in invoices:
+                with metrics.stage("write"):
+                    finished(invoice, render_invoice(invoice, template))
+        else:
+            pending: deque[tuple[Invoice, Future[tuple[str, str]]]] = deque()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                for invoice in invoices:
+                    with metrics.stage("write"):
+                        if len(pending) >= workers * 4:
+                            done, future = pending.popleft()
+                            finished(done, future.result())
+                        pending.append((invoice, pool.submit(_render_in_worker, invoice)))
+                with metrics.stage("write"):
+                    while pending:
+                        done, future = pending.popleft()
+                        finished(done, future.result())
+        with metrics.stage("write"):
+            archive.commit()
+    except BaseException:
+        archive.abort()
+        raise
+    return written
@@ -0,0 +1,100 @@
+"""Compare invoice runs reading the assignments with runs reading the billing accumulators.
+
+Generate a large database first, then time both sources on a copy of it (the
+accumulators are installed into the copy, never into ``--db`` itself):
+
+    python scripts/generate_synthetic_data.py --assignments-per-month 2000000
+    python scripts/bench_accumulators.py --db data/synthetic.db --month 2025-11
+
+Aggregate-mode invoices from the assignments and from the accumulators must
+be identical; the script also checks the stored counts against the raw table.
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import replace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import accumulators  # noqa: E402
+from app.config import load_settings  # noqa: E402
+from app.db import connect, readonly_connection  # noqa: E402
+from app.invoice import run  # noqa: E402
+
+
+def load_invoices(root: str) -> dict[str, dict]:
+    invoices = {}
+    for path in glob.glob(os.path.join(root, "*", "*", "invoice.json")):
+        with open(path, encoding="utf-8") as handle:
+            invoice = json.load(handle)
+        invoice.pop("generated_at")
+        invoices[os.path.relpath(path, root)] = invoice
+    return invoices
+
+
+def timed_run(month: str, settings, output_dir: str, **options) -> tuple[float, int, str]:
+    started = time.perf_counter()
+    result = run(
+        month,
+        settings=replace(settings, output_dir=output_dir),
+        plan_guard="off",
+        **options,
+    )
+    rows = int(result.metrics.counters["rows_loaded"])
+    return time.perf_counter() - started, rows, result.plan_source
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default="data/synthetic.db")
+    parser.add_argument("--month", default="2025-11", help="YYYY-MM, a range or a list")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "bench.db")
+        shutil.copyfile(args.db, db_path)
+        settings = replace(load_settings(), db_path=db_path)
+
+        results = {
+            "rows (assignments)": timed_run(
+                args.month, settings, os.path.join(workdir, "rows"), use_accumulators=False
+            ),
+            "aggregate (assignments)": timed_run(
+                args.month,
+                settings,
+                os.path.join(workdir, "raw"),
+                mode="aggregate",
+                use_accumulators=False,
+            ),
+        }
+        conn = connect(db_path)
+        try:
+            started = time.perf_counter()
+            groups = accumulators.install(conn)
+            print(f"install: {groups} groups in {time.perf_counter() - started:.2f}s")
+        finally:
+            conn.close()
+        results["accumulators"] = timed_run(
+            args.month, settings, os.path.join(workdir, "acc"), mode="aggregate"
+        )
+
+        for name, (seconds, rows, source) in results.items():
+            print(f"{name:<24} {seconds:7.2f}s  {rows:>10} rows read  plan={source}")
+        with readonly_connection(db_path) as conn:
+            report = accumulators.check(conn)
+        same = load_invoices(os.path.join(workdir, "raw")) == load_invoices(
+            os.path.join(workdir, "acc")
+        )
+        print(f"counts match assignments: {report.ok}; invoices identical: {same}")
+        if not (report.ok and same):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
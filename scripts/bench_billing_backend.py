@@ -0,0 +1,111 @@
+"""Compare the per-row and NumPy billing backends on synthetic assignment rows.
+
+Both backends build invoices from the same fetched rows; the script checks
+that the invoices are identical and prints the grouping + pricing time:
+
+    python scripts/bench_billing_backend.py --rows 500000 --months 2
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.agents.invoice_builder import InvoiceBuilderAgent  # noqa: E402
+from app.invoice import _group_assignments  # noqa: E402
+from app.loader import load_assignments  # noqa: E402
+from app.models import AssignmentRow  # noqa: E402
+
+COLUMNS = ", ".join(AssignmentRow.model_fields)
+RATES = [0.5, 1.0, 1.25, 2.333, 3.005, 7.5]
+
+
+class FetchedRows:
+    """Cursor-like view of already fetched rows, so the fetch is not timed."""
+
+    def __init__(self, description: tuple, rows: list[sqlite3.Row]) -> None:
+        self.description = description
+        self._rows = rows
+        self._position = 0
+
+    def fetchmany(self, size: int) -> list[sqlite3.Row]:
+        batch = self._rows[self._position : self._position + size]
+        self._position += len(batch)
+        return batch
+
+
+def build_rows(rows: int, months: list[str], seed: int) -> tuple[list[str], list[sqlite3.Row]]:
+    rng = random.Random(seed)
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"CREATE TABLE result ({COLUMNS})")
+    conn.executemany(
+        "INSERT INTO result VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (
+                f"A{i:08d}",
+                f"C{(client := rng.randrange(2000)):04d}",
+                f"Client {client}",
+                "billing@example.com",
+                f"Type {(kind := rng.randrange(8))}",
+                f"{rng.choice(months)}-{rng.randint(1, 28):02d}",
+                "COMPLETED",
+                RATES[kind % len(RATES)],
+                10000,
+                "USD",
+                RATES[(client + kind) % len(RATES)] if client % 5 == 0 else None,
+                9500 if client % 7 == 0 else None,
+            )
+            for i in range(rows)
+        ),
+    )
+    cursor = conn.execute(f"SELECT {COLUMNS} FROM result ORDER BY completed_at")
+    columns = [column[0] for column in cursor.description]
+    return columns, cursor.fetchall()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--months", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    months = [f"2025-{month:02d}" for month in range(1, args.months + 1)]
+    columns, rows = build_rows(args.rows, months, args.seed)
+    description = tuple((name,) + (None,) * 6 for name in columns)
+    builder = InvoiceBuilderAgent()
+
+    started = time.perf_counter()
+    python_invoices = [
+        builder.build_invoice(client_rows, billing_month).invoice
+        for billing_month, client_rows in _group_assignments(
+            load_assignments(FetchedRows(description, rows)), months
+        )
+    ]
+    python_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    numpy_invoices = [
+        package.invoice for _, package in builder.build_vectorized(rows, columns, months)
+    ]
+    numpy_s = time.perf_counter() - started
+
+    def dumped(invoices):
+        return [invoice.model_dump(exclude={"generated_at"}) for invoice in invoices]
+
+    same = dumped(python_invoices) == dumped(numpy_invoices)
+    print(f"{len(rows):,} rows, {len(python_invoices):,} invoices")
+    print(f"python  {python_s:.3f}s")
+    print(f"numpy   {numpy_s:.3f}s  ({python_s / numpy_s:.1f}x)")
+    print("invoices identical" if same else "INVOICES DIFFER")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Compare rows/sec of Pydantic row validation against the fast assignment loader."""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.loader import load_assignments  # noqa: E402
+from app.models import AssignmentRow  # noqa: E402
+
+COLUMNS = ", ".join(AssignmentRow.model_fields)
+
+
+def build_db(rows: int) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"CREATE TABLE result ({COLUMNS})")
+    conn.executemany(
+        "INSERT INTO result VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (
+                f"A{i:08d}",
+                f"C{i % 500:04d}",
+                f"Client {i % 500}",
+                "billing@example.com",
+                f"Type {i % 7}",
+                "2025-11-15",
+                "COMPLETED",
+                1.5,
+                10000,
+                "USD",
+                2.0 if i % 3 == 0 else None,
+                None,
+            )
+            for i in range(rows)
+        ),
+    )
+    conn.commit()
+    return conn
+
+
+def time_it(label: str, rows: int, load) -> None:
+    started = time.perf_counter()
+    count = sum(1 for _ in load())
+    elapsed = time.perf_counter() - started
+    assert count == rows
+    print(f"{label:<28} {rows / elapsed:>12,.0f} rows/sec  ({elapsed:.3f}s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    conn = build_db(args.rows)
+    query = f"SELECT {COLUMNS} FROM result"
+
+    time_it(
+        "pydantic AssignmentRow",
+        args.rows,
+        lambda: (AssignmentRow(**dict(row)) for row in conn.execute(query).fetchall()),
+    )
+    time_it(
+        "fast loader",
+        args.rows,
+        lambda: load_assignments(conn.execute(query), batch_size=args.batch_size),
+    )
+    time_it(
+        "fast loader, 1% sampled",
+        args.rows,
+        lambda: load_assignments(
+            conn.execute(query), batch_size=args.batch_size, sample_rate=0.01
+        ),
+    )
+    time_it(
+        "fast loader, strict",
+        args.rows,
+        lambda: load_assignments(conn.execute(query), batch_size=args.batch_size, strict=True),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Time the main assignment query with default and tuned read-only SQLite connections.
+
+Generate a large database first, then compare the connection settings:
+
+    python scripts/generate_synthetic_data.py --assignments-per-month 10000000
+    python scripts/bench_sqlite_pragmas.py --db data/synthetic.db --month 2025-11
+
+Each variant runs the compiled query ``--repeat`` times on a fresh connection
+and reports the best and first (coldest) time. Drop the OS page cache between
+runs for truly cold numbers.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.agents import SchemaReaderAgent, SQLCompilerAgent  # noqa: E402
+from app.db import connect, connect_readonly  # noqa: E402
+from app.months import month_window, parse_months  # noqa: E402
+
+VARIANTS = {
+    "default": lambda db, args: connect(db),
+    "readonly": lambda db, args: connect_readonly(db, mmap_mb=0, cache_mb=2),
+    "readonly+tuned": lambda db, args: connect_readonly(
+        db, mmap_mb=args.mmap_mb, cache_mb=args.cache_mb
+    ),
+}
+
+
+def time_query(conn, sql: str, params: dict, batch_size: int) -> tuple[int, float]:
+    started = time.perf_counter()
+    cursor = conn.execute(sql, params)
+    rows = 0
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            break
+        rows += len(batch)
+    return rows, time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default="data/synthetic.db")
+    parser.add_argument("--month", default="2025-11", help="YYYY-MM, a range or a list")
+    parser.add_argument("--mode", choices=["rows", "aggregate"], default="rows")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--mmap-mb", type=int, default=256)
+    parser.add_argument("--cache-mb", type=int, default=64)
+    args = parser.parse_args()
+
+    months = parse_months(args.month)
+    month_start, month_end = month_window(months)
+    params = {"month_start": month_start, "month_end": month_end}
+    conn = connect_readonly(args.db)
+    try:
+        plan = SQLCompilerAgent().compile_query(SchemaReaderAgent(conn).read_schema(), args.mode)
+    finally:
+        conn.close()
+    if plan is None:
+        sys.exit("The database does not have the known billing schema")
+
+    for name, open_conn in VARIANTS.items():
+        timings = []
+        rows = 0
+        for _ in range(args.repeat):
+            conn = open_conn(args.db, args)
+            try:
+                rows, elapsed = time_query(conn, plan.sql, params, args.batch_size)
+            finally:
+                conn.close()
+            timings.append(elapsed)
+        print(
+            f"{name:<16} {rows:>10,} rows  first {timings[0]:.3f}s  best {min(timings):.3f}s"
+            f"  ({rows / min(timings):,.0f} rows/sec)"
+        )
+
+
+if __name__ == "__main__":
+    main()
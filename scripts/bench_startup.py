@@ -0,0 +1,92 @@
+"""Measure CLI import time with ``python -X importtime`` and enforce a startup budget.
+
+Exits non-zero when a module exceeds its budget or when an offline run path
+pulls in LangChain, OpenAI or SQLAlchemy, so it can gate CI or a cron host:
+
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --budget-ms 150 --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Modules imported by `python -m app` up to argument parsing, and by a run whose
+# plan comes from the compiler or the plan cache.
+TARGETS = ["app.cli", "app.invoice"]
+OFFLINE_IMPORTS = (
+    "import app.cli, app.invoice, app.plan_cache, app.agents.sql_compiler, "
+    "app.agents.schema_reader, app.agents.invoice_builder"
+)
+HEAVY_MODULES = ("langchain_core", "langchain_openai", "langchain_community", "openai", "sqlalchemy")
+
+
+def _import_time_us(module: str) -> int:
+    """Return the cumulative import time of ``module`` in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.strip() == module:
+            return int(cumulative)
+    raise RuntimeError(f"{module} not found in -X importtime output")
+
+
+def _heavy_modules_loaded() -> list[str]:
+    code = (
+        f"{OFFLINE_IMPORTS}\n"
+        "import sys\n"
+        f"print('\\n'.join(sorted(m for m in sys.modules if m.split('.')[0] in {HEAVY_MODULES!r})))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return [line for line in result.stdout.splitlines() if line]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check CLI startup import time")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=400.0,
+        help="Maximum median cumulative import time per target module (default: 400)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per target")
+    args = parser.parse_args()
+
+    failures = []
+    for module in TARGETS:
+        samples = [_import_time_us(module) / 1000 for _ in range(args.repeat)]
+        median = statistics.median(samples)
+        status = "ok" if median <= args.budget_ms else "OVER BUDGET"
+        print(f"{module:<12} {median:>8.1f} ms (budget {args.budget_ms:.0f} ms) {status}")
+        if median > args.budget_ms:
+            failures.append(f"{module} imports in {median:.1f} ms")
+
+    heavy = _heavy_modules_loaded()
+    if heavy:
+        roots = sorted({name.split(".")[0] for name in heavy})
+        print(f"Offline run path imports heavy packages: {', '.join(roots)}")
+        failures.append("heavy packages imported at startup")
+    else:
+        print("Offline run path imports no LangChain/OpenAI/SQLAlchemy modules")
+
+    if failures:
+        print("Startup budget failed: " + "; ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
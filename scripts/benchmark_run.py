@@ -0,0 +1,131 @@
+"""Time each stage of an invoice run against a database, with a stubbed LLM.
+
+The run goes through ``app.invoice.run`` with a fake chat model (the LLM
+planner answers with the compiled billing query) and no plan cache, so the
+stage timings are the ones a real run reports on ``RunResult.metrics``.
+Results are written as JSON (keyed by git commit) so runs can be compared:
+
+    python scripts/generate_synthetic_data.py --assignments-per-month 1000000
+    python scripts/benchmark_run.py --db data/synthetic.db --month 2025-11
+    python scripts/benchmark_run.py --db data/synthetic.db --month 2025-11 \\
+        --compare bench_results/<previous-commit>.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel  # noqa: E402
+
+from app.agents import SQLCompilerAgent  # noqa: E402
+from app.config import load_settings  # noqa: E402
+from app.invoice import run  # noqa: E402
+from app.months import parse_months  # noqa: E402
+from app.tenants import _read_schema  # noqa: E402
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark invoice run stages")
+    parser.add_argument("--db", default="data/synthetic.db")
+    parser.add_argument("--month", default="2025-11", help="YYYY-MM, a range or a list")
+    parser.add_argument("--mode", choices=["rows", "aggregate"], default="rows")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--results", help="JSON output path (default: bench_results/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    months = parse_months(args.month)
+    plan = SQLCompilerAgent().compile_query(_read_schema(args.db), args.mode)
+    if plan is None:
+        sys.exit(f"{args.db} does not have the billing schema")
+    stub = FakeListChatModel(responses=[json.dumps({"sql": plan.sql, "notes": "benchmark stub"})])
+
+    with tempfile.TemporaryDirectory() as output_root:
+        settings = replace(
+            load_settings(),
+            db_path=args.db,
+            output_dir=output_root,
+            plan_cache_path=os.path.join(output_root, "plan_cache.db"),
+        )
+        started = time.perf_counter()
+        result = run(
+            args.month,
+            mode=args.mode,
+            batch_size=args.batch_size,
+            use_plan_cache=False,
+            planner="llm",
+            llm=stub,
+            plan_guard="off",
+            use_accumulators=False,
+            settings=settings,
+        )
+        wall_s = time.perf_counter() - started
+
+    report = result.metrics.to_dict()
+    stages = report["stages"]
+    commit = _git_commit()
+    results = {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "db": os.path.abspath(args.db),
+        "months": months,
+        "mode": args.mode,
+        "rows": int(report["counters"].get("rows_loaded", 0)),
+        "invoices": result.invoices_written,
+        "stages": stages,
+        "concurrent_stages": report["concurrent_stages"],
+        "counters": report["counters"],
+        "total_wall_s": round(wall_s, 6),
+    }
+
+    results_path = args.results or os.path.join("bench_results", f"{commit}.json")
+    directory = os.path.dirname(results_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(results_path, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+
+    print(f"{results['rows']} rows -> {results['invoices']} invoices ({args.mode} mode)")
+    for name, timing in stages.items():
+        line = (
+            f"  {name:<14} {timing['wall_s']:>9.3f}s wall {timing['cpu_s']:>9.3f}s cpu"
+            f" {timing['calls']:>7} calls"
+        )
+        if baseline and name in baseline["stages"]:
+            before = baseline["stages"][name]["wall_s"]
+            if before:
+                line += f"   x{timing['wall_s'] / before:.2f} vs {baseline['commit']}"
+        print(line)
+    print(f"  {'total':<14} {results['total_wall_s']:>9.3f}s wall")
+    for name, timing in report["concurrent_stages"].items():
+        print(
+            f"  {name:<14} {timing['wall_s']:>9.3f}s wall {timing['cpu_s']:>9.3f}s cpu"
+            "   (concurrent with plan)"
+        )
+    print(f"Results written to {results_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Check integer fixed-point billing against the Decimal ROUND_HALF_UP reference.
+
+Draws random rates (floats with up to six decimals, as stored in SQLite),
+credit values and quantities, and compares line credits, line amounts and
+invoice totals with the original ``Decimal(str(float))`` computation:
+
+    python scripts/check_fixed_point.py --cases 200000 --seed 7
+"""
+
+import argparse
+import os
+import random
+import sys
+from decimal import ROUND_HALF_UP, Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.fixed_point import (  # noqa: E402
+    credits_to_float,
+    line_amount,
+    line_credits_hundredths,
+)
+
+CENT = Decimal("0.01")
+
+
+def reference_line(credits: float, quantity: int, unit_value: int) -> tuple[Decimal, Decimal]:
+    line_credits = (Decimal(str(credits)) * quantity).quantize(CENT, rounding=ROUND_HALF_UP)
+    amount = (line_credits * Decimal(unit_value)).quantize(Decimal("1"), rounding=ROUND_HALF_UP)
+    return line_credits, amount
+
+
+def random_rate(rng: random.Random) -> float:
+    decimals = rng.randint(0, 6)
+    value = round(rng.uniform(0, 50), decimals)
+    # Exact ties at the rounding boundary are the interesting cases.
+    if rng.random() < 0.2:
+        value = rng.randint(0, 5000) / 1000 + 0.005
+    return value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare fixed-point and Decimal billing")
+    parser.add_argument("--cases", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    mismatches = 0
+    for case in range(args.cases):
+        lines = []
+        for _ in range(rng.randint(1, 8)):
+            credits = random_rate(rng)
+            quantity = rng.choice([rng.randint(0, 10), rng.randint(0, 100_000)])
+            unit_value = rng.choice([0, 1, 99, 8000, 9500, 10000, 12000, rng.randint(0, 50_000)])
+            lines.append((credits, quantity, unit_value))
+
+        expected_credits = Decimal(0)
+        expected_amount = Decimal(0)
+        total_hundredths = 0
+        total_amount = 0
+        for credits, quantity, unit_value in lines:
+            ref_credits, ref_amount = reference_line(credits, quantity, unit_value)
+            hundredths = line_credits_hundredths(credits, quantity)
+            amount = line_amount(hundredths, unit_value)
+            if credits_to_float(hundredths) != float(ref_credits) or amount != int(ref_amount):
+                mismatches += 1
+                print(
+                    f"case {case}: credits={credits!r} quantity={quantity} unit={unit_value}: "
+                    f"fixed=({hundredths}, {amount}) decimal=({ref_credits}, {ref_amount})"
+                )
+            expected_credits += ref_credits
+            expected_amount += ref_amount
+            total_hundredths += hundredths
+            total_amount += amount
+
+        expected_total = expected_credits.quantize(CENT, rounding=ROUND_HALF_UP)
+        if credits_to_float(total_hundredths) != float(expected_total) or total_amount != int(
+            expected_amount
+        ):
+            mismatches += 1
+            print(f"case {case}: totals differ for {lines!r}")
+
+    print(f"{args.cases} invoices checked, {mismatches} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
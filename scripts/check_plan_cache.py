@@ -0,0 +1,94 @@
+"""Check that plans for different schemas do not evict each other from the plan cache.
+
+Builds two small databases whose DDL differs (as two tenant schema groups
+would), plans both through ``app.tenants._plan_groups`` with a fake chat model
+and an empty cache, then plans them again: the second round must be served
+from the cache for both groups, without another LLM call:
+
+    python scripts/check_plan_cache.py
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from dataclasses import replace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel  # noqa: E402
+
+from app.agents import SQLCompilerAgent  # noqa: E402
+from app.config import load_settings  # noqa: E402
+from app.plan_cache import schema_fingerprint  # noqa: E402
+from app.tenants import _plan_groups, _read_schema  # noqa: E402
+
+
+def make_database(path: str, lookup_table: str) -> None:
+    subprocess.run(
+        [
+            sys.executable,
+            os.path.join(os.path.dirname(__file__), "generate_synthetic_data.py"),
+            "--db",
+            path,
+            "--clients",
+            "5",
+            "--assignments-per-month",
+            "50",
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    conn = sqlite3.connect(path)
+    # A table referenced from clients survives schema pruning, so the groups'
+    # planning prompts (and cache keys) differ.
+    conn.execute(f"CREATE TABLE {lookup_table} (id INTEGER PRIMARY KEY, label TEXT)")
+    conn.execute(
+        f"ALTER TABLE clients ADD COLUMN {lookup_table}_id INTEGER REFERENCES {lookup_table}(id)"
+    )
+    conn.close()
+
+
+def main() -> None:
+    failures = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        schemas = {}
+        for group, lookup_table in (("a", "regions"), ("b", "segments")):
+            path = os.path.join(workdir, f"{group}.db")
+            make_database(path, lookup_table)
+            schemas[group] = _read_schema(path)
+        settings = replace(
+            load_settings(), plan_cache_path=os.path.join(workdir, "plan_cache.db")
+        )
+        compiled = SQLCompilerAgent().compile_query(schemas["a"])
+        assert compiled is not None
+        answer = json.dumps({"sql": compiled.sql, "notes": "fake"})
+        llm = FakeListChatModel(responses=[answer])
+
+        for round_number, expected in ((1, "llm"), (2, "cache")):
+            planned = asyncio.run(
+                _plan_groups(settings, schemas, "2025-11", "rows", "llm", True, llm, None)
+            )
+            for group, outcome in sorted(planned.items()):
+                if isinstance(outcome, BaseException):
+                    print(f"FAIL: round {round_number}, group {group}: {outcome!r}")
+                    failures += 1
+                    continue
+                source = outcome[1]
+                status = "ok" if source == expected else "FAIL"
+                print(f"{status}: round {round_number}, group {group}: plan from {source}")
+                failures += source != expected
+        keys = {schema_fingerprint(schema.schema_text) for schema in schemas.values()}
+        if len(keys) != len(schemas):
+            print("FAIL: the test schemas share a fingerprint")
+            failures += 1
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
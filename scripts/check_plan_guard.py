@@ -0,0 +1,73 @@
+"""Check that ``--create-indexes --plan-guard reject`` accepts a database without indexes.
+
+Generates a small synthetic database without the recommended indexes, makes
+sure the guard rejects it as is, then runs with ``create_indexes=True`` and
+``plan_guard="reject"``: the run must see the new index and pass on the
+first attempt:
+
+    python scripts/check_plan_guard.py
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from dataclasses import replace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.config import load_settings  # noqa: E402
+from app.invoice import run  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check index creation before the plan guard")
+    parser.add_argument("--assignments", type=int, default=20_000)
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "guard.db")
+        subprocess.run(
+            [
+                sys.executable,
+                os.path.join(os.path.dirname(__file__), "generate_synthetic_data.py"),
+                "--db",
+                db_path,
+                "--clients",
+                "50",
+                "--assignments-per-month",
+                str(args.assignments),
+                "--no-indexes",
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        settings = replace(
+            load_settings(),
+            db_path=db_path,
+            output_dir=os.path.join(workdir, "invoices"),
+            plan_cache_path=os.path.join(workdir, "plan_cache.db"),
+        )
+
+        try:
+            run("2025-11", settings=settings, plan_guard="reject")
+            print("FAIL: the guard accepted a full scan without the index")
+            failures += 1
+        except ValueError as exc:
+            print(f"ok: rejected without indexes ({exc})")
+
+        try:
+            result = run("2025-11", settings=settings, plan_guard="reject", create_indexes=True)
+            print(f"ok: created the index and passed the guard ({result.invoices_written} invoices)")
+        except ValueError as exc:
+            print(f"FAIL: rejected after creating the index ({exc})")
+            failures += 1
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
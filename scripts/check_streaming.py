@@ -0,0 +1,113 @@
+"""Check that streamed runs write the same invoices as buffered runs.
+
+Generates a small synthetic database, runs each month window once buffered
+and once with ``stream=True`` per batch size (tiny batches split clients
+across ``fetchmany`` calls), and compares every ``invoice.json`` and
+``invoice.html`` with ``generated_at`` ignored:
+
+    python scripts/check_streaming.py --assignments 5000 --batch-sizes 1,7,1000
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from dataclasses import replace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.config import load_settings  # noqa: E402
+from app.invoice import run  # noqa: E402
+
+
+def load_outputs(root: str) -> dict[str, str]:
+    """Map each invoice file under ``root`` to its text, without ``generated_at``."""
+    outputs = {}
+    for json_path in glob.glob(os.path.join(root, "*", "*", "invoice.json")):
+        with open(json_path, encoding="utf-8") as handle:
+            invoice = json.load(handle)
+        generated_at = invoice.pop("generated_at")
+        outputs[os.path.relpath(json_path, root)] = json.dumps(invoice, sort_keys=True)
+        html_path = os.path.join(os.path.dirname(json_path), "invoice.html")
+        with open(html_path, encoding="utf-8") as handle:
+            outputs[os.path.relpath(html_path, root)] = handle.read().replace(generated_at, "")
+    return outputs
+
+
+def compare(label: str, expected: dict[str, str], actual: dict[str, str]) -> int:
+    differing = sorted(
+        path for path in expected.keys() | actual.keys() if expected.get(path) != actual.get(path)
+    )
+    for path in differing[:10]:
+        state = "missing" if path not in actual else "extra" if path not in expected else "differs"
+        print(f"FAIL: {label}: {path} {state}")
+    if not differing:
+        print(f"ok: {label}: {len(expected)} files identical")
+    return len(differing)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare streamed and buffered invoice runs")
+    parser.add_argument("--clients", type=int, default=40)
+    parser.add_argument("--assignments", type=int, default=5000, help="Assignments per month")
+    parser.add_argument("--batch-sizes", default="1,7,1000", help="Comma-separated batch sizes")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "stream.db")
+        subprocess.run(
+            [
+                sys.executable,
+                os.path.join(os.path.dirname(__file__), "generate_synthetic_data.py"),
+                "--db",
+                db_path,
+                "--clients",
+                str(args.clients),
+                "--assignments-per-month",
+                str(args.assignments),
+                "--months",
+                "2025-09..2025-11",
+                "--seed",
+                str(args.seed),
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        settings = replace(
+            load_settings(),
+            db_path=db_path,
+            plan_cache_path=os.path.join(workdir, "plan_cache.db"),
+        )
+
+        for month in ("2025-11", "2025-09..2025-11"):
+            buffered_dir = os.path.join(workdir, f"buffered-{month}")
+            run(month, settings=replace(settings, output_dir=buffered_dir), plan_guard="off")
+            expected = load_outputs(buffered_dir)
+            if not expected:
+                print(f"FAIL: {month}: the buffered run wrote no invoices")
+                failures += 1
+                continue
+            for batch_size in batch_sizes:
+                streamed_dir = os.path.join(workdir, f"stream-{batch_size}-{month}")
+                run(
+                    month,
+                    settings=replace(settings, output_dir=streamed_dir),
+                    stream=True,
+                    batch_size=batch_size,
+                    plan_guard="off",
+                )
+                label = f"{month}, batch size {batch_size}"
+                failures += compare(label, expected, load_outputs(streamed_dir))
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Generate a large synthetic invoice database for benchmarking."""
+
+import argparse
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime
+
+SCHEMA = """
+DROP TABLE IF EXISTS clients;
+DROP TABLE IF EXISTS assignment_types;
+DROP TABLE IF EXISTS assignments;
+DROP TABLE IF EXISTS client_assignment_overrides;
+
+CREATE TABLE clients (
+    client_id TEXT PRIMARY KEY,
+    client_name TEXT,
+    billing_email TEXT,
+    default_credit_value_usd INTEGER,
+    currency TEXT
+);
+
+CREATE TABLE assignment_types (
+    assignment_type TEXT PRIMARY KEY,
+    default_credits REAL
+);
+
+CREATE TABLE assignments (
+    assignment_id TEXT PRIMARY KEY,
+    client_id TEXT,
+    assignment_type TEXT,
+    completed_at TEXT,
+    status TEXT,
+    FOREIGN KEY (client_id) REFERENCES clients(client_id),
+    FOREIGN KEY (assignment_type) REFERENCES assignment_types(assignment_type)
+);
+
+CREATE TABLE client_assignment_overrides (
+    client_id TEXT,
+    assignment_type TEXT,
+    credits_override REAL,
+    credit_value_override_usd INTEGER,
+    PRIMARY KEY (client_id, assignment_type),
+    FOREIGN KEY (client_id) REFERENCES clients(client_id),
+    FOREIGN KEY (assignment_type) REFERENCES assignment_types(assignment_type)
+);
+"""
+
+INDEXES = """
+CREATE INDEX idx_assignments_status_completed_client
+    ON assignments(status, completed_at, client_id);
+"""
+
+
+def _month_list(spec: str) -> list[tuple[int, int]]:
+    first, _, last = spec.partition("..")
+    start = datetime.strptime(first, "%Y-%m")
+    end = datetime.strptime(last or first, "%Y-%m")
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def _insert_in_batches(conn: sqlite3.Connection, sql: str, rows, batch_size: int) -> int:
+    inserted = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            with conn:
+                conn.executemany(sql, batch)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        with conn:
+            conn.executemany(sql, batch)
+        inserted += len(batch)
+    return inserted
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default="data/synthetic.db")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--assignment-types", type=int, default=10)
+    parser.add_argument(
+        "--override-density",
+        type=float,
+        default=0.2,
+        help="Share of client/type pairs with an override row (0-1)",
+    )
+    parser.add_argument("--assignments-per-month", type=int, default=100_000)
+    parser.add_argument("--months", default="2025-11", help="YYYY-MM or YYYY-MM..YYYY-MM")
+    parser.add_argument(
+        "--completed-ratio",
+        type=float,
+        default=0.9,
+        help="Share of assignments with status COMPLETED (0-1)",
+    )
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--no-indexes", action="store_true", help="Skip the recommended indexes")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    directory = os.path.dirname(args.db)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if os.path.exists(args.db):
+        os.remove(args.db)
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(args.db)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executescript(SCHEMA)
+
+    client_ids = [f"C{i:06d}" for i in range(1, args.clients + 1)]
+    type_names = [f"Assignment Type {i:03d}" for i in range(1, args.assignment_types + 1)]
+
+    with conn:
+        conn.executemany(
+            "INSERT INTO clients VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    client_id,
+                    f"Client {client_id}",
+                    f"billing+{client_id.lower()}@example.com",
+                    rng.choice([8000, 9500, 10000, 12000, 15000]),
+                    "USD",
+                )
+                for client_id in client_ids
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO assignment_types VALUES (?, ?)",
+            ((name, rng.choice([0.5, 1.0, 1.25, 2.0, 3.0, 4.5])) for name in type_names),
+        )
+
+    overrides = _insert_in_batches(
+        conn,
+        "INSERT INTO client_assignment_overrides VALUES (?, ?, ?, ?)",
+        (
+            (
+                client_id,
+                type_name,
+                rng.choice([0.25, 0.75, 1.5, 1.75, 2.5, 3.333]),
+                rng.choice([None, 9000, 11000]),
+            )
+            for client_id in client_ids
+            for type_name in type_names
+            if rng.random() < args.override_density
+        ),
+        args.batch_size,
+    )
+
+    def assignments():
+        sequence = 0
+        for year, month in _month_list(args.months):
+            for _ in range(args.assignments_per_month):
+                sequence += 1
+                day = rng.randint(1, 28)
+                status = "COMPLETED" if rng.random() < args.completed_ratio else "IN_PROGRESS"
+                yield (
+                    f"A{sequence:010d}",
+                    rng.choice(client_ids),
+                    rng.choice(type_names),
+                    f"{year:04d}-{month:02d}-{day:02d}",
+                    status,
+                )
+
+    inserted = _insert_in_batches(
+        conn,
+        "INSERT INTO assignments VALUES (?, ?, ?, ?, ?)",
+        assignments(),
+        args.batch_size,
+    )
+
+    if not args.no_indexes:
+        conn.executescript(INDEXES)
+    conn.execute("ANALYZE")
+    conn.close()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Generated {args.db}: {len(client_ids)} clients, {len(type_names)} types, "
+        f"{overrides} overrides, {inserted} assignments in {elapsed:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
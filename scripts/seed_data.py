@@ -39,6 +39,9 @@ def main() -> None:
             FOREIGN KEY (assignment_type) REFERENCES assignment_types(assignment_type)
         );
 
+        CREATE INDEX idx_assignments_status_completed_client
+            ON assignments(status, completed_at, client_id);
+
         CREATE TABLE client_assignment_overrides (
             client_id TEXT,
             assignment_type TEXT,
@@ -0,0 +1,33 @@
+"""Run the check scripts under pytest, with small inputs so the suite stays quick.
+
+Each script exits non-zero on a failed check; the scripts stay the place to
+run the same checks at full size (see "Benchmarks" in the README).
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CHECKS = {
+    "fixed_point": ["check_fixed_point.py", "--cases", "5000"],
+    "streaming": ["check_streaming.py", "--clients", "12", "--assignments", "600"],
+    "startup_budget": ["bench_startup.py", "--repeat", "1"],
+    "plan_cache": ["check_plan_cache.py"],
+    "plan_guard": ["check_plan_guard.py"],
+}
+
+
+@pytest.mark.parametrize("script", list(CHECKS.values()), ids=list(CHECKS))
+def test_check_script(script: list[str]) -> None:
+    # The scripts resolve app/templates relative to the working directory.
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "scripts", script[0]), *script[1:]],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr